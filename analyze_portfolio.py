@@ -1,25 +1,288 @@
 import pandas as pd
+import numpy as np
 import json
 import os
-import plotly.graph_objects as go
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from functions import get_price_for_date
+from functions import get_price_for_date, load_config, read_last_tracker_date, read_tracker_since, write_tracker_rows
+from ledger import load_ledger, price_per_unit
+import attribution
+import holdings
+import lots
+import portfolio_stats
+import shards
+import xirr
+from shared_files import ANALYSIS_LOCK, locked, write_csv, write_json
 
-def parse_currency(value):
-    if pd.isna(value) or value == '':
-        return 0.0
-    if isinstance(value, str):
-        clean = value.replace('$', '').replace(',', '').strip()
-        return float(clean) if clean else 0.0
-    return float(value)
+TRACKER_FILE = "daily_tracker.csv"
+TRACKER_COLUMNS = ['Date', 'Total Value', 'Cost Basis', 'Items Owned']
+PNL_COLUMNS = ['Date', 'Realized P&L', 'Unrealized P&L', 'Open Cost']
 
-def run_analysis(resume_date=None):
+def generate_graphs(results_df):
+    """
+    Render the value and performance-ratio graphs to HTML.
+    plotly is imported here rather than at module level so that callers which
+    never draw a chart (the web app, summary readers) don't pay for loading it.
+    Returns the paths of the two written files.
+    """
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+
+    # Value Area
+    fig.add_trace(go.Scatter(
+        x=results_df['Date'], 
+        y=results_df['Total Value'],
+        mode='lines',
+        name='Portfolio Value',
+        line=dict(color='#00C851', width=3),
+        stackgroup='one' # Creates a filled area
+    ))
+
+    # Cost Basis Line
+    fig.add_trace(go.Scatter(
+        x=results_df['Date'], 
+        y=results_df['Cost Basis'],
+        mode='lines',
+        name='Net Investment (Cost Basis)',
+        line=dict(color='#ff4444', width=2, dash='dash')
+    ))
+
+    fig.update_layout(
+        title='Pokemon Investment Tracker',
+        xaxis_title='Date',
+        yaxis_title='Value ($)',
+        hovermode="x unified",
+        template="plotly_dark",
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+
+    output_html = "portfolio_graph.html"
+    fig.write_html(output_html)
+
+    # --- Performance Ratio Graph ---
+    fig_ratio = go.Figure()
+
+    # Calculate ratio safely. 
+    # If Cost Basis <= 0 (Free roll or Profitable), ratio is mathematically tricky.
+    # We will handle 0 avoid errors, but negative basis will yield negative ratios which indicate "House Money" status visually.
+    value = results_df['Total Value'].to_numpy(dtype=float)
+    cost = results_df['Cost Basis'].to_numpy(dtype=float)
+    usable = np.abs(cost) > 0.01
+    results_df['Performance Ratio'] = np.where(usable, value / np.where(usable, cost, 1.0), 0.0)
+
+    fig_ratio.add_trace(go.Scatter(
+        x=results_df['Date'], 
+        y=results_df['Performance Ratio'],
+        mode='lines',
+        name='Value / Net Investment',
+        line=dict(color='#33b5e5', width=3)
+    ))
+
+    # Add a reference line at 1.0 (Break Even)
+    fig_ratio.add_shape(
+        type="line",
+        x0=results_df['Date'].min(),
+        y0=1,
+        x1=results_df['Date'].max(),
+        y1=1,
+        line=dict(color="white", width=2, dash="dot"),
+    )
+
+    fig_ratio.update_layout(
+        title='Portfolio Performance (Value / Net Investment)',
+        xaxis_title='Date',
+        yaxis_title='Ratio (>1 = Profit)',
+        hovermode="x unified",
+        template="plotly_dark",
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+
+    ratio_html = "performance_graph.html"
+    fig_ratio.write_html(ratio_html)
+
+    return output_html, ratio_html
+
+SUMMARY_VERSION = 2
+# Upper bound on points per rollup so summary.json stays a small fetch for the widget
+MAX_ROLLUP_POINTS = 120
+
+def _rollup_points(df, freq=None, max_points=MAX_ROLLUP_POINTS):
+    """
+    [[date, value, cost], ...] for the tracker rows in df, keeping the last row of
+    each period when freq ('W' or 'M') is given. Points are labelled with the
+    actual date of that row, so a partial current period ends on the latest day.
+    """
+    if freq:
+        df = df.groupby(df['Date'].dt.to_period(freq)).tail(1)
+    df = df.tail(max_points)
+    return [
+        [d.strftime('%Y-%m-%d'), round(float(v), 2), round(float(c), 2)]
+        for d, v, c in zip(df['Date'], df['Total Value'], df['Cost Basis'])
+    ]
+
+def _period_return(df, start_date):
+    """
+    Modified Dietz return from the last row on/before start_date to the latest row.
+    Net money put in or taken out over the period (change in Cost Basis) is treated
+    as arriving mid-period, so buying more isn't counted as a gain.
+    """
+    before = df[df['Date'] <= start_date]
+    if before.empty:
+        return None
+    start, end = before.iloc[-1], df.iloc[-1]
+    flows = end['Cost Basis'] - start['Cost Basis']
+    denominator = start['Total Value'] + flows / 2
+    if abs(denominator) < 0.01:
+        return None
+    return round(float((end['Total Value'] - start['Total Value'] - flows) / denominator * 100), 2)
+
+def _merge_monthly(earlier_monthly, df):
+    points = _rollup_points(df, 'M')
+    if earlier_monthly:
+        first_month = df['Date'].iloc[0].strftime('%Y-%m')
+        points = [p for p in earlier_monthly if p[0][:7] < first_month] + points
+    return points[-MAX_ROLLUP_POINTS:]
+
+def summary_window_start(last_date, resume_dt):
+    """
+    First tracker date build_summary needs to see: a year back (and the day before
+    January 1st for YTD), or resume_dt if earlier, since rows from there on changed.
+    """
+    year_back = last_date - timedelta(days=365)
+    ytd_base = pd.Timestamp(year=last_date.year, month=1, day=1) - timedelta(days=1)
+    return min(year_back, ytd_base, resume_dt)
+
+def tracker_frame(rows):
+    """DataFrame of tracker rows read back as strings (read_tracker_since / read_tracker_tail)."""
+    df = pd.DataFrame(rows, columns=TRACKER_COLUMNS)
+    df['Date'] = pd.to_datetime(df['Date'])
+    for col in TRACKER_COLUMNS[1:]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['Items Owned'] = df['Items Owned'].fillna(0)
+    return df
+
+def _has_columns(path, columns):
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r') as f:
+        return f.readline().rstrip('\r\n') == ','.join(columns)
+
+def build_summary(results_df, earlier_monthly=None):
+    """
+    The summary.json payload: latest totals, the 14-day history older widgets use,
+    and precomputed rollups (7 days daily, 90 days weekly, all-time monthly) plus
+    period returns, so any timeframe renders from this one small file.
+
+    results_df may be just the tail of the tracker (see summary_window_start); the
+    monthly points for the months before it then come from earlier_monthly, the
+    'all' rollup of the previous summary.json.
+    """
+    summary_data = {
+        "version": SUMMARY_VERSION,
+        "total_value": 0,
+        "total_cost": 0,
+        "profit": 0,
+        "items_owned": 0,
+        "date": datetime.now().strftime('%Y-%m-%d'),
+        "history": [],
+        "rollups": {},
+        "returns": {}
+    }
+    
+    if results_df.empty:
+        return summary_data
+
+    df = results_df.copy()
+    df['Date'] = pd.to_datetime(df['Date'])
+
+    last_row = df.iloc[-1]
+    summary_data["total_value"] = float(last_row['Total Value'])
+    summary_data["total_cost"] = float(last_row['Cost Basis'])
+    summary_data["profit"] = summary_data["total_value"] - summary_data["total_cost"]
+    summary_data["items_owned"] = int(last_row['Items Owned']) if pd.notna(last_row['Items Owned']) else 0
+    summary_data["date"] = last_row['Date'].strftime('%Y-%m-%d')
+    
+    # Extract last 14 days for graph
+    history_df = df.tail(14)
+    summary_data["history"] = [
+        {'Date': d.strftime('%Y-%m-%d'), 'Total Value': float(v)}
+        for d, v in zip(history_df['Date'], history_df['Total Value'])
+    ]
+
+    last_date = last_row['Date']
+    summary_data["rollups"] = {
+        "7d": {"resolution": "daily", "points": _rollup_points(df[df['Date'] > last_date - timedelta(days=7)])},
+        "90d": {"resolution": "weekly", "points": _rollup_points(df[df['Date'] > last_date - timedelta(days=90)], 'W')},
+        "all": {"resolution": "monthly", "points": _merge_monthly(earlier_monthly, df)},
+    }
+
+    periods = {
+        "1d": last_date - timedelta(days=1),
+        "7d": last_date - timedelta(days=7),
+        "30d": last_date - timedelta(days=30),
+        "90d": last_date - timedelta(days=90),
+        "1y": last_date - timedelta(days=365),
+        "ytd": pd.Timestamp(year=last_date.year, month=1, day=1) - timedelta(days=1),
+    }
+    summary_data["returns"] = {label: _period_return(df, start) for label, start in periods.items()}
+    # All-time: everything put in versus what it's worth now
+    summary_data["returns"]["all"] = round(summary_data["profit"] / summary_data["total_cost"] * 100, 2) \
+        if abs(summary_data["total_cost"]) > 0.01 else None
+
+    return summary_data
+
+def update_portfolio_stats(resume_dt):
+    """
+    Feed tracker rows from resume_dt onwards (or from the day after the stats file
+    ends, if that is earlier) into portfolio_stats.csv.
+    """
+    stats_from = None
+    if os.path.exists(portfolio_stats.STATS_FILE):
+        try:
+            last_stats = read_last_tracker_date(portfolio_stats.STATS_FILE)
+            if last_stats is not None:
+                stats_from = min(resume_dt, pd.Timestamp(last_stats) + timedelta(days=1))
+        except Exception as e:
+            print(f"  ⚠️  Warning: Could not read {portfolio_stats.STATS_FILE} ({e}). Rebuilding it.")
+            os.remove(portfolio_stats.STATS_FILE)
+
+    # No usable stats yet: start from the first tracker row
+    new_rows = read_tracker_since(TRACKER_FILE, stats_from.strftime('%Y-%m-%d') if stats_from is not None else '0000-00-00')
+    summary = portfolio_stats.update_stats((r['Date'], r['Total Value'], r['Cost Basis']) for r in new_rows)
+    if summary:
+        print(f"Portfolio stats updated ({len(new_rows)} day(s)): TWR {summary['time_weighted_return']}%, max drawdown {summary['max_drawdown']}%")
+
+def load_summary(path="summary.json"):
+    """The previous summary.json if it is in the current format, else None."""
+    try:
+        with open(path, 'r') as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if summary.get('version') != SUMMARY_VERSION or 'all' not in summary.get('rollups', {}):
+        return None
+    return summary
+
+def run_analysis(resume_date=None, workers=None):
+    """
+    Re-value the portfolio from resume_date (None = the whole history) and rewrite
+    the outputs. Days are valued in date shards over up to `workers` processes
+    (default: CPU count; see shards.py); the output doesn't depend on it. Callers
+    running threads (the web app, tracker_daemon.py) pass workers=1, since the pool
+    is forked.
+    """
+    # One rebuild at a time across the web app and the daily job; readers don't wait
+    # for it, every output is replaced atomically (see shared_files.py)
+    with locked(ANALYSIS_LOCK):
+        return _run_analysis(resume_date, workers)
+
+def _run_analysis(resume_date=None, workers=None):
     print("--- Starting Portfolio Analysis ---")
     if resume_date:
         print(f"Resuming analysis from {resume_date}...")
     
-    with open("data.json") as f:
-        config = json.load(f)
+    config = load_config(reload=True)
 
     START_DATE = config.get("start_date")
     TARGET_DATE = config.get("latest_date")
@@ -41,30 +304,22 @@ def run_analysis(resume_date=None):
 
     # 1. Load and Prepare Transactions
     print("Loading transactions...")
-    try:
-        df = pd.read_csv(TRANSACTIONS_FILE)
-    except FileNotFoundError:
+    if not os.path.exists(TRANSACTIONS_FILE):
         print(f"Error: {TRANSACTIONS_FILE} not found.")
         return
 
-    df['Date Recieved'] = pd.to_datetime(df['Date Recieved'])
-    
-    # Handle missing Quantity: Default to 1.0 so "OPEN" rows without quantity still work
-    if df['Quantity'].isna().any():
-        num_missing = df['Quantity'].isna().sum()
-        print(f"  - Note: {num_missing} transaction(s) missing 'Quantity'. Defaulting them to 1.0.")
-        df['Quantity'] = df['Quantity'].fillna(1.0)
-
-    df['Price Per Unit'] = df['Price Per Unit'].apply(parse_currency)
-    df['Total Transaction Value'] = df['Price Per Unit'] * df['Quantity']
+    # Shared parse with the price update step (see ledger.py)
+    ledger = load_ledger(TRANSACTIONS_FILE)
+    tx_values = price_per_unit(ledger) * ledger['quantity']
 
-    # 2. Initialize Loop
+    # 2. Date range
     current_date = pd.to_datetime(START_DATE)
     end_date = pd.to_datetime(TARGET_DATE)
     if end_date > datetime.now(): 
         end_date = datetime.now() # Don't graph the future
 
     daily_records = []
+    pnl_records = []
     
     # NEW: Handle resume logic
     if resume_date:
@@ -72,207 +327,141 @@ def run_analysis(resume_date=None):
     else:
          resume_dt = current_date
          
-    if resume_dt > current_date and os.path.exists("daily_tracker.csv"):
-        try:
-            print("Loading existing daily_tracker.csv for incremental update...")
-            existing_df = pd.read_csv("daily_tracker.csv")
-            if not existing_df.empty:
-                existing_df['Date'] = pd.to_datetime(existing_df['Date'])
-                existing_df['Items Owned'] = existing_df['Items Owned'].fillna(0)
-                # Keep historical data strictly BEFORE the resume date
-                existing_df = existing_df[existing_df['Date'] < resume_dt]
-                daily_records = existing_df.to_dict('records')
-        except Exception as e:
-            print(f"Warning: Could not load existing tracker data: {e}")
-            daily_records = []
+    # Incremental: rows before resume_dt stay on disk untouched and only the tail of
+    # the tracker (and daily_pnl.csv) is replaced, so nothing older is loaded here
+    incremental = False
+    if resume_dt > current_date:
+        if _has_columns(TRACKER_FILE, TRACKER_COLUMNS) and _has_columns(lots.DAILY_PNL_FILE, PNL_COLUMNS):
+            print(f"Keeping {TRACKER_FILE} rows before {resume_dt.strftime('%Y-%m-%d')} for incremental update...")
+            incremental = True
+        else:
+            print(f"Warning: {TRACKER_FILE} or {lots.DAILY_PNL_FILE} is missing or in an older format. Rebuilding the full history.")
+            resume_dt = current_date
     
-    # State: { (group_id, product_id): quantity }
-    inventory = {} 
-    running_cost_basis = 0.0
+    # FIFO lots: carried over from the last run when the ledger before resume_dt is unchanged,
+    # so only transactions after lots_through are matched again
+    lot_state = lots.state_for_resume(ledger, resume_dt.date().toordinal())
+    lots_through = lot_state['through_day'] if lot_state['through_day'] is not None else -1
+
+    # Value-change attribution also fills in days missing from its file, and compares
+    # its first day with the tracker row before it
+    resume_str = resume_dt.strftime('%Y-%m-%d')
+    attribution_from = resume_str if incremental else START_DATE
+    base_date = None
+    if incremental:
+        attribution_last = read_last_tracker_date(attribution.ATTRIBUTION_FILE) if os.path.exists(attribution.ATTRIBUTION_FILE) else None
+        if attribution_last is None:
+            attribution_from = START_DATE
+        else:
+            attribution_from = min(resume_str, (attribution_last + timedelta(days=1)).strftime('%Y-%m-%d'))
+        before = read_tracker_since(TRACKER_FILE, attribution_from, include_previous=True)
+        if before and before[0]['Date'][:10] < attribution_from:
+            base_date = before[0]['Date'][:10]
+    window_start = min(base_date or attribution_from, resume_str)
 
     print("Calculating daily positions...")
-    
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        
-        # Get transactions strictly for this day
-        # Ensure we are comparing dates correctly
-        day_txs = df[df['Date Recieved'].dt.date == current_date.date()]
-        
-        # --- A. Process Transactions (Start of Day logic) ---
-        for _, tx in day_txs.iterrows():
-            # Handle float vs int vs str issues in IDs
-            try:
-                g_id = str(int(float(tx['group_id'])))
-                p_id = str(int(float(tx['product_id'])))
-            except (ValueError, TypeError):
-                continue
-
-            qty = tx['Quantity']
-            t_type = str(tx['Transaction Type']).strip().upper()
-            total_cost = tx['Total Transaction Value']
-            
-            key = (g_id, p_id)
-            
-            if t_type in ['BUY', 'PULL']:
-                # PULL is effectively a BUY at $0 cost
-                inventory[key] = inventory.get(key, 0) + qty
-                running_cost_basis += total_cost
-                
-            elif t_type == 'SELL':
-                inventory[key] = inventory.get(key, 0) - qty
-                if inventory[key] < 0: inventory[key] = 0
-                # Basis decreases by REVENUE (Net Investment Logic)
-                running_cost_basis -= total_cost
-                
-            elif t_type == 'OPEN':
-                inventory[key] = inventory.get(key, 0) - qty
-                if inventory[key] < 0: inventory[key] = 0
-                # Basis: No change
-                # Value: Decreases naturally in step B because inventory count drops
-
-        # --- B. Calculate Portfolio Value (End of Day logic) ---
-        if current_date < resume_dt:
-            # Rebuilding inventory state only. Skip expensive calculations.
-            current_date += timedelta(days=1)
+    start_day = current_date.date().toordinal()
+    end_day = end_date.date().toordinal()
+
+    # --- A. Lots: match the transactions after lots_through, noting the P&L totals after each day ---
+    lot_days, lot_totals = [], []
+    carried_totals = (lots.total_realized(lot_state), lots.total_open_cost(lot_state))
+    lo, hi = np.searchsorted(ledger['day'], [max(start_day, lots_through + 1), end_day + 1])
+    for i in range(lo, hi):
+        lots.apply_transaction(lot_state, ledger[i])
+        if i + 1 == hi or ledger['day'][i + 1] != ledger['day'][i]:
+            lot_days.append(int(ledger['day'][i]))
+            lot_totals.append((lots.total_realized(lot_state), lots.total_open_cost(lot_state)))
+
+    # --- B. End-of-day holdings and cost basis from window_start on, valued in date shards ---
+    window_day = pd.to_datetime(window_start).date().toordinal()
+    products, inventory, shard = shards.value_days(ledger, tx_values, start_day, window_day, end_day,
+                                                   workers=workers or os.cpu_count() or 1)
+    window_dates = [datetime.fromordinal(d).strftime('%Y-%m-%d') for d in range(window_day, end_day + 1)]
+    quantities, prices, values = shard['quantities'], shard['prices'], shard['values']
+    items_owned_by_day = shard['items_owned']
+
+    # Cost basis, realized P&L and open cost at the end of each day from resume_dt on
+    day_totals = {}
+    for i, date_str in enumerate(window_dates):
+        if date_str < resume_str:
             continue
+        k = bisect_right(lot_days, window_day + i) - 1
+        realized, open_cost = lot_totals[k] if k >= 0 else carried_totals
+        day_totals[date_str] = (shard['cost_basis'][i], realized, open_cost)
+
+    # --- C. Skip days that look unpriced ---
+    items_owned = np.array(items_owned_by_day, dtype=float)
+    # Safety Check: If value is 0 but we own items, it's likely a data error.
+    valued = ~((items_owned > 0) & (values == 0))
+
+    for i, date_str in enumerate(window_dates):
+        if date_str not in day_totals:
+            continue
+        if not valued[i]:
+            print(f"Skipping {date_str}: Price data likely missing (Value is $0).")
+            continue
+        daily_portfolio_value = float(values[i])
+        cost_basis, realized, open_cost = day_totals[date_str]
+        daily_records.append([date_str, round(daily_portfolio_value, 2), round(cost_basis, 2), float(items_owned_by_day[i])])
+
+        # Realized / unrealized P&L from lot matching, next to the tracker
+        pnl_records.append([date_str, round(realized, 2), round(daily_portfolio_value - open_cost, 2), round(open_cost, 2)])
+
+    # Each valued day against the last valued day before it (the base row comes first)
+    positions = np.arange(len(window_dates))
+    last_valued = np.maximum.accumulate(np.where(valued, positions, -1)) if len(positions) else positions
+    previous = np.concatenate([[-1], last_valued[:-1]]) if len(positions) else positions
+    price_effect, quantity_effect = attribution.value_effects(quantities, prices, previous)
+    attributed = np.flatnonzero(valued & (np.array(window_dates, dtype=object) >= attribution_from)) if len(positions) else positions
+    attribution_records = attribution.attribution_rows([window_dates[i] for i in attributed], products,
+                                                       price_effect[attributed], quantity_effect[attributed])
+
+    lot_state['through_day'] = max(lots_through, end_date.date().toordinal())
+
+    # 3. Save Data (only the days from resume_dt on when incremental)
+    append_from = resume_dt.strftime('%Y-%m-%d') if incremental else None
+    write_tracker_rows(TRACKER_FILE, TRACKER_COLUMNS, daily_records, append_from)
+    write_tracker_rows(lots.DAILY_PNL_FILE, PNL_COLUMNS, pnl_records, append_from)
+    write_tracker_rows(attribution.ATTRIBUTION_FILE, attribution.ATTRIBUTION_COLUMNS, attribution_records,
+                       attribution_from if incremental else None)
+    lots.save_state(lot_state, ledger)
+
+    # Weekly inventory snapshots for point-in-time holdings queries (rebuilt only if the ledger changed)
+    holdings.load_snapshots(ledger, pd.to_datetime(START_DATE).date().toordinal())
+
+    # Risk / return statistics: only the re-valued days are recomputed
+    update_portfolio_stats(resume_dt)
+
+    # Money-weighted returns: rolling XIRR for the re-valued days, per product as of the last day
+    new_xirr_rows = xirr.update_rolling(resume_dt.strftime('%Y-%m-%d'), ledger, start_day)
+    xirr_summary = xirr.update_summary(ledger, start_day, name_map)
+    if xirr_summary and xirr_summary['portfolio_xirr'] is not None:
+        print(f"XIRR updated ({new_xirr_rows} day(s)): {xirr_summary['portfolio_xirr']}% a year since {START_DATE}")
 
-        daily_portfolio_value = 0.0
-        
-        for (g_id, p_id), quantity in inventory.items():
-            if quantity > 0:
-                price = get_price_for_date(g_id, p_id, date_str)
-                daily_portfolio_value += (price * quantity)
-
-        items_owned = sum(inventory.values())
-
-        # Safety Check: If value is 0 but we own items, it's likely a data error.
-        if items_owned > 0 and daily_portfolio_value == 0:
-             print(f"Skipping {date_str}: Price data likely missing (Value is $0).")
-             current_date += timedelta(days=1)
-             continue
-
-        daily_records.append({
-            'Date': current_date,
-            'Total Value': round(daily_portfolio_value, 2),
-            'Cost Basis': round(running_cost_basis, 2),
-            'Items Owned': items_owned
-        })
-        
-        current_date += timedelta(days=1)
-
-    # 3. Save Data
-    results_df = pd.DataFrame(daily_records)
-    results_df.to_csv("daily_tracker.csv", index=False)
-    
     # --- Generate summary.json for Widget / GitHub ---
     print("Generating summary.json...")
-    summary_data = {
-        "total_value": 0,
-        "total_cost": 0,
-        "profit": 0,
-        "items_owned": 0,
-        "date": datetime.now().strftime('%Y-%m-%d'),
-        "history": []
-    }
-    
-    if not results_df.empty:
-        last_row = results_df.iloc[-1]
-        summary_data["total_value"] = float(last_row['Total Value'])
-        summary_data["total_cost"] = float(last_row['Cost Basis'])
-        summary_data["profit"] = summary_data["total_value"] - summary_data["total_cost"]
-        summary_data["items_owned"] = int(last_row['Items Owned']) if pd.notna(last_row['Items Owned']) else 0
-        try:
-             summary_data["date"] = str(last_row['Date'].date())
-        except:
-             summary_data["date"] = str(last_row['Date'])
-        
-        # Extract last 14 days for graph
-        history_df = results_df.tail(14).copy()
-        # Convert Timestamps to strings
-        history_df['Date'] = history_df['Date'].apply(lambda x: x.strftime('%Y-%m-%d') if isinstance(x, pd.Timestamp) else str(x))
-        summary_data["history"] = history_df[['Date', 'Total Value']].to_dict('records')
-
-    with open("summary.json", "w") as f:
-        json.dump(summary_data, f, indent=2)
+    earlier_monthly = None
+    results_df = tracker_frame(daily_records)
+    if incremental:
+        previous = load_summary()
+        last_date = read_last_tracker_date(TRACKER_FILE)
+        if previous is not None and last_date is not None:
+            # The year of rows the summary looks at, plus the old summary's monthly points
+            window_start = summary_window_start(pd.Timestamp(last_date), resume_dt)
+            results_df = tracker_frame(read_tracker_since(TRACKER_FILE, window_start.strftime('%Y-%m-%d'), include_previous=True))
+            earlier_monthly = previous['rollups']['all']['points']
+        else:
+            results_df = tracker_frame(read_tracker_since(TRACKER_FILE, '0000-00-00'))
+    summary_data = build_summary(results_df, earlier_monthly)
+    write_json("summary.json", summary_data, indent=2)
     # -------------------------------------------------
 
-    # 4. Generate Graph
+    # 4. Generate Graph (plots the whole history)
+    if incremental:
+        results_df = pd.read_csv(TRACKER_FILE, usecols=['Date', 'Total Value', 'Cost Basis'], parse_dates=['Date'])
     if not results_df.empty:
-        fig = go.Figure()
-        
-        # Value Area
-        fig.add_trace(go.Scatter(
-            x=results_df['Date'], 
-            y=results_df['Total Value'],
-            mode='lines',
-            name='Portfolio Value',
-            line=dict(color='#00C851', width=3),
-            stackgroup='one' # Creates a filled area
-        ))
-        
-        # Cost Basis Line
-        fig.add_trace(go.Scatter(
-            x=results_df['Date'], 
-            y=results_df['Cost Basis'],
-            mode='lines',
-            name='Net Investment (Cost Basis)',
-            line=dict(color='#ff4444', width=2, dash='dash')
-        ))
-
-        fig.update_layout(
-            title='Pokemon Investment Tracker',
-            xaxis_title='Date',
-            yaxis_title='Value ($)',
-            hovermode="x unified",
-            template="plotly_dark",
-            legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
-        )
-        
-        output_html = "portfolio_graph.html"
-        fig.write_html(output_html)
-
-        # --- Performance Ratio Graph ---
-        fig_ratio = go.Figure()
-        
-        # Calculate ratio safely. 
-        # If Cost Basis <= 0 (Free roll or Profitable), ratio is mathematically tricky.
-        # We will handle 0 avoid errors, but negative basis will yield negative ratios which indicate "House Money" status visually.
-        results_df['Performance Ratio'] = results_df.apply(
-            lambda row: row['Total Value'] / row['Cost Basis'] if abs(row['Cost Basis']) > 0.01 else 0.0, 
-            axis=1
-        )
-        
-        fig_ratio.add_trace(go.Scatter(
-            x=results_df['Date'], 
-            y=results_df['Performance Ratio'],
-            mode='lines',
-            name='Value / Net Investment',
-            line=dict(color='#33b5e5', width=3)
-        ))
-
-        # Add a reference line at 1.0 (Break Even)
-        fig_ratio.add_shape(
-            type="line",
-            x0=results_df['Date'].min(),
-            y0=1,
-            x1=results_df['Date'].max(),
-            y1=1,
-            line=dict(color="white", width=2, dash="dot"),
-        )
-
-        fig_ratio.update_layout(
-            title='Portfolio Performance (Value / Net Investment)',
-            xaxis_title='Date',
-            yaxis_title='Ratio (>1 = Profit)',
-            hovermode="x unified",
-            template="plotly_dark",
-            legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
-        )
-        
-        ratio_html = "performance_graph.html"
-        fig_ratio.write_html(ratio_html)
-
+        output_html, ratio_html = generate_graphs(results_df)
         print(f"Success! \n - Data saved to daily_tracker.csv\n - Graph saved to {output_html}\n - Performance Graph saved to {ratio_html}")
     else:
         print("No daily records generated.")
@@ -297,10 +486,15 @@ def run_analysis(resume_date=None):
             })
     
     if holdings_list:
-        pd.DataFrame(holdings_list).to_csv("current_holdings.csv", index=False)
+        write_csv(pd.DataFrame(holdings_list), "current_holdings.csv")
     else:
         # Create empty if nothing held
-        pd.DataFrame(columns=['Product Name', 'group_id', 'product_id', 'Quantity', 'Latest Price', 'Total Value']).to_csv("current_holdings.csv", index=False)
+        write_csv(pd.DataFrame(columns=['Product Name', 'group_id', 'product_id', 'Quantity', 'Latest Price', 'Total Value']), "current_holdings.csv")
+
+    # 6. Per-product P&L (realized from SELLs, unrealized on open lots)
+    latest_prices = {(h['group_id'], h['product_id']): h['Latest Price'] for h in holdings_list}
+    product_rows = lots.product_report(lot_state, inventory, latest_prices, name_map, end_date.date().toordinal())
+    write_csv(pd.DataFrame(product_rows), lots.PRODUCT_PNL_FILE)
 
 if __name__ == "__main__":
     run_analysis()
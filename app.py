@@ -1,10 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-import pandas as pd
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
 import os
 import json
 from datetime import datetime
-from analyze_portfolio import run_analysis
-from functions import MAPPINGS_FILE, TRANSACTIONS_FILE
+from functions import get_mappings_file, get_transactions_file, read_last_tracker_date, read_tracker_tail
+from portfolio_stats import STATS_SUMMARY_FILE, load_stats_summary
+from shared_files import locked, write_csv, write_json
+
+# pandas and the analysis module (and plotly through it) are imported inside the
+# views that need them, so a worker serving /api/summary starts without them.
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'  # Needed for flash messages
@@ -12,13 +15,23 @@ app.secret_key = 'supersecretkey'  # Needed for flash messages
 # Ensure paths are correct
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 HOLDINGS_FILE = os.path.join(BASE_DIR, 'current_holdings.csv')
-# TRANSACTIONS_FILE and MAPPINGS_FILE are imported but let's ensure full paths if needed
-# Assuming they are in the same dir
-if not os.path.isabs(TRANSACTIONS_FILE):
-    TRANSACTIONS_FILE = os.path.join(BASE_DIR, TRANSACTIONS_FILE)
 
-@app.route('/')
-def index():
+def transactions_path():
+    """transactions.csv from data.json, read when a view needs it (edits to data.json apply at once)."""
+    path = get_transactions_file()
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+def mappings_path():
+    return get_mappings_file()
+
+def daemon_query(path, **params):
+    """JSON from tracker_daemon.py when it is running, else None (the view reads the files)."""
+    from tracker_daemon import query
+    return query(path, **params)
+
+def dashboard_from_disk():
+    import pandas as pd
+
     # Load Current Holdings
     holdings = []
     total_value = 0
@@ -29,6 +42,24 @@ def index():
         if not df.empty and 'Total Value' in df.columns:
             total_value = df['Total Value'].sum()
 
+    stats = load_stats_summary(os.path.join(BASE_DIR, STATS_SUMMARY_FILE))
+    from xirr import XIRR_SUMMARY_FILE, load_xirr_summary
+    money_weighted = load_xirr_summary(os.path.join(BASE_DIR, XIRR_SUMMARY_FILE))
+
+    # What moved the value on the last valued day (see attribution.py)
+    from attribution import ATTRIBUTION_FILE, TOP_MOVERS, day_breakdown
+    from holdings import load_name_map
+    movers = day_breakdown(None, load_name_map(), os.path.join(BASE_DIR, ATTRIBUTION_FILE))
+    movers['products'] = movers['products'][:TOP_MOVERS]
+
+    return {"holdings": holdings, "total_value": total_value, "stats": stats,
+            "money_weighted": money_weighted, "movers": movers}
+
+@app.route('/')
+def index():
+    # Holdings, statistics and movers come from memory when tracker_daemon.py is running
+    dashboard = daemon_query('/dashboard') or dashboard_from_disk()
+
     # Read the graph content to embed it
     graph_html = ""
     graph_path = os.path.join(BASE_DIR, 'portfolio_graph.html')
@@ -42,12 +73,15 @@ def index():
         with open(perf_path, 'r') as f:
             performance_html = f.read()
 
-    return render_template('index.html', holdings=holdings, total_value=total_value, graph_html=graph_html, performance_html=performance_html)
+    return render_template('index.html', graph_html=graph_html, performance_html=performance_html, **dashboard)
 
 @app.route('/transactions')
 def transactions():
-    if os.path.exists(TRANSACTIONS_FILE):
-        df = pd.read_csv(TRANSACTIONS_FILE)
+    import pandas as pd
+
+    transactions_file = transactions_path()
+    if os.path.exists(transactions_file):
+        df = pd.read_csv(transactions_file)
         # Add an index column to identify rows for editing
         df['id'] = df.index
         transactions_list = df.to_dict('records')
@@ -62,19 +96,23 @@ def add_transaction():
         return redirect(url_for('transactions'))
     
     mappings = []
-    if os.path.exists(MAPPINGS_FILE):
-        with open(MAPPINGS_FILE, 'r') as f:
+    mappings_file = mappings_path()
+    if os.path.exists(mappings_file):
+        with open(mappings_file, 'r') as f:
             mappings = json.load(f)
             
     return render_template('transaction_form.html', transaction={}, title="Add Transaction", mappings=mappings)
 
 @app.route('/transaction/edit/<int:tx_id>', methods=['GET', 'POST'])
 def edit_transaction(tx_id):
-    if not os.path.exists(TRANSACTIONS_FILE):
+    import pandas as pd
+
+    transactions_file = transactions_path()
+    if not os.path.exists(transactions_file):
         flash("Transactions file not found.", "error")
         return redirect(url_for('index'))
 
-    df = pd.read_csv(TRANSACTIONS_FILE)
+    df = pd.read_csv(transactions_file)
     
     if tx_id not in df.index:
         flash("Transaction not found.", "error")
@@ -85,8 +123,9 @@ def edit_transaction(tx_id):
         return redirect(url_for('transactions'))
     
     mappings = []
-    if os.path.exists(MAPPINGS_FILE):
-        with open(MAPPINGS_FILE, 'r') as f:
+    mappings_file = mappings_path()
+    if os.path.exists(mappings_file):
+        with open(mappings_file, 'r') as f:
             mappings = json.load(f)
 
     transaction = df.loc[tx_id].to_dict()
@@ -94,15 +133,72 @@ def edit_transaction(tx_id):
 
 @app.route('/transaction/delete/<int:tx_id>', methods=['POST'])
 def delete_transaction(tx_id):
-    if os.path.exists(TRANSACTIONS_FILE):
-        df = pd.read_csv(TRANSACTIONS_FILE)
-        if tx_id in df.index:
-            df = df.drop(tx_id)
-            df.to_csv(TRANSACTIONS_FILE, index=False)
+    import pandas as pd
+
+    transactions_file = transactions_path()
+    if os.path.exists(transactions_file):
+        with locked(transactions_file):
+            df = pd.read_csv(transactions_file)
+            deleted = tx_id in df.index
+            if deleted and 'Lot' in df.columns:
+                # Rows after tx_id move up one: keep SELL/OPEN rows pointing at the same lot
+                from lots import renumber_lot_refs
+                lot_values, referencing = renumber_lot_refs(df['Lot'].tolist(), tx_id)
+                if referencing:
+                    flash(f"Transaction {tx_id} is the lot named by row(s) {', '.join(map(str, referencing))}. "
+                          "Change their Lot first.", "error")
+                    return redirect(url_for('transactions'))
+                df = df.drop(tx_id)
+                df['Lot'] = pd.Series(lot_values, index=df.index, dtype=object)
+            elif deleted:
+                df = df.drop(tx_id)
+            if deleted:
+                write_csv(df, transactions_file)
+        if deleted:
             flash("Transaction deleted.", "success")
             run_analysis_safe()
     return redirect(url_for('transactions'))
 
+@app.route('/transactions/import', methods=['GET', 'POST'])
+def import_transactions():
+    # Validates the whole batch at once, appends it in one write and re-runs the analysis once (see bulk_import.py)
+    from bulk_import import format_errors, import_batch
+
+    if request.method == 'GET':
+        return render_template('transactions_import.html', result=None, batch='')
+
+    # A raw CSV body (curl --data-binary @batch.csv -H 'Content-Type: text/csv') gets a JSON report
+    if request.mimetype == 'text/csv':
+        batch = request.get_data(as_text=True)
+        skip_invalid = request.args.get('skip_invalid') == '1'
+        dry_run = request.args.get('dry_run') == '1'
+    else:
+        upload = request.files.get('file')
+        batch = upload.read().decode('utf-8-sig') if upload and upload.filename else request.form.get('batch', '')
+        skip_invalid = bool(request.form.get('skip_invalid'))
+        dry_run = request.form.get('action') == 'validate'
+
+    try:
+        result = import_batch(batch, skip_invalid=skip_invalid, dry_run=dry_run, recompute=False)
+    except Exception as e:
+        if request.mimetype == 'text/csv':
+            return jsonify({"error": f"Could not read the batch: {e}"}), 400
+        flash(f"Could not read the batch: {e}", "error")
+        return render_template('transactions_import.html', result=None, batch=batch)
+
+    if result['imported']:
+        run_analysis_safe(result['resume_date'])
+
+    if request.mimetype == 'text/csv':
+        return jsonify(result), (200 if result['imported'] or dry_run or not result['errors'] else 422)
+
+    if result['imported']:
+        flash(f"Imported {result['imported']} transaction(s).", "success")
+        if not result['errors']:
+            return redirect(url_for('transactions'))
+    return render_template('transactions_import.html', result=result, errors=format_errors(result['errors']),
+                           batch=batch, dry_run=dry_run)
+
 @app.route('/refresh')
 def refresh_data():
     run_analysis_safe()
@@ -110,6 +206,9 @@ def refresh_data():
     return redirect(url_for('index'))
 
 def save_transaction(form_data, tx_id=None):
+    import pandas as pd
+
+    transactions_file, mappings_file = transactions_path(), mappings_path()
     # Extract data from form
     data = {
         'Date Purchased': form_data.get('date_purchased'),
@@ -132,29 +231,30 @@ def save_transaction(form_data, tx_id=None):
     
     if new_img and new_url and data['group_id'] and data['product_id']:
         try:
-            mappings = []
-            if os.path.exists(MAPPINGS_FILE):
-                with open(MAPPINGS_FILE, 'r') as f:
-                    mappings = json.load(f)
-            
-            # Check if exists
-            pid = str(data['product_id']).strip()
-            gid = str(data['group_id']).strip()
-            exists = any(str(m.get('product_id')) == pid and str(m.get('group_id')) == gid for m in mappings)
-            
-            if not exists:
-                new_entry = {
-                    "product_id": pid,
-                    "name": data['Item'],
-                    "group_id": gid,
-                    "imageUrl": new_img,
-                    "categoryId": int(new_cat_id) if new_cat_id else 3,
-                    "url": new_url
-                }
-                mappings.append(new_entry)
-                with open(MAPPINGS_FILE, 'w') as f:
-                    json.dump(mappings, f, indent=2)
-                print(f"Added mapping for {data['Item']}")
+            # Held from the read to the write so two saves can't drop each other's mapping
+            with locked(mappings_file):
+                mappings = []
+                if os.path.exists(mappings_file):
+                    with open(mappings_file, 'r') as f:
+                        mappings = json.load(f)
+
+                # Check if exists
+                pid = str(data['product_id']).strip()
+                gid = str(data['group_id']).strip()
+                exists = any(str(m.get('product_id')) == pid and str(m.get('group_id')) == gid for m in mappings)
+
+                if not exists:
+                    new_entry = {
+                        "product_id": pid,
+                        "name": data['Item'],
+                        "group_id": gid,
+                        "imageUrl": new_img,
+                        "categoryId": int(new_cat_id) if new_cat_id else 3,
+                        "url": new_url
+                    }
+                    mappings.append(new_entry)
+                    write_json(mappings_file, mappings, indent=2)
+                    print(f"Added mapping for {data['Item']}")
         except Exception as e:
             print(f"Error saving mapping: {e}")
 
@@ -176,33 +276,53 @@ def save_transaction(form_data, tx_id=None):
     except:
         pass
 
-    if os.path.exists(TRANSACTIONS_FILE):
-        df = pd.read_csv(TRANSACTIONS_FILE)
-    else:
-        # Create new DF with appropriate columns if not exists
-        columns = ['Date Purchased','Date Recieved','Transaction Type','Price Per Unit','Quantity','Item','group_id','product_id','Method','Place','Notes']
-        df = pd.DataFrame(columns=columns)
-
-    if tx_id is not None:
-        # Update existing
-        for key, value in data.items():
-            df.at[tx_id, key] = value
-    else:
-        # Append new
-        df = pd.concat([df, pd.DataFrame([data])], ignore_index=True)
+    # Read, change and write under one lock: concurrent saves (threaded server, bulk
+    # import) each see the other's rows instead of overwriting them
+    with locked(transactions_file):
+        if os.path.exists(transactions_file):
+            df = pd.read_csv(transactions_file)
+        else:
+            # Create new DF with appropriate columns if not exists
+            columns = ['Date Purchased','Date Recieved','Transaction Type','Price Per Unit','Quantity','Item','group_id','product_id','Method','Place','Notes']
+            df = pd.DataFrame(columns=columns)
+
+        if tx_id is not None:
+            # Update existing
+            for key, value in data.items():
+                df.at[tx_id, key] = value
+        else:
+            # Append new
+            df = pd.concat([df, pd.DataFrame([data])], ignore_index=True)
 
-    df.to_csv(TRANSACTIONS_FILE, index=False)
+        write_csv(df, transactions_file)
     run_analysis_safe()
 
-def run_analysis_safe():
+def run_analysis_safe(resume_date=None):
     try:
-        run_analysis()
+        # A running tracker_daemon.py recomputes warm and serves the results at once
+        from tracker_daemon import request_recompute
+        if not request_recompute(resume_date):
+            from analyze_portfolio import run_analysis
+            # One worker: forking a process pool from the threaded server risks deadlocks
+            run_analysis(resume_date=resume_date, workers=1)
     except Exception as e:
         print(f"Error running analysis: {e}")
         flash(f"Error updating analysis: {e}", "error")
 
 @app.route('/api/summary')
 def api_summary():
+    # summary.json is written by every analysis run and already has the rollups
+    summary = daemon_query('/summary')
+    if summary is not None:
+        return jsonify(summary)
+    summary_path = os.path.join(BASE_DIR, 'summary.json')
+    if os.path.exists(summary_path):
+        try:
+            with open(summary_path, 'r') as f:
+                return jsonify(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error reading summary.json: {e}")
+
     summary = {
         "total_value": 0,
         "total_cost": 0,
@@ -216,30 +336,123 @@ def api_summary():
     tracker_path = os.path.join(BASE_DIR, 'daily_tracker.csv')
     if os.path.exists(tracker_path):
         try:
-            # Using pandas to handle CSV robustly
-            df = pd.read_csv(tracker_path)
-            if not df.empty:
-                last_row = df.iloc[-1]
+            # Only the tail is needed, so skip parsing the whole history
+            rows = read_tracker_tail(tracker_path, 14)
+            if rows:
+                last_row = rows[-1]
                 summary["total_value"] = float(last_row['Total Value'])
                 summary["total_cost"] = float(last_row['Cost Basis'])
                 summary["profit"] = summary["total_value"] - summary["total_cost"]
                 
                 # Check if Items Owned exists (it might be a newer column)
-                if 'Items Owned' in df.columns:
-                     summary["items_owned"] = int(last_row['Items Owned']) if pd.notna(last_row['Items Owned']) else 0
+                if last_row.get('Items Owned'):
+                     summary["items_owned"] = int(float(last_row['Items Owned']))
                 
                 summary["date"] = str(last_row['Date'])
 
                 # Add last 14 days history for widget graph
-                if 'Date' in df.columns and 'Total Value' in df.columns:
-                    history_df = df.tail(14)
-                    summary["history"] = history_df[['Date', 'Total Value']].to_dict('records')
+                summary["history"] = [
+                    {'Date': row['Date'], 'Total Value': float(row['Total Value'])}
+                    for row in rows
+                ]
 
         except Exception as e:
             print(f"Error reading daily tracker: {e}")
 
     return jsonify(summary)
 
+@app.route('/img/<int:product_id>')
+def product_image(product_id):
+    # Thumbnails are cached on disk (see image_cache.py), so pages never hotlink the CDN
+    from image_cache import PLACEHOLDER_SVG, get_thumbnail, sniff_mimetype
+
+    path = get_thumbnail(product_id)
+    if path is None:
+        # Upstream unreachable: a placeholder the browser re-checks in a few minutes
+        response = app.response_class(PLACEHOLDER_SVG, mimetype='image/svg+xml')
+        response.cache_control.max_age = 300
+        return response
+
+    with open(path, 'rb') as f:
+        mimetype = sniff_mimetype(f.read(12))
+    return send_file(os.path.abspath(path), mimetype=mimetype, max_age=30 * 24 * 3600, conditional=True)
+
+@app.route('/api/holdings')
+def api_holdings():
+    # Point-in-time holdings: one weekly inventory snapshot plus the days since (see holdings.py)
+    from holdings import holdings_on
+
+    date_str = request.args.get('date')
+    if not date_str:
+        # Default to the last valued day; today often has no prices yet
+        tracker_path = os.path.join(BASE_DIR, 'daily_tracker.csv')
+        last_date = read_last_tracker_date(tracker_path) if os.path.exists(tracker_path) else None
+        date_str = (last_date or datetime.now()).strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": f"Invalid date '{date_str}', expected YYYY-MM-DD"}), 400
+
+    # Answered from memory when tracker_daemon.py is running
+    result = daemon_query('/holdings', date=date_str)
+    if result is not None and 'holdings' in result:
+        return jsonify(result)
+
+    try:
+        rows = holdings_on(date_str)
+    except Exception as e:
+        print(f"Error computing holdings for {date_str}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "date": date_str,
+        "total_value": round(sum(r['Total Value'] for r in rows), 2),
+        "holdings": rows
+    })
+
+@app.route('/api/catalog/search')
+def api_catalog_search():
+    # Word-prefix search of the local product catalog (python catalog.py --ingest), for autocomplete
+    from catalog import search
+
+    q = request.args.get('q', '').strip()
+    if len(q) < 2:
+        return jsonify([])
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    return jsonify(search(q, limit))
+
+@app.route('/api/attribution')
+def api_attribution():
+    # Per-product price / quantity effects behind one day's change in Total Value
+    from attribution import ATTRIBUTION_FILE, day_breakdown
+    from holdings import load_name_map
+
+    date_str = request.args.get('date')
+    if date_str:
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({"error": f"Invalid date '{date_str}', expected YYYY-MM-DD"}), 400
+
+    result = daemon_query('/attribution', date=date_str)
+    if result is not None:
+        return jsonify(result)
+    path = os.path.join(BASE_DIR, ATTRIBUTION_FILE)
+    if not os.path.exists(path):
+        return jsonify({"error": "No attribution yet. Run the analysis first."}), 404
+    return jsonify(day_breakdown(date_str, load_name_map(), path))
+
+@app.route('/api/stats')
+def api_stats():
+    # Maintained incrementally by every analysis run (see portfolio_stats.py)
+    stats = daemon_query('/stats') or load_stats_summary(os.path.join(BASE_DIR, STATS_SUMMARY_FILE))
+    if stats is None:
+        return jsonify({"error": "No statistics yet. Run the analysis first."}), 404
+    return jsonify(stats)
+
 if __name__ == '__main__':
     # host='0.0.0.0' allows access from other devices on the network
     app.run(debug=True, port=5001, host='0.0.0.0')
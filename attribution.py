@@ -0,0 +1,106 @@
+import os
+import csv
+import numpy as np
+from functions import find_tail_offset, read_last_tracker_date
+from shared_files import locked
+
+ATTRIBUTION_FILE = "daily_attribution.csv"
+ATTRIBUTION_COLUMNS = ['Date', 'group_id', 'product_id', 'Price Effect', 'Quantity Effect']
+TOP_MOVERS = 5
+
+# Value-change attribution
+# ------------------------
+# run_analysis values every day in one pass over a (days, products) quantity matrix
+# (end-of-day holdings) and the matching price matrix. The same two matrices split
+# each product's change in value since the previous tracker row (p = previous, t = this day):
+#
+#   price effect       q_p * (price_t - price_p)     holdings carried over, repriced
+#   quantity effect    (q_t - q_p) * price_t         bought / pulled / sold / opened
+#
+# The two add up to q_t * price_t - q_p * price_p, so a day's effects sum to the
+# change in Total Value (to the cent, up to rounding). daily_attribution.csv keeps one
+# row per product and day where either effect is at least a cent, and is rewritten
+# from the resume date on like the tracker.
+
+def portfolio_values(quantities, prices):
+    """
+    Total value per day from (days, products) quantities and prices (NaN = no price).
+    Products are added one at a time in column order, the way the old per-day loop
+    summed the inventory, so the totals match it to the last bit.
+    """
+    contributions = np.where(quantities > 0, quantities * np.nan_to_num(prices), 0.0)
+    totals = np.zeros(len(quantities))
+    for column in contributions.T:
+        totals += column
+    return totals
+
+def value_effects(quantities, prices, previous):
+    """
+    (price effect, quantity effect), each (days, products), of every day against row
+    previous[i] of the same matrices (-1 = nothing held before).
+    """
+    held = np.where(quantities > 0, quantities, 0.0)
+    prices = np.nan_to_num(prices)
+    has_previous = (previous >= 0)[:, None]
+    q_prev = np.where(has_previous, held[previous], 0.0)
+    p_prev = np.where(has_previous, prices[previous], 0.0)
+    return q_prev * (prices - p_prev), (held - q_prev) * prices
+
+def attribution_rows(dates, products, price_effect, quantity_effect):
+    """CSV rows (ATTRIBUTION_COLUMNS) for every day and product with an effect of a cent or more."""
+    price_effect = np.round(price_effect, 2) + 0.0
+    quantity_effect = np.round(quantity_effect, 2) + 0.0
+    days, cols = np.nonzero((price_effect != 0) | (quantity_effect != 0))
+    return [[dates[d], products[c][0], products[c][1], float(price_effect[d, c]), float(quantity_effect[d, c])]
+            for d, c in zip(days.tolist(), cols.tolist())]
+
+def read_attribution(date_str=None, path=ATTRIBUTION_FILE):
+    """Rows for one day ('YYYY-MM-DD', default the last day in the file), read from where that day starts."""
+    if not os.path.exists(path):
+        return date_str, []
+    if date_str is None:
+        last = read_last_tracker_date(path)
+        if last is None:
+            return None, []
+        date_str = last.strftime('%Y-%m-%d')
+
+    key = date_str.encode('ascii')
+    with locked(path, shared=True), open(path, 'rb') as f:
+        header = f.readline().decode('utf-8')
+        f.seek(find_tail_offset(path, date_str))
+        lines = []
+        for line in f:
+            if not line.startswith(key):
+                break
+            lines.append(line.decode('utf-8'))
+    return date_str, list(csv.DictReader([header] + lines))
+
+def day_breakdown(date_str=None, name_map=None, path=ATTRIBUTION_FILE):
+    """
+    One day's attribution as {'date', 'change', 'price_effect', 'quantity_effect',
+    'products': [...]}, products ordered by the size of their total change.
+    """
+    return breakdown(*read_attribution(date_str, path), name_map)
+
+def breakdown(date_str, rows, name_map=None):
+    """day_breakdown() of a day's rows already read (the resident daemon keeps them in memory)."""
+    name_map = name_map or {}
+    products = []
+    for r in rows:
+        price, quantity = float(r['Price Effect']), float(r['Quantity Effect'])
+        products.append({
+            'Product Name': name_map.get((r['group_id'], r['product_id']), "Unknown"),
+            'group_id': r['group_id'],
+            'product_id': r['product_id'],
+            'price_effect': price,
+            'quantity_effect': quantity,
+            'change': round(price + quantity, 2),
+        })
+    products.sort(key=lambda p: -abs(p['change']))
+    return {
+        'date': date_str,
+        'change': round(sum(p['change'] for p in products), 2),
+        'price_effect': round(sum(p['price_effect'] for p in products), 2),
+        'quantity_effect': round(sum(p['quantity_effect'] for p in products), 2),
+        'products': products,
+    }
@@ -0,0 +1,65 @@
+"""
+Startup-time benchmark for the CLI entry points and the Flask app.
+
+Each case is run in a fresh interpreter (what a cron job, CLI call or new
+web worker actually pays) and the median wall time is compared against its
+target. Exits non-zero if any case misses its target.
+
+    python benchmarks/bench_startup.py [--runs 7] [--output bench_output.txt]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, python args, target seconds)
+CASES = [
+    ("interpreter baseline", ["-c", "pass"], None),
+    ("import functions", ["-c", "import functions"], 0.10),
+    ("import app (Flask worker)", ["-c", "import app"], 0.45),
+    ("daily_run.py --help", ["daily_run.py", "--help"], 0.15),
+    ("update_portfolio.py --help", ["update_portfolio.py", "--help"], 0.15),
+]
+
+def time_case(args, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=REPO_DIR,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of tracker entry points.")
+    parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per case (median is reported)")
+    parser.add_argument("--output", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    lines = []
+    failed = False
+    for name, case_args, target in CASES:
+        median = time_case(case_args, args.runs)
+        if target is None:
+            status = ""
+        elif median <= target:
+            status = f"OK (target {target:.2f}s)"
+        else:
+            status = f"SLOW (target {target:.2f}s)"
+            failed = True
+        lines.append(f"{name:<30} {median:7.3f}s  {status}")
+
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import os
+import io
+import csv
+import json
+import argparse
+from functions import get_mappings_file, get_transactions_file
+from ledger import TxType
+from shared_files import atomic_write, locked
+
+TRANSACTION_COLUMNS = ['Date Purchased', 'Date Recieved', 'Transaction Type', 'Price Per Unit', 'Quantity',
+                       'Item', 'group_id', 'product_id', 'Method', 'Place', 'Notes']
+VALID_TYPES = [t.name for t in TxType if t != TxType.UNKNOWN]
+
+# Bulk import
+# -----------
+# A batch is CSV text with the columns of transactions.csv (any subset in any order;
+# 'Date Recieved' and 'Transaction Type' are required, plus either 'Item' or
+# group_id/product_id). Every check is one pandas pass over the whole batch, and item
+# names are resolved through a single name -> (group_id, product_id) index built from
+# mappings.json and the names already used in transactions.csv, then the local
+# product catalog (catalog.py) for any name neither has.
+#
+# Valid rows are appended to transactions.csv in one write, then the analysis runs
+# once, resumed from the earliest date in the batch (lots.py and the tracker pick up
+# back-dated rows from there). A batch with errors is rejected as a whole unless
+# skip_invalid is set, in which case only the valid rows are imported.
+
+def _normalize_names(series):
+    return series.fillna('').astype(str).str.strip().str.lower().str.split().str.join(' ')
+
+def build_item_index(transactions_file=None, mappings_file=None):
+    """
+    {normalized item name: (group_id, product_id)} from mappings.json and transactions.csv.
+    Names used for more than one product are left out and returned as a set of ambiguous names.
+    """
+    import pandas as pd
+
+    frames = []
+    mappings_file = mappings_file or get_mappings_file()
+    if os.path.exists(mappings_file):
+        with open(mappings_file, 'r') as f:
+            m = pd.DataFrame(json.load(f))
+        if not m.empty:
+            frames.append(m[['name', 'group_id', 'product_id']])
+    transactions_file = transactions_file or get_transactions_file()
+    if os.path.exists(transactions_file):
+        t = pd.read_csv(transactions_file, usecols=['Item', 'group_id', 'product_id'], dtype=str)
+        frames.append(t.rename(columns={'Item': 'name'}))
+    if not frames:
+        return {}, set()
+
+    names = pd.concat(frames, ignore_index=True).dropna()
+    names['key'] = _normalize_names(names['name'])
+    names['group_id'] = pd.to_numeric(names['group_id'], errors='coerce')
+    names['product_id'] = pd.to_numeric(names['product_id'], errors='coerce')
+    names = names.dropna(subset=['group_id', 'product_id']).drop_duplicates(['key', 'group_id', 'product_id'])
+    counts = names['key'].value_counts()
+    ambiguous = set(counts.index[counts > 1])
+    unique = names[~names['key'].isin(ambiguous)]
+    index = {k: (str(int(g)), str(int(p))) for k, g, p in zip(unique['key'], unique['group_id'], unique['product_id'])}
+    return index, ambiguous
+
+def _parse_dates(series):
+    """Dates in M/D/YYYY or YYYY-MM-DD (the formats ledger.py reads); NaT where invalid."""
+    import pandas as pd
+    text = series.fillna('').astype(str).str.strip()
+    us = pd.to_datetime(text, format='%m/%d/%Y', errors='coerce')
+    iso = pd.to_datetime(text, format='%Y-%m-%d', errors='coerce')
+    return us.fillna(iso)
+
+def _format_dates(dates):
+    return dates.dt.month.astype(str) + '/' + dates.dt.day.astype(str) + '/' + dates.dt.year.astype(str)
+
+def validate_batch(text, item_index=None, ambiguous=None):
+    """
+    Parse and check a CSV batch. Returns (rows, errors): rows is a DataFrame of the
+    valid rows with TRANSACTION_COLUMNS formatted as in transactions.csv (plus
+    'batch_row' and the parsed 'received' date), errors a list of
+    {'row': batch row (1 = first data row), 'column': ..., 'error': ...}.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(io.StringIO(text), dtype=str, skipinitialspace=True).dropna(how='all')
+    df.columns = [c.strip() for c in df.columns]
+    # Accept the correct spelling too; transactions.csv has always used 'Recieved'
+    df = df.rename(columns={'Date Received': 'Date Recieved'})
+    for col in TRANSACTION_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df.reset_index(drop=True)
+    df['batch_row'] = df.index + 1
+
+    problems = []
+    def flag(mask, column, message):
+        for r in df.loc[mask, 'batch_row'].tolist():
+            problems.append({'row': int(r), 'column': column, 'error': message})
+
+    received = _parse_dates(df['Date Recieved'])
+    flag(received.isna(), 'Date Recieved', "missing or not a date (M/D/YYYY or YYYY-MM-DD)")
+    purchased = _parse_dates(df['Date Purchased'])
+    has_purchased = df['Date Purchased'].notna() & (df['Date Purchased'].str.strip() != '')
+    flag(has_purchased & purchased.isna(), 'Date Purchased', "not a date (M/D/YYYY or YYYY-MM-DD)")
+    flag(purchased.notna() & received.notna() & (purchased > received), 'Date Purchased', "after Date Recieved")
+    # Purchase date defaults to the receive date
+    purchased = purchased.where(has_purchased, received)
+
+    tx_type = df['Transaction Type'].fillna('').str.strip().str.upper()
+    flag(~tx_type.isin(VALID_TYPES), 'Transaction Type', f"must be one of {', '.join(VALID_TYPES)}")
+
+    quantity_text = df['Quantity'].fillna('').str.strip()
+    quantity = pd.to_numeric(quantity_text.where(quantity_text != '', '1'), errors='coerce')
+    flag(quantity.isna() | (quantity <= 0), 'Quantity', "must be a number greater than 0")
+
+    price_text = df['Price Per Unit'].fillna('').str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    price = pd.to_numeric(price_text.where(price_text != '', '0'), errors='coerce')
+    flag(price.isna() | (price < 0), 'Price Per Unit', "must be a non-negative amount")
+
+    # IDs given explicitly win; otherwise the item name is looked up
+    if item_index is None:
+        item_index, ambiguous = build_item_index()
+    ambiguous = ambiguous or set()
+    group_id = pd.to_numeric(df['group_id'], errors='coerce')
+    product_id = pd.to_numeric(df['product_id'], errors='coerce')
+    has_ids = group_id.notna() & product_id.notna()
+    bad_ids = has_ids & ((group_id % 1 != 0) | (product_id % 1 != 0) | (group_id <= 0) | (product_id <= 0))
+    flag(bad_ids, 'product_id', "group_id and product_id must be positive whole numbers")
+    group_id, product_id, has_ids = group_id.where(~bad_ids), product_id.where(~bad_ids), has_ids & ~bad_ids
+    keys = _normalize_names(df['Item'])
+    looked_up = keys.map(item_index)
+    # Names not seen before: one catalog query for all of them (see catalog.py)
+    unknown = keys[looked_up.isna() & ~has_ids & (keys != '') & ~keys.isin(ambiguous)]
+    if len(unknown):
+        import catalog
+        from_catalog = {k: (p['group_id'], p['product_id']) for k, p in catalog.find_by_names(unknown.unique()).items()}
+        looked_up = looked_up.fillna(keys.map(from_catalog))
+    resolved = has_ids | looked_up.notna()
+    flag(~resolved & keys.isin(ambiguous), 'Item', "name matches more than one product; give group_id and product_id")
+    flag(~resolved & ~keys.isin(ambiguous) & (keys != ''), 'Item', "unknown item; give group_id and product_id")
+    flag(~resolved & (keys == ''), 'Item', "needs an Item name or group_id and product_id")
+
+    lookup_gid = looked_up.map(lambda ids: ids[0], na_action='ignore')
+    lookup_pid = looked_up.map(lambda ids: ids[1], na_action='ignore')
+    group_id = group_id.astype('Int64').astype(str).where(has_ids, lookup_gid)
+    product_id = product_id.astype('Int64').astype(str).where(has_ids, lookup_pid)
+
+    bad_rows = {p['row'] for p in problems}
+    ok = ~df['batch_row'].isin(bad_rows)
+    rows = pd.DataFrame({
+        'Date Purchased': _format_dates(purchased[ok]),
+        'Date Recieved': _format_dates(received[ok]),
+        'Transaction Type': tx_type[ok],
+        'Price Per Unit': price[ok].map(lambda v: f"${v:.2f}"),
+        'Quantity': quantity[ok].astype(float),
+        'Item': df.loc[ok, 'Item'].fillna('').str.strip(),
+        'group_id': group_id[ok],
+        'product_id': product_id[ok],
+        'Method': df.loc[ok, 'Method'],
+        'Place': df.loc[ok, 'Place'],
+        'Notes': df.loc[ok, 'Notes'],
+        'batch_row': df.loc[ok, 'batch_row'],
+        'received': received[ok],
+    })
+    problems.sort(key=lambda p: p['row'])
+    return rows, problems
+
+def append_rows(rows, transactions_file=None):
+    """
+    Append validated rows to transactions.csv in one write, keeping its column order.
+    The file is replaced atomically under its lock (see shared_files.py), so a save
+    from the web app at the same time is neither lost nor interleaved.
+    """
+    transactions_file = transactions_file or get_transactions_file()
+    with locked(transactions_file):
+        _append_rows(rows, transactions_file)
+
+def _append_rows(rows, transactions_file):
+    columns = TRANSACTION_COLUMNS
+    existing = b''
+    if os.path.exists(transactions_file) and os.path.getsize(transactions_file) > 0:
+        with open(transactions_file, 'rb') as f:
+            existing = f.read()
+        columns = next(csv.reader(io.StringIO(existing.decode('utf-8'), newline='')))
+    needs_newline = bool(existing) and existing[-1:] not in (b'\n', b'\r')
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    if columns is TRANSACTION_COLUMNS:
+        writer.writerow(columns)
+    for record in rows[[c for c in columns if c in rows.columns]].to_dict('records'):
+        writer.writerow(['' if record.get(c) is None or record.get(c) != record.get(c) else record.get(c) for c in columns])
+
+    with atomic_write(transactions_file, 'wb') as f:
+        f.write(existing + (b'\n' if needs_newline else b'') + out.getvalue().encode('utf-8'))
+
+def import_batch(text, skip_invalid=False, dry_run=False, recompute=True):
+    """
+    Validate a CSV batch and, unless it has errors (or skip_invalid is set), append it
+    and re-run the analysis once from the earliest date in the batch.
+    Returns {'imported': n, 'errors': [...], 'resume_date': 'YYYY-MM-DD' or None}.
+    """
+    rows, errors = validate_batch(text)
+    result = {'imported': 0, 'valid': int(len(rows)), 'errors': errors, 'resume_date': None}
+    if rows.empty or (errors and not skip_invalid) or dry_run:
+        return result
+
+    append_rows(rows)
+    result['imported'] = int(len(rows))
+    result['resume_date'] = rows['received'].min().strftime('%Y-%m-%d')
+    if recompute:
+        from analyze_portfolio import run_analysis
+        run_analysis(resume_date=result['resume_date'])
+    return result
+
+def format_errors(errors):
+    return [f"row {e['row']}: {e['column']}: {e['error']}" for e in errors]
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a CSV batch of transactions and re-run the analysis once.")
+    parser.add_argument('file', help="CSV with the columns of transactions.csv ('-' for stdin)")
+    parser.add_argument('--dry-run', action='store_true', help="Only validate and report")
+    parser.add_argument('--skip-invalid', action='store_true', help="Import the valid rows even if some rows have errors")
+    parser.add_argument('--no-recompute', action='store_true', help="Append without re-running the analysis")
+    args = parser.parse_args()
+
+    if args.file == '-':
+        import sys
+        text = sys.stdin.read()
+    else:
+        with open(args.file, 'r', newline='') as f:
+            text = f.read()
+
+    result = import_batch(text, skip_invalid=args.skip_invalid, dry_run=args.dry_run, recompute=not args.no_recompute)
+    for line in format_errors(result['errors']):
+        print(f"  ⚠️  {line}")
+    if args.dry_run:
+        print(f"{result['valid']} valid row(s), {len({e['row'] for e in result['errors']})} row(s) with errors. Nothing written (--dry-run).")
+    elif result['imported']:
+        print(f"Imported {result['imported']} transaction(s); analysis resumed from {result['resume_date']}.")
+    else:
+        print("Nothing imported." + (" Fix the rows above or use --skip-invalid." if result['errors'] else ""))
+
+if __name__ == "__main__":
+    main()
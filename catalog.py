@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+
+CATALOG_FILE = os.path.join(".cache", "catalog.sqlite")
+CATALOG_VERSION = 1
+TCGCSV_URL = "https://tcgcsv.com/tcgplayer"
+# Pokemon; more can be passed to ingest()
+DEFAULT_CATEGORIES = ("3",)
+FETCH_TIMEOUT_SECONDS = 30
+
+# Local product catalog
+# ---------------------
+# `python catalog.py --ingest` copies every group and product of the categories from
+# tcgcsv (https://tcgcsv.com/tcgplayer/<category>/groups and .../<group>/products)
+# into a SQLite file. `--source DIR` reads a local copy with the same layout instead
+# (DIR/3/groups, DIR/3/23651/products, with or without .json), so nothing needs the
+# network. Groups whose modifiedOn hasn't changed since the last ingest are skipped.
+#
+# Products are indexed three ways:
+#   products.product_id                primary key (image / info lookups)
+#   products.name_key                  lowercased, whitespace-collapsed name (exact name -> ids)
+#   products_fts (FTS5, prefix 2,3)    name and set name, for word-prefix search / autocomplete
+#
+# Everything reading the catalog treats a missing file as "no results", so the
+# tracker works the same without one.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS groups (
+    group_id INTEGER PRIMARY KEY,
+    category_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    abbreviation TEXT,
+    published_on TEXT,
+    modified_on TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    group_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    set_name TEXT,
+    image_url TEXT,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS products_name_key ON products(name_key);
+CREATE INDEX IF NOT EXISTS products_group ON products(group_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, set_name, content='products', content_rowid='product_id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, name, set_name) VALUES (new.product_id, new.name, new.set_name);
+END;
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, set_name) VALUES ('delete', old.product_id, old.name, old.set_name);
+END;
+"""
+
+def name_key(name):
+    """Case- and whitespace-insensitive form of a product name (same rule as bulk_import)."""
+    return ' '.join(str(name).lower().split())
+
+def connect(path=CATALOG_FILE, create=False):
+    """Open the catalog, or return None if it doesn't exist and create is False."""
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    if create:
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CATALOG_VERSION),))
+    return conn
+
+def _fetch(source, path):
+    """'results' of a tcgcsv endpoint, from the web or from a local copy under source."""
+    if source:
+        for candidate in (os.path.join(source, path), os.path.join(source, path) + ".json"):
+            if os.path.exists(candidate):
+                with open(candidate, 'r') as f:
+                    data = json.load(f)
+                return data['results'] if isinstance(data, dict) else data
+        raise FileNotFoundError(f"{path} not found under {source}")
+
+    import requests
+    resp = requests.get(f"{TCGCSV_URL}/{path}", timeout=FETCH_TIMEOUT_SECONDS)
+    resp.raise_for_status()
+    return resp.json()['results']
+
+def ingest(source=None, categories=DEFAULT_CATEGORIES, full=False, path=CATALOG_FILE):
+    """
+    Bring the catalog up to date for the given categories. Returns (groups refreshed,
+    products written). full=True re-reads every group even if unchanged.
+    """
+    conn = connect(path, create=True)
+    refreshed = written = 0
+    try:
+        for category_id in categories:
+            groups = _fetch(source, f"{category_id}/groups")
+            known = {row['group_id']: row['modified_on'] for row in
+                     conn.execute("SELECT group_id, modified_on FROM groups WHERE category_id = ?", (int(category_id),))}
+
+            listed = {int(g['groupId']) for g in groups}
+            gone = [gid for gid in known if gid not in listed]
+            with conn:
+                for gid in gone:
+                    conn.execute("DELETE FROM products WHERE group_id = ?", (gid,))
+                    conn.execute("DELETE FROM groups WHERE group_id = ?", (gid,))
+
+            for g in groups:
+                gid = int(g['groupId'])
+                if not full and gid in known and known[gid] == g.get('modifiedOn'):
+                    continue
+                try:
+                    products = _fetch(source, f"{category_id}/{gid}/products")
+                except Exception as e:
+                    print(f"  ⚠️  Warning: Could not read products for group {gid} ({g.get('name')}): {e}")
+                    continue
+
+                rows = [(int(p['productId']), gid, int(p.get('categoryId') or category_id), p['name'],
+                         name_key(p['name']), g.get('name'), p.get('imageUrl'), p.get('url'))
+                        for p in products if p.get('productId') and p.get('name')]
+                # One transaction per group; delete first so the FTS triggers stay in step
+                with conn:
+                    conn.execute("DELETE FROM products WHERE group_id = ?", (gid,))
+                    conn.executemany("DELETE FROM products WHERE product_id = ?", [(r[0],) for r in rows])
+                    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    conn.execute("INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?, ?, ?)",
+                                 (gid, int(category_id), g.get('name', ''), g.get('abbreviation'),
+                                  g.get('publishedOn'), g.get('modifiedOn')))
+                refreshed += 1
+                written += len(rows)
+                if not source:
+                    # Be gentle with tcgcsv on a first full ingest
+                    time.sleep(0.1)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('ingested_at', ?)", (time.strftime('%Y-%m-%d %H:%M:%S'),))
+    finally:
+        conn.close()
+    return refreshed, written
+
+def _fts_query(text):
+    """Every word of the query as a prefix term, ANDed together (None if there are no words)."""
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{w}"*' for w in words) or None
+
+def _product_dict(row):
+    return {
+        'group_id': str(row['group_id']),
+        'product_id': str(row['product_id']),
+        'name': row['name'],
+        'set': row['set_name'],
+        'categoryId': row['category_id'],
+        'imageUrl': row['image_url'],
+        'url': row['url'],
+    }
+
+def search(text, limit=20, path=CATALOG_FILE):
+    """Products whose name or set contains every word of text as a prefix, best matches first."""
+    query = _fts_query(text)
+    conn = connect(path)
+    if conn is None or query is None:
+        return []
+    try:
+        rows = conn.execute(
+            "SELECT p.* FROM products_fts f JOIN products p ON p.product_id = f.rowid "
+            "WHERE products_fts MATCH ? ORDER BY bm25(products_fts, 10.0, 1.0), length(p.name) LIMIT ?",
+            (query, limit)).fetchall()
+    finally:
+        conn.close()
+    return [_product_dict(r) for r in rows]
+
+def find_by_names(names, path=CATALOG_FILE):
+    """
+    {name_key: product dict} for the names that match exactly one catalog product
+    (case and spacing ignored). One query for the whole list.
+    """
+    keys = sorted({name_key(n) for n in names if str(n).strip()})
+    conn = connect(path)
+    if conn is None or not keys:
+        return {}
+    matches = {}
+    try:
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(f"SELECT * FROM products WHERE name_key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for row in rows:
+                matches.setdefault(row['name_key'], []).append(row)
+    finally:
+        conn.close()
+    return {key: _product_dict(rows[0]) for key, rows in matches.items() if len(rows) == 1}
+
+def product_info(product_id, path=CATALOG_FILE):
+    conn = connect(path)
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT * FROM products WHERE product_id = ?", (int(product_id),)).fetchone()
+    finally:
+        conn.close()
+    return _product_dict(row) if row else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and search the local product catalog.")
+    parser.add_argument('--ingest', action='store_true', help="Update the catalog from tcgcsv (or --source)")
+    parser.add_argument('--source', help="Local copy of the tcgcsv tree to ingest from instead of the network")
+    parser.add_argument('--category', action='append', help="Category id to ingest (repeatable, default: 3)")
+    parser.add_argument('--full', action='store_true', help="Re-read every group, not just changed ones")
+    parser.add_argument('query', nargs='*', help="Search the catalog")
+    args = parser.parse_args()
+
+    if args.ingest:
+        start = time.perf_counter()
+        groups, products = ingest(args.source, args.category or DEFAULT_CATEGORIES, args.full)
+        print(f"Catalog updated: {groups} group(s) refreshed, {products} product(s) written in {time.perf_counter() - start:.1f}s ({CATALOG_FILE}).")
+
+    if args.query:
+        results = search(' '.join(args.query))
+        if not results and not os.path.exists(CATALOG_FILE):
+            print("No catalog yet. Run: python catalog.py --ingest")
+        for r in results:
+            print(f"  {r['group_id']:>6} | {r['product_id']:>7}  {r['name']}  ({r['set']})")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,88 @@
 import sys
 import datetime
 import argparse
-import update_prices
-import analyze_portfolio
 import json
-import pandas as pd
 import os
+from functions import CONFIG_FILE, load_config, read_last_tracker_date
+from shared_files import locked, write_json
+from run_manifest import (
+    earliest_ledger_change, file_sha256, ledger_day_digests,
+    load_run_manifest, save_run_manifest,
+)
+
+# update_prices and analyze_portfolio pull in pandas/plotly, so they are imported
+# inside main() once we know there is work to do (keeps --help and arg errors instant).
+
+def target_latest_date():
+    # Yesterday, to ensure we have complete data (data sources often lag by 1 day)
+    return (datetime.datetime.now() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+def next_day(date_str):
+    return (datetime.datetime.strptime(date_str, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+def previous_day(date_str):
+    return (datetime.datetime.strptime(date_str, '%Y-%m-%d') - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
 
 def update_config_date():
     """Ensure the config file allows fetching up to today."""
     try:
-        with open("data.json", 'r') as f:
-            data = json.load(f)
-        
-        # Set latest_date to yesterday to ensure we have complete data (data sources often lag by 1 day)
-        data['latest_date'] = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        with open("data.json", 'w') as f:
-            json.dump(data, f, indent=4)
+        with locked(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as f:
+                data = json.load(f)
+
+            latest_date = target_latest_date()
+            if data.get('latest_date') == latest_date:
+                return # Already current, don't touch the file
+            data['latest_date'] = latest_date
+
+            write_json(CONFIG_FILE, data, indent=4)
     except Exception:
         pass # If fails, we trust the user's config
 
+def plan_incremental(manifest, transactions_file):
+    """
+    Work out what an incremental run has to do from the previous run's manifest.
+    Returns (price_start, resume_date, up_to_date):
+      - price_start: first day to check for prices (None = config start_date)
+      - resume_date: first day to re-value (None = full rebuild)
+      - up_to_date: True when there is no new archive day and the ledger is unchanged
+
+    Days a previous run left unpriced (a failed archive, or the older part of a backfill
+    cut short by --max-archives/--time-budget) are re-valued once their prices arrive.
+    """
+    target_day = target_latest_date()
+    last_priced = manifest.get('last_priced_day')
+    last_valued = manifest.get('last_valued_day')
+
+    # The manifest only describes files we still have
+    if not last_priced or not last_valued \
+            or not os.path.isdir("historical_prices") or not os.path.exists("daily_tracker.csv"):
+        return None, None, False
+
+    if manifest.get('ledger_hash') == file_sha256(transactions_file):
+        if last_priced >= target_day and last_valued >= target_day:
+            return None, None, True
+        return next_day(last_priced), next_day(min(last_priced, last_valued)), False
+
+    changed_day = earliest_ledger_change(manifest.get('ledger_days', {}), ledger_day_digests(transactions_file))
+    if changed_day == "":
+        # A row without a usable date changed; we can't tell where to resume
+        return None, None, False
+
+    price_start = next_day(last_priced)
+    resume_date = next_day(min(last_priced, last_valued))
+    if changed_day is not None:
+        price_start = min(price_start, changed_day)
+        resume_date = min(resume_date, changed_day)
+    return price_start, resume_date, False
+
 def main():
     parser = argparse.ArgumentParser(description="Run daily updates for Pokemon Tracker")
     parser.add_argument("--incremental", action="store_true", help="Resume from last tracked date")
     parser.add_argument("--rebuild-from", help="Rebuild starting from specific date (YYYY-MM-DD)")
+    parser.add_argument("--max-archives", type=int, help="Download at most this many daily archives this run (newest first)")
+    parser.add_argument("--time-budget", type=float, metavar="MINUTES", help="Stop starting new archive downloads after this many minutes")
+    parser.add_argument("--workers", type=int, help="Processes to value the days on (default: CPU count; long rebuilds only)")
     args = parser.parse_args()
 
     print("========================================")
@@ -32,18 +90,32 @@ def main():
     print(f"  Date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("========================================")
 
+    try:
+        transactions_file = load_config().get("transactions_file", "transactions.csv")
+    except Exception:
+        transactions_file = "transactions.csv"
+    manifest = load_run_manifest()
+
     # Determine Resume Date
     resume_date = None
+    price_start = None
     if args.rebuild_from:
          resume_date = args.rebuild_from
          print(f"  MODE: Rebuild from {resume_date}")
+    elif args.incremental and manifest:
+         price_start, resume_date, up_to_date = plan_incremental(manifest, transactions_file)
+         if up_to_date:
+             print("  MODE: Up to date (no new archive day, ledger unchanged). Nothing to do.")
+             return
+         if resume_date:
+             print(f"  MODE: Incremental update (prices from {price_start}, values from {resume_date})")
+         else:
+             print("  MODE: Full Rebuild (run manifest can't be used)")
     elif args.incremental:
          if os.path.exists("daily_tracker.csv"):
              try:
-                 df = pd.read_csv("daily_tracker.csv")
-                 if not df.empty:
-                     df['Date'] = pd.to_datetime(df['Date'])
-                     last_date = df['Date'].max()
+                 last_date = read_last_tracker_date("daily_tracker.csv")
+                 if last_date is not None:
                      resume_date = (last_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
                      print(f"  MODE: Incremental update from {resume_date}")
                  else:
@@ -55,13 +127,18 @@ def main():
     else:
          print("  MODE: Full Rebuild (Default)")
 
+    import update_prices
+    import analyze_portfolio
+
     # Step 0: Auto-extend the config date so we don't get stuck in the past
     update_config_date()
 
     # Step 1: Fetch latest prices from the web
     print("\n>>> STEP 1: Updating Historical Prices...")
+    last_priced = None
     try:
-        update_prices.main()
+        last_priced = update_prices.main(start_date=price_start, max_archives=args.max_archives,
+                                         time_budget=args.time_budget * 60 if args.time_budget else None)
     except Exception as e:
         print(f"CRITICAL ERROR in Price Update: {e}")
         # We continue even if price update fails, to at least see current basis
@@ -70,15 +147,36 @@ def main():
     # Step 2: Recalculate Portfolio Value & Basis
     print("\n>>> STEP 2: Analyzing Portfolio Performance...")
     try:
-        analyze_portfolio.run_analysis(resume_date=resume_date)
+        analyze_portfolio.run_analysis(resume_date=resume_date, workers=args.workers)
     except Exception as e:
         print(f"CRITICAL ERROR in Analysis: {e}")
         sys.exit(1)
 
+    # Record what this run covered so the next incremental run can skip or narrow its work
+    if last_priced is None and price_start:
+        # Fetch didn't complete; only what the previous run covered is known to be priced
+        last_priced = previous_day(price_start)
+    config = load_config(reload=True)
+    save_run_manifest({
+        'ledger_hash': file_sha256(transactions_file),
+        'ledger_days': ledger_day_digests(transactions_file),
+        'last_priced_day': last_priced,
+        'last_valued_day': min(config.get("latest_date"), datetime.datetime.now().strftime('%Y-%m-%d')),
+        'updated_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
     # Step 3: Generate Summary JSON for Widget (Serverless)
     # NOTE: This is now handled inside analyze_portfolio.py to include 'history' for the graph
     print("\n>>> STEP 3: summary.json generated by analysis.")
 
+    # Step 4: Columnar export for notebooks / dashboards (optional, needs pyarrow)
+    print("\n>>> STEP 4: Updating Parquet export...")
+    try:
+        import export
+        export.export_all(resume_date=resume_date)
+    except Exception as e:
+        print(f"  ⚠️  Warning: Parquet export failed: {e}")
+
 
     print("\n========================================")
     print("  UPDATE COMPLETE")
@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+import numpy as np
+from functions import load_price_history, read_tracker_since
+from shared_files import atomic_write, write_json
+
+EXPORT_DIR = "export"
+MANIFEST_FILE = "manifest.json"
+EXPORT_VERSION = 1
+
+TRACKER_FILE = "daily_tracker.csv"
+HOLDINGS_FILE = "current_holdings.csv"
+
+# Layout (Parquet, readable with pandas.read_parquet / pyarrow.dataset):
+#   export/tracker/year=YYYY/part-0.parquet        Date, Total Value, Cost Basis, Items Owned
+#   export/current_holdings.parquet                 same columns as current_holdings.csv
+#   export/prices/group_id=GID/part-0.parquet       product_id, date, market_price (sorted)
+#
+# Runs are incremental: tracker years from the resume date on are rewritten, and a
+# price group is rewritten only when its products' coverage bitmaps (see
+# price_coverage.py) changed since the last export, as recorded in export/manifest.json.
+# pyarrow is optional; without it the export is skipped with a note.
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+def _write_table(pa, table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The temp file starts with '.', which pyarrow.dataset skips while it is written
+    with atomic_write(path, 'wb') as f:
+        pa.parquet.write_table(table, f, compression='zstd')
+
+def _load_manifest(export_dir):
+    try:
+        with open(os.path.join(export_dir, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == EXPORT_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': EXPORT_VERSION, 'tracker_years': [], 'price_groups': {}}
+
+def _save_manifest(manifest, export_dir):
+    path = os.path.join(export_dir, MANIFEST_FILE)
+    write_json(path, manifest, indent=2, sort_keys=True)
+
+def export_tracker(pa, export_dir, from_year=None):
+    """Write one Parquet file per tracker year from from_year on (all years if None). Returns the years written."""
+    rows = read_tracker_since(TRACKER_FILE, f"{from_year:04d}-01-01" if from_year else '0000-00-00')
+    by_year = {}
+    for r in rows:
+        by_year.setdefault(int(r['Date'][:4]), []).append(r)
+
+    tracker_dir = os.path.join(export_dir, "tracker")
+    if os.path.isdir(tracker_dir):
+        # Years at/after from_year that no longer have rows
+        for name in os.listdir(tracker_dir):
+            year = int(name.split('=')[1]) if name.startswith('year=') else None
+            if year is not None and (from_year is None or year >= from_year) and year not in by_year:
+                shutil.rmtree(os.path.join(tracker_dir, name))
+
+    for year, year_rows in by_year.items():
+        table = pa.table({
+            'Date': pa.array([datetime.strptime(r['Date'][:10], '%Y-%m-%d').date() for r in year_rows], type=pa.date32()),
+            'Total Value': pa.array([float(r['Total Value']) for r in year_rows], type=pa.float64()),
+            'Cost Basis': pa.array([float(r['Cost Basis']) for r in year_rows], type=pa.float64()),
+            'Items Owned': pa.array([float(r['Items Owned'] or 0) for r in year_rows], type=pa.float64()),
+        })
+        _write_table(pa, table, os.path.join(tracker_dir, f"year={year}", "part-0.parquet"))
+    return sorted(by_year)
+
+def export_holdings(pa, export_dir):
+    import pandas as pd
+    df = pd.read_csv(HOLDINGS_FILE, dtype={'group_id': 'int64', 'product_id': 'int64'})
+    _write_table(pa, pa.Table.from_pandas(df, preserve_index=False), os.path.join(export_dir, "current_holdings.parquet"))
+
+def _group_digests(coverage):
+    """{group_id: digest of its products' priced-day bitmaps} from the coverage manifest."""
+    digests = {}
+    for key in sorted(coverage):
+        g_id, p_id = key.split('/')
+        entry = coverage[key]
+        h = digests.setdefault(g_id, hashlib.sha256())
+        h.update(f"{p_id}:{entry['start']}:".encode('ascii'))
+        h.update(np.packbits(entry['present']).tobytes())
+    return {g_id: h.hexdigest() for g_id, h in digests.items()}
+
+def export_prices(pa, export_dir, manifest, historical_folder='historical_prices'):
+    """Rewrite the price partition of every group whose coverage changed. Returns the groups written."""
+    import price_coverage
+
+    coverage = price_coverage.load_coverage(historical_folder)
+    digests = _group_digests(coverage)
+    prices_dir = os.path.join(export_dir, "prices")
+
+    for g_id in set(manifest['price_groups']) - set(digests):
+        shutil.rmtree(os.path.join(prices_dir, f"group_id={g_id}"), ignore_errors=True)
+        del manifest['price_groups'][g_id]
+
+    written = []
+    for g_id, digest in sorted(digests.items()):
+        if manifest['price_groups'].get(g_id) == digest:
+            continue
+        products = [tuple(key.split('/')) for key in sorted(coverage) if key.split('/')[0] == g_id]
+        days, prices = load_price_history(products, historical_folder=historical_folder)
+
+        # Long format, sorted by product then date so row-group statistics prune well
+        product_idx, day_idx = np.nonzero(~np.isnan(prices))
+        product_ids = np.array([int(p_id) for _, p_id in products], dtype=np.int64)
+        epoch = datetime(1970, 1, 1).toordinal()
+        table = pa.table({
+            'product_id': pa.array(product_ids[product_idx]),
+            'date': pa.array((days[day_idx] - epoch).astype(np.int32), type=pa.int32()).cast(pa.date32()),
+            'market_price': pa.array(prices[product_idx, day_idx]),
+        })
+        _write_table(pa, table, os.path.join(prices_dir, f"group_id={g_id}", "part-0.parquet"))
+        manifest['price_groups'][g_id] = digest
+        written.append(g_id)
+    return written
+
+def export_all(resume_date=None, export_dir=EXPORT_DIR):
+    """
+    Bring the Parquet export up to date. resume_date ('YYYY-MM-DD') is the first day the
+    analysis re-valued; tracker years before it are kept. Returns False if pyarrow is missing.
+    """
+    pa = _pyarrow()
+    if pa is None:
+        print("  - Note: pyarrow is not installed, skipping the Parquet export (pip install pyarrow).")
+        return False
+
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = _load_manifest(export_dir)
+
+    if os.path.exists(TRACKER_FILE):
+        from_year = int(resume_date[:4]) if resume_date and manifest['tracker_years'] else None
+        years = export_tracker(pa, export_dir, from_year)
+        kept = [y for y in manifest['tracker_years'] if from_year is not None and y < from_year]
+        manifest['tracker_years'] = sorted(set(kept) | set(years))
+
+    if os.path.exists(HOLDINGS_FILE):
+        export_holdings(pa, export_dir)
+
+    groups = export_prices(pa, export_dir, manifest)
+    _save_manifest(manifest, export_dir)
+    print(f"Parquet export updated in {export_dir}/ ({len(groups)} price group(s) rewritten).")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the tracker, holdings and price history to Parquet.")
+    parser.add_argument('--from-date', help="Only rewrite tracker years from this date's year (default: all)")
+    parser.add_argument('--full', action='store_true', help="Discard the previous export and rewrite everything")
+    args = parser.parse_args()
+
+    if args.full and os.path.isdir(EXPORT_DIR):
+        shutil.rmtree(EXPORT_DIR)
+    export_all(args.from_date)
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,302 @@
-import requests
 import subprocess
 import os
+import time
 import shutil
 from datetime import datetime, timedelta
 from pathlib import Path
 import csv
+import io
 import json
+from shared_files import atomic_write, locked
 
-with open("data.json") as f:
-    data = json.load(f)
-MAPPINGS_FILE = data.get("mappings_file")
-TRANSACTIONS_FILE = data.get("transactions_file")
+CONFIG_FILE = "data.json"
+
+# TCGplayer category for Pokemon, used for products whose category isn't in mappings.json
+DEFAULT_CATEGORY_ID = "3"
+
+# Parsed contents of CONFIG_FILE, filled on first use by load_config(), and the
+# file's mtime when it was read
+_config = None
+_config_mtime = None
+
+# Per-product file with the prices price_retention.py moved out of the daily files
+PRICE_ARCHIVE_FILE = "archive.json"
+# {product dir: (archive mtime, {date: price})}, re-read when the file changes
+_price_archives = {}
+
+def load_config(reload=False):
+    """
+    Load and cache the data.json configuration.
+    Nothing is read at import time; the file is opened the first time a caller
+    needs a setting, and again when it has changed since (or reload=True).
+    """
+    global _config, _config_mtime
+    try:
+        mtime = os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _config is None or reload or mtime != _config_mtime:
+        with open(CONFIG_FILE) as f:
+            _config = json.load(f)
+        _config_mtime = mtime
+    return _config
+
+def get_transactions_file():
+    return load_config().get("transactions_file", "transactions.csv")
+
+def get_mappings_file():
+    return load_config().get("mappings_file", "mappings.json")
+
+def get_category_map():
+    """
+    {group_id: category_id} (both strings) from the mappings file. A group belongs to
+    one category, so this also covers products in a known group that aren't mapped yet.
+    """
+    categories = {}
+    try:
+        with open(get_mappings_file(), 'r') as f:
+            for m in json.load(f):
+                if m.get('categoryId') not in (None, ''):
+                    categories[str(m.get('group_id', '')).strip()] = str(int(float(m['categoryId'])))
+    except (OSError, ValueError, TypeError) as e:
+        print(f"  ⚠️  Warning: Could not read categories from mappings ({e}). Assuming category {DEFAULT_CATEGORY_ID}.")
+    return categories
+
+def read_tracker_tail(path, n_rows):
+    """
+    Return the last n_rows of a CSV (such as daily_tracker.csv) as a list of dicts,
+    reading backwards from the end of the file instead of parsing the whole thing.
+    """
+    with locked(path, shared=True), open(path, 'rb') as f:
+        header = f.readline()
+        if not header:
+            return []
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        block = b''
+        # Each row is short; grow the window from the end until it holds n_rows lines
+        while pos > len(header) and block.count(b'\n') <= n_rows:
+            step = min(8192, pos - len(header))
+            pos -= step
+            f.seek(pos)
+            block = f.read(step) + block
+
+    lines = [line for line in block.decode('utf-8').splitlines() if line.strip()]
+    lines = lines[-n_rows:] if n_rows > 0 else []
+    reader = csv.DictReader([header.decode('utf-8')] + lines)
+    return list(reader)
+
+def find_tail_offset(path, first_date):
+    """
+    Byte offset where the rows dated on or after first_date ('YYYY-MM-DD') begin in a
+    date-ordered CSV like daily_tracker.csv (the file size if there are none).
+    Scans backwards from the end, so the cost depends on how many rows are dropped,
+    not on the length of the history.
+    """
+    key = first_date.encode('ascii')
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        pos = offset = f.tell()
+        partial = b''
+        while pos > data_start:
+            step = min(8192, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + partial).split(b'\n')
+
+            starts = []
+            o = pos
+            for line in lines:
+                starts.append(o)
+                o += len(line) + 1
+
+            # The first piece may be the tail end of a line that starts earlier
+            first_complete = 1 if pos > data_start else 0
+            for i in range(len(lines) - 1, first_complete - 1, -1):
+                if not lines[i].strip():
+                    continue
+                if lines[i][:10] < key:
+                    return offset
+                offset = starts[i]
+            partial = lines[0] if first_complete else b''
+    return offset
+
+def read_tracker_since(path, first_date, include_previous=False):
+    """
+    Rows of a date-ordered tracker CSV dated on or after first_date ('YYYY-MM-DD'),
+    as a list of dicts. With include_previous, the last row before first_date is
+    included too (for "value as of" lookups). Only the end of the file is read.
+    """
+    with locked(path, shared=True):
+        return _read_rows_since(path, first_date, include_previous)
+
+def _read_rows_since(path, first_date, include_previous):
+    offset = find_tail_offset(path, first_date)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        start = offset
+        if include_previous and offset > data_start:
+            # Step back over one line (rows are short; grow the window if needed)
+            window = 512
+            while True:
+                lo = max(data_start, offset - window)
+                f.seek(lo)
+                before = f.read(offset - lo).rstrip(b'\n')
+                cut = before.rfind(b'\n')
+                if cut >= 0 or lo == data_start:
+                    start = lo + cut + 1
+                    break
+                window *= 4
+        f.seek(start)
+        body = f.read()
+
+    lines = [line for line in body.decode('utf-8').splitlines() if line.strip()]
+    return list(csv.DictReader([header.decode('utf-8')] + lines))
+
+# Tail rewrites of tracker CSVs are journaled here until they complete
+TRACKER_JOURNAL_SUFFIX = ".journal"
+
+def recover_tracker(path):
+    """
+    Undo a tail rewrite that was interrupted part way (see write_tracker_rows):
+    the journal holds the original offset and the rows that were there.
+    """
+    journal = path + TRACKER_JOURNAL_SUFFIX
+    if not os.path.exists(journal):
+        return False
+    with locked(path):
+        if not os.path.exists(journal):
+            # Another process finished the rollback first
+            return False
+        return _roll_back(path, journal)
+
+def _roll_back(path, journal):
+    with open(journal, 'rb') as j:
+        offset = int(j.readline())
+        removed = j.read()
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(removed)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal)
+    print(f"  ⚠️  Warning: Rolled back an interrupted update of {path}.")
+    return True
+
+def write_tracker_rows(path, columns, rows, first_date=None):
+    """
+    Write date-ordered rows (lists in `columns` order) to a tracker CSV.
+
+    With first_date ('YYYY-MM-DD'), rows already in the file dated on/after it are
+    replaced by `rows` and everything earlier is left untouched, so the cost depends
+    on how many days changed rather than on the length of the history. Without it
+    (or if the file is missing or has other columns) the whole file is rewritten.
+
+    Both are all-or-nothing: a full rewrite goes through a temporary file, and a tail
+    rewrite first saves the rows it replaces to a journal that recover_tracker()
+    puts back if the process dies before the new rows are on disk. Readers hold a
+    shared lock on the file (see shared_files.py), so they never see a half-written tail.
+    """
+    with locked(path):
+        _write_rows(path, columns, rows, first_date)
+
+def _write_rows(path, columns, rows, first_date):
+    recover_tracker(path)
+
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerows(rows)
+    payload = out.getvalue().encode('utf-8')
+
+    header = ','.join(columns).encode('utf-8') + b'\n'
+    existing_header = None
+    if first_date is not None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            existing_header = f.readline()
+
+    if existing_header != header:
+        with atomic_write(path, 'wb') as f:
+            f.write(header + payload)
+        return
+
+    offset = find_tail_offset(path, first_date)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        removed = f.read()
+        if offset > len(header) and not removed:
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                payload = b'\n' + payload
+
+    journal = path + TRACKER_JOURNAL_SUFFIX
+    with open(journal + ".tmp", 'wb') as j:
+        j.write(f"{offset}\n".encode('ascii') + removed)
+        j.flush()
+        os.fsync(j.fileno())
+    os.replace(journal + ".tmp", journal)
+
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal)
+
+def read_last_tracker_date(path):
+    """
+    Return the date (datetime.date) of the last row in the tracker CSV, or None if it has no rows.
+    """
+    tail = read_tracker_tail(path, 1)
+    if not tail:
+        return None
+    return datetime.strptime(tail[-1]['Date'][:10], '%Y-%m-%d').date()
 
 def get_product_active_ranges():
     """
     Parses transactions and returns a dictionary mapping (group_id, product_id) to
     a list of date ranges [(start_date, end_date), ...] when the product was owned.
     """
-    if not os.path.exists(TRANSACTIONS_FILE):
-        return {}
+    from ledger import load_ledger, day_to_date, ADDS, REMOVES
 
-    transactions = []
-    with open(TRANSACTIONS_FILE, 'r') as f:
-        reader = csv.DictReader(f)
-        transactions = list(reader)
-
-    # Sort by date received
-    def parse_date(d):
-        try:
-             return datetime.strptime(d, '%m/%d/%Y').date()
-        except:
-             return datetime.min.date()
-    
-    transactions.sort(key=lambda x: parse_date(x.get('Date Recieved', '')))
+    ledger = load_ledger(get_transactions_file())
 
     active_ranges = {} # (gid, pid) -> [(start, end), ...]
     product_states = {} # (gid, pid) -> { 'qty': 0, 'range_start': None }
 
-    for tx in transactions:
-        try:
-            # Clean IDs
-            gid = str(int(float(tx['group_id'])))
-            pid = str(int(float(tx['product_id'])))
-            key = (gid, pid)
-            
-            date_str = tx['Date Recieved']
-            tx_date = datetime.strptime(date_str, '%m/%d/%Y').date()
-            
-            tx_type = str(tx['Transaction Type']).strip().upper()
-            qty = float(tx['Quantity'])
-
-            if key not in product_states:
-                product_states[key] = {'qty': 0.0, 'range_start': None}
-                active_ranges[key] = []
-
-            state = product_states[key]
-            current_qty = state['qty']
-
-            if tx_type in ['BUY', 'PULL']:
-                new_qty = current_qty + qty
-                if current_qty <= 0 and new_qty > 0:
-                     state['range_start'] = tx_date
-                state['qty'] = new_qty
-
-            elif tx_type in ['SELL', 'OPEN', 'TRADE']:
-                new_qty = current_qty - qty
-                if current_qty > 0 and new_qty <= 0:
-                    if state['range_start']:
-                        # Determine end date (inclusive or exclusive? usually exclusive for check)
-                        # "Still owned in any of those dates". 
-                        # If I sell on Day X, I owned it on Day X (start of day). 
-                        # So range should cover Day X.
-                        active_ranges[key].append( (state['range_start'], tx_date) )
-                        state['range_start'] = None
-                state['qty'] = new_qty
-
-        except (ValueError, KeyError, TypeError):
-            continue
+    # The ledger is already sorted by date received
+    for tx in ledger.tolist():
+        _, day, g_id, p_id, tx_type, qty, _, _ = tx
+        key = (str(g_id), str(p_id))
+        tx_date = day_to_date(day)
+
+        if key not in product_states:
+            product_states[key] = {'qty': 0.0, 'range_start': None}
+            active_ranges[key] = []
+
+        state = product_states[key]
+        current_qty = state['qty']
+
+        if tx_type in ADDS:
+            new_qty = current_qty + qty
+            if current_qty <= 0 and new_qty > 0:
+                 state['range_start'] = tx_date
+            state['qty'] = new_qty
+
+        elif tx_type in REMOVES:
+            new_qty = current_qty - qty
+            if current_qty > 0 and new_qty <= 0:
+                if state['range_start']:
+                    # Determine end date (inclusive or exclusive? usually exclusive for check)
+                    # "Still owned in any of those dates". 
+                    # If I sell on Day X, I owned it on Day X (start of day). 
+                    # So range should cover Day X.
+                    active_ranges[key].append( (state['range_start'], tx_date) )
+                    state['range_start'] = None
+            state['qty'] = new_qty
 
     # Close open ranges
     for key, state in product_states.items():
@@ -103,7 +323,7 @@ def is_product_active(gid, pid, date_obj, active_ranges):
 
 # collect_historical_data("2025-08-11", "2025-08-13", 24269, 628395)
 # [{'date': '2025-08-11', 'marketPrice': 14.2}, {'date': '2025-08-12', 'marketPrice': None}, {'date': '2025-08-13', 'marketPrice': 14.42}]
-def collect_historical_data(start_date_str, end_date_str, group_id, product_id):
+def collect_historical_data(start_date_str, end_date_str, group_id, product_id, category_id=DEFAULT_CATEGORY_ID):
     """
     Return a list of dicts with only date and marketPrice for the specified
     group_id and product_id over the date range:
@@ -111,6 +331,8 @@ def collect_historical_data(start_date_str, end_date_str, group_id, product_id):
       - marketPrice (float or None)
     Missing or error days will have marketPrice set to None.
     """
+    import requests
+
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     current_date = start_date
@@ -142,7 +364,7 @@ def collect_historical_data(start_date_str, end_date_str, group_id, product_id):
                 current_date += timedelta(days=1)
                 continue
 
-            prices_file = Path(extracted_folder) / "3" / str(group_id) / "prices"
+            prices_file = Path(extracted_folder) / str(category_id) / str(group_id) / "prices"
             if not prices_file.exists():
                 results.append({'date': date_str, 'marketPrice': None})
                 cleanup_files(archive_filename, extracted_folder)
@@ -196,10 +418,11 @@ def get_product_info_from_ids(group_id, product_id):
     """
     Given group_id and product_id, return info (imageUrl, name, categoryId, and url) using the provided mappings dictionary.
     """
-    if not os.path.exists(MAPPINGS_FILE):
-        raise FileNotFoundError(f"Mappings file '{MAPPINGS_FILE}' not found.")
+    mappings_file = get_mappings_file()
+    if not os.path.exists(mappings_file):
+        raise FileNotFoundError(f"Mappings file '{mappings_file}' not found.")
 
-    with open(MAPPINGS_FILE, 'r') as f:
+    with open(mappings_file, 'r') as f:
         mappings = json.load(f)
 
     group_str = str(group_id)
@@ -219,11 +442,13 @@ def get_product_info_from_ids(group_id, product_id):
 def get_product_info_from_name(product_name):
     """
     Given product name, return info (group_id, product_id, imageUrl, categoryId, and url) using the provided mappings dictionary.
+    Names not in mappings.json are looked up in the local catalog (see catalog.py), ignoring case and spacing.
     """
-    if not os.path.exists(MAPPINGS_FILE):
-        raise FileNotFoundError(f"Mappings file '{MAPPINGS_FILE}' not found.")
+    mappings_file = get_mappings_file()
+    if not os.path.exists(mappings_file):
+        raise FileNotFoundError(f"Mappings file '{mappings_file}' not found.")
 
-    with open(MAPPINGS_FILE, 'r') as f:
+    with open(mappings_file, 'r') as f:
         mappings = json.load(f)
 
     name = str(product_name)
@@ -238,9 +463,13 @@ def get_product_info_from_name(product_name):
                 'url': mapping.get('url')
             }
 
-    return None    
+    import catalog
+    match = catalog.find_by_names([name]).get(catalog.name_key(name))
+    if match:
+        return {key: match[key] for key in ('group_id', 'product_id', 'categoryId', 'imageUrl', 'url')}
+    return None
 
-def update_historical_price_files(start_date_str, end_date_str, group_id, product_id, output_folder='historical_prices'):
+def update_historical_price_files(start_date_str, end_date_str, group_id, product_id, output_folder='historical_prices', category_id=DEFAULT_CATEGORY_ID):
     """
     Update historical price files for the specified group_id and product_id
     over the date range. Saves individual date files in output_folder.
@@ -252,7 +481,7 @@ def update_historical_price_files(start_date_str, end_date_str, group_id, produc
     if start_date > end_date:
         raise ValueError("start_date must be on or before end_date")
 
-    records = collect_historical_data(start_date_str, end_date_str, group_id, product_id)
+    records = collect_historical_data(start_date_str, end_date_str, group_id, product_id, category_id)
 
     def best_guess_price(idx):
         price = records[idx].get('marketPrice')
@@ -281,9 +510,12 @@ def update_historical_price_files(start_date_str, end_date_str, group_id, produc
             return next_price
         return None
 
+    import price_coverage
+
     base_path = Path(output_folder) / str(group_id) / str(product_id)
     base_path.mkdir(parents=True, exist_ok=True)
 
+    coverage = price_coverage.load_coverage(output_folder)
     saved_files = []
 
     for idx, record in enumerate(records):
@@ -307,8 +539,10 @@ def update_historical_price_files(start_date_str, end_date_str, group_id, produc
         with open(file_path, 'w') as f:
             json.dump(payload, f)
 
+        price_coverage.mark_present(coverage, group_id, product_id, date_str)
         saved_files.append(str(file_path))
 
+    price_coverage.save_coverage(coverage, output_folder)
     return saved_files
 
 def get_price_for_date(group_id, product_id, date_str, historical_folder='historical_prices'):
@@ -319,7 +553,9 @@ def get_price_for_date(group_id, product_id, date_str, historical_folder='histor
     file_path = Path(historical_folder) / str(group_id) / str(product_id) / f"{date_str}.json"
     
     if not file_path.exists():
-        return 0.0
+        # Compacted days (see price_retention.py) live in the product's archive
+        price = load_price_archive(file_path.parent).get(date_str)
+        return float(price) if price is not None else 0.0
         
     try:
         with open(file_path, 'r') as f:
@@ -332,13 +568,150 @@ def get_price_for_date(group_id, product_id, date_str, historical_folder='histor
     except (ValueError, TypeError):
         return 0.0
 
-def batch_update_historical_prices(start_date_str, end_date_str, product_list, output_folder='historical_prices'):
+def load_price_archive(product_dir):
+    """
+    {'YYYY-MM-DD': price or None} for every day kept in a product's archive: the exact
+    prices of compacted days plus the closing price of each weekly / monthly period.
+    Empty if the product has no archive.
+    """
+    path = os.path.join(product_dir, PRICE_ARCHIVE_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _price_archives.get(str(product_dir))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, 'r') as f:
+            archive = json.load(f)
+        prices = dict(archive.get('daily', {}))
+        for period in archive.get('periods', []):
+            prices[period['date']] = period.get('price')
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"  ⚠️  Warning: Could not read {path} ({e}).")
+        prices = {}
+    _price_archives[str(product_dir)] = (mtime, prices)
+    return prices
+
+def load_price_history(products, first_date=None, last_date=None, historical_folder='historical_prices', cache=None):
+    """
+    Bulk-load daily market prices for many products into one matrix.
+    products: list of (group_id, product_id). first_date / last_date ('YYYY-MM-DD')
+    default to the span of everything stored.
+    Returns (days, prices): day ordinals first..last and a float64 array of shape
+    (len(products), len(days)) with NaN where no price is stored. Which files exist is
+    read from the coverage manifest, so no per-day existence checks are needed, and
+    prices read before are kept in price_coverage.PRICE_CACHE_FILE, so only files for
+    days priced since the last load are opened.
+
+    With cache (a load_price_cache() dict, e.g. handed to a worker process), only the
+    files for days first..last are read, into that dict, and nothing is saved; the
+    caller merges the workers' entries (price_coverage.merge_price_cache) and saves once.
+    """
+    import numpy as np
+    import price_coverage
+
+    coverage = price_coverage.load_coverage(historical_folder)
+    entries = [coverage.get(price_coverage._key(g_id, p_id)) for g_id, p_id in products]
+
+    spans = [(e['start'], e['start'] + len(e['present']) - 1) for e in entries if e is not None and e['present'].any()]
+    lo = price_coverage._day(first_date) if first_date else min((s for s, _ in spans), default=None)
+    hi = price_coverage._day(last_date) if last_date else max((e for _, e in spans), default=None)
+    if lo is None or hi is None or hi < lo:
+        return np.zeros(0, dtype=np.int64), np.full((len(products), 0), np.nan)
+
+    days = np.arange(lo, hi + 1, dtype=np.int64)
+    prices = np.full((len(products), len(days)), np.nan)
+    shared_cache = cache is not None
+    if not shared_cache:
+        cache = price_coverage.load_price_cache(historical_folder)
+    cache_changed = False
+    for i, ((g_id, p_id), entry) in enumerate(zip(products, entries)):
+        if entry is None:
+            continue
+        key = price_coverage._key(g_id, p_id)
+        start, present = entry['start'], entry['present']
+
+        # Line the cached days up with the coverage span (it can grow at either end)
+        read = np.zeros(len(present), dtype=bool)
+        values = np.full(len(present), np.nan)
+        cached = cache.get(key)
+        if cached is not None:
+            shift = cached[0] - start
+            n = min(len(cached[1]), len(present) - shift) if shift >= 0 else 0
+            if n > 0:
+                read[shift:shift + n] = cached[1][:n]
+                values[shift:shift + n] = cached[2][:n]
+        stale = read & ~present
+        read &= present
+        values[stale] = np.nan
+
+        product_dir = os.path.join(historical_folder, str(g_id), str(p_id))
+        unread = present & ~read
+        if shared_cache:
+            # Other workers read the days outside this one's window
+            unread[:max(lo - start, 0)] = False
+            unread[max(hi - start + 1, 0):] = False
+        new_offsets = np.flatnonzero(unread).tolist()
+        for offset in new_offsets:
+            date_str = datetime.fromordinal(start + offset).strftime('%Y-%m-%d')
+            try:
+                with open(os.path.join(product_dir, f"{date_str}.json"), 'rb') as f:
+                    price = json.loads(f.read()).get('marketPrice')
+            except FileNotFoundError:
+                archived = load_price_archive(product_dir)
+                if date_str not in archived:
+                    continue
+                price = archived[date_str]
+            except (OSError, ValueError):
+                # Left unread so the next load tries again
+                continue
+            read[offset] = True
+            if price is not None:
+                values[offset] = float(price)
+
+        if new_offsets or stale.any() or cached is None or cached[0] != start or len(cached[1]) != len(present):
+            cache[key] = (start, read, values)
+            cache_changed = True
+
+        src_lo, src_hi = max(lo, start), min(hi, start + len(present) - 1)
+        if src_lo <= src_hi:
+            prices[i, src_lo - lo:src_hi - lo + 1] = values[src_lo - start:src_hi - start + 1]
+
+    if cache_changed and not shared_cache:
+        try:
+            price_coverage.save_price_cache(cache, historical_folder)
+        except OSError as e:
+            print(f"  ⚠️  Warning: Could not save the price cache ({e}).")
+    return days, prices
+
+def batch_update_historical_prices(start_date_str, end_date_str, product_list, output_folder='historical_prices',
+                                   max_archives=None, time_budget=None, plan_only=False):
     """
     Downloads daily price dumps ONCE per day, extracts prices for ALL products in product_list,
     and saves them to the file system.
     
-    product_list: List of dicts with 'group_id' and 'product_id' keys.
+    product_list: List of dicts with 'group_id' and 'product_id' keys, plus 'category_id'
+    (defaults to DEFAULT_CATEGORY_ID). Every category needed on a day is read from the
+    same downloaded and extracted archive.
+
+    Which days to download comes from the coverage manifest (see price_coverage.py)
+    rather than checking for a file per product per day. Every price written, and every
+    product the archive has no price for, is recorded there so it isn't fetched again.
+
+    The whole plan is worked out before any download and fetched most recent day
+    first, so the current valuation is right even when a run stops early. max_archives
+    and time_budget (seconds) bound how much of it one run does; the rest is left for
+    the next run. plan_only prints the plan and downloads nothing.
+
+    Returns the last day (YYYY-MM-DD) up to which every day is known to be priced,
+    i.e. the day before the earliest archive that failed or was left for later
+    (None with plan_only).
     """
+    import requests
+    import price_coverage
+
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     now = datetime.now()
@@ -348,163 +721,284 @@ def batch_update_historical_prices(start_date_str, end_date_str, product_list, o
     # NEW: Get active ranges to determine what to fetch
     active_ranges = get_product_active_ranges()
 
-    current_date = start_date
-    
-    # Pre-organize products by group_id for faster lookup {group_id: [product_id, ...]}
-    products_by_group = {}
+    products = []
+    category_of = {}
     for p in product_list:
-        g_id = str(p['group_id']).strip()
-        p_id = str(p['product_id']).strip()
-        if g_id not in products_by_group:
-            products_by_group[g_id] = []
-        products_by_group[g_id].append(p_id)
+        key = (str(p['group_id']).strip(), str(p['product_id']).strip())
+        if key not in category_of:
+            products.append(key)
+            category_of[key] = str(p.get('category_id') or DEFAULT_CATEGORY_ID)
 
     print(f"Batch processing from {start_date_str} to {end_date.strftime('%Y-%m-%d')}...")
 
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        
-        # 1. Identify which products are ACTIVE on this date
-        active_products_today = []
-        for p in product_list:
-            g_id = str(p['group_id']).strip()
-            p_id = str(p['product_id']).strip()
-            
-            if is_product_active(g_id, p_id, current_date.date(), active_ranges):
-                active_products_today.append(p)
-
-        if not active_products_today:
-             # No products active on this day, skip
-             # print(f"Skipping {date_str} - No active products.")
-             current_date += timedelta(days=1)
-             continue
-
-        # 2. Check if we already have data for these ACTIVE products
-        missing_data = False
-        for p in active_products_today:
-            g_id = str(p['group_id'])
-            p_id = str(p['product_id'])
-            check_path = Path(output_folder) / g_id / p_id / f"{date_str}.json"
-            if not check_path.exists():
-                missing_data = True
-                break
-        
-        if not missing_data:
-            print(f"Skipping {date_str} - All required data present.")
-            current_date += timedelta(days=1)
-            continue
-        
-        archive_url = f"https://tcgcsv.com/archive/tcgplayer/prices-{date_str}.ppmd.7z"
-        archive_filename = f"prices-{date_str}.ppmd.7z"
+    coverage = price_coverage.load_coverage(output_folder)
+    plan = price_coverage.days_to_fetch(coverage, active_ranges, products, start_date.date(), end_date.date())
+    total_days = (end_date.date() - start_date.date()).days + 1
+    print(f"{len(plan)} of {max(total_days, 0)} day(s) need prices; the rest are present or known missing upstream.")
+
+    # Most recent first: a bounded run still gets today's valuation right
+    plan.reverse()
+    fetch_stats = price_coverage.load_fetch_stats(output_folder)
+    print(price_coverage.describe_plan(plan, fetch_stats['avg_seconds']))
+    if max_archives is not None and len(plan) > max_archives:
+        print(f"Limited to the {max_archives} most recent archive(s) this run (--max-archives).")
+    if time_budget is not None:
+        print(f"Time budget: {time_budget / 60:.1f} min.")
+    if plan_only:
+        return None
+
+    # Earliest day we failed to price or left for a later run; everything before it is complete
+    first_failure = None
+    scanned_market = False
+    started = time.monotonic()
 
-        extracted_folder = f"temp_extract_{date_str}" 
+    try:
+        for day_index, (day, wanted_today) in enumerate(plan):
+            elapsed = time.monotonic() - started
+            over_count = max_archives is not None and day_index >= max_archives
+            over_time = time_budget is not None and elapsed + fetch_stats['avg_seconds'] > time_budget
+            if over_count or over_time:
+                remaining = plan[day_index:]
+                # The plan runs newest to oldest, so the last entry is the earliest day left
+                first_failure = min(first_failure, remaining[-1][0]) if first_failure else remaining[-1][0]
+                print(f"Stopping with {len(remaining)} archive(s) left for the next run ({'archive limit' if over_count else 'time budget'} reached).")
+                break
 
+            fetch_started = time.monotonic()
+            status = _fetch_day_prices(requests, day, wanted_today, coverage, output_folder, category_of)
+            if status == 'ok':
+                price_coverage.record_fetch_time(fetch_stats, time.monotonic() - fetch_started)
+            scanned_market = scanned_market or status == 'ok'
+            if status == 'no_archive' and price_coverage.archive_is_final(day):
+                # Upstream never published this day; remember that instead of retrying forever
+                for g_id, p_id in wanted_today:
+                    price_coverage.mark_missing(coverage, g_id, p_id, day)
+            elif status != 'ok':
+                first_failure = min(first_failure, day) if first_failure else day
+
+            # Persist progress now and then so an interrupted backfill isn't lost
+            if day_index % 25 == 24:
+                price_coverage.save_coverage(coverage, output_folder)
+    finally:
+        price_coverage.save_coverage(coverage, output_folder)
+        price_coverage.save_fetch_stats(fetch_stats, output_folder)
+
+    if scanned_market:
+        import market_movers
         try:
-            print(f"Processing {date_str}...", end='', flush=True)
-            
-            # Download
-            resp = requests.get(archive_url, stream=True)
-            if resp.status_code != 200:
-                print(f" [Skipped - No Data]")
-                current_date += timedelta(days=1)
-                continue
+            market_movers.build_report()
+            print(f"Market movers report written to {market_movers.REPORT_FILE}")
+        except Exception as e:
+            print(f"  ⚠️  Warning: Could not build market movers report: {e}")
 
-            with open(archive_filename, 'wb') as f:
-                for chunk in resp.iter_content(chunk_size=8192):
-                    f.write(chunk)
+    last_priced = (first_failure - timedelta(days=1)) if first_failure else end_date.date()
+    return last_priced.strftime('%Y-%m-%d')
 
-            # Extract
-            # We assume Pokemon is Category 3
-            result = subprocess.run(['7z', 'x', archive_filename, f'-o{extracted_folder}', '-y'],
-                                    capture_output=True, text=True)
-            
-            if result.returncode != 0:
-                print(f" [Extraction Failed]")
-                cleanup_files(archive_filename, extracted_folder)
-                current_date += timedelta(days=1)
-                continue
-            
-            found_count = 0
-            
-            # Process Groups
-            # The structure is sometimes `extracted_folder/3/...` and sometimes `extracted_folder/date_str/3/...`
-            # or even `extracted_folder/prices-date/3` depending on how 7z behaves with the archive internal structure.
-            
-            base_path = Path(extracted_folder)
-            
-            # Hunting for the '3' folder (Pokemon)
-            category_path = base_path / "3" 
-            if not category_path.exists():
-                # Check if there is a nested folder with the date name (common with some archives)
-                nested = base_path / date_str / "3"
-                if nested.exists():
-                    category_path = nested
-            
-            if not category_path.exists():
-                # DEBUG: Check what IS there
-                existing = list(base_path.iterdir()) if base_path.exists() else "Folder Missing"
-                print(f" [Debug: No '3' folder. Found: {[p.name for p in existing]}]", end='')
-
-            if category_path.exists():
-                # NEW: Filter to only active products
-                active_by_group = {}
-                for p in active_products_today:
-                     g_id = str(p['group_id']).strip()
-                     p_id = str(p['product_id']).strip()
-                     if g_id not in active_by_group:
-                         active_by_group[g_id] = []
-                     active_by_group[g_id].append(p_id)
-                
-                for group_id, target_product_ids in active_by_group.items():
-                    # The file inside is usually named 'prices' (no extension) which contains JSON
-                    group_file = category_path / group_id / "prices"
-                    
-                    if not group_file.exists():
-                        # DEBUG: detailed fail for the first group to help diagnose
-                        # print(f"[Missing Group {group_id}]", end='')
-                        continue
-
-                    if group_file.exists():
-                        try:
-                            with open(group_file, 'r') as gf:
-                                data = json.load(gf)
-                            
-                            if isinstance(data, dict) and 'results' in data:
-                                # Create map for O(1) lookup
-                                day_prices = {}
-                                for res in data['results']:
-                                    pid = str(res.get('productId'))
-                                    day_prices[pid] = res.get('marketPrice')
-
-                                # Save requested products
-                                for pid in target_product_ids:
-                                    if pid in day_prices:
-                                        val = day_prices[pid]
-                                        if val is not None:
-                                            # Write file
-                                            out_dir = Path(output_folder) / group_id / pid
-                                            out_dir.mkdir(parents=True, exist_ok=True)
-                                            
-                                            out_file = out_dir / f"{date_str}.json"
-                                            with open(out_file, 'w') as of:
-                                                json.dump({
-                                                    'date': date_str,
-                                                    'group_id': group_id,
-                                                    'product_id': pid,
-                                                    'marketPrice': float(val)
-                                                }, of)
-                                            found_count += 1
-                        except Exception:
-                            pass
-            
-            print(f" [OK - Saved {found_count} prices]")
-            cleanup_files(archive_filename, extracted_folder)
+def _index_archive_categories(base_path, date_str, categories):
+    """
+    Locate each category folder in an extracted archive and index its groups:
+    {category_id: (category_path, {group_id: prices_file})}. Categories the archive
+    doesn't contain are left out.
+    """
+    index = {}
+    for category_id in categories:
+        # The structure is sometimes `extracted_folder/3/...` and sometimes `extracted_folder/date_str/3/...`
+        # or even `extracted_folder/prices-date/3` depending on how 7z behaves with the archive internal structure.
+        category_path = base_path / category_id
+        if not category_path.exists():
+            # Check if there is a nested folder with the date name (common with some archives)
+            nested = base_path / date_str / category_id
+            if nested.exists():
+                category_path = nested
+        if not category_path.is_dir():
+            continue
+        groups = {entry.name: Path(entry.path) / "prices" for entry in os.scandir(category_path) if entry.is_dir()}
+        index[category_id] = (category_path, groups)
+    return index
+
+# Group price files
+# -----------------
+# Each group in a daily archive is one `prices` file: {"results": [{"productId": ...,
+# "marketPrice": ..., ...}, ...]} with a row per product and printing (Normal, Holofoil,
+# ...). Big sets run to thousands of rows and only a handful of them are held, so
+# read_group_prices() doesn't parse the whole file: it maps it, lets one regex over
+# the wanted IDs find their rows, and decodes just those row objects. Memory per
+# file is the matched rows, whatever the group's size. orjson, when installed,
+# decodes the rows (and the whole file for the market scan); json otherwise.
+# Files laid out some other way (nested row objects, no "results") go through a full parse.
+
+def json_loads():
+    """The fastest available JSON decoder for bytes: orjson.loads if installed, else json.loads."""
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+def _group_prices_from(data, product_ids):
+    prices = {}
+    if isinstance(data, dict) and 'results' in data:
+        for res in data['results']:
+            pid = str(res.get('productId'))
+            if pid in product_ids:
+                prices[pid] = res.get('marketPrice')
+    return prices
+
+def read_group_prices(group_file, product_ids):
+    """
+    {product_id: marketPrice} for the product IDs (strings) listed in a group's
+    prices file; the last row wins when a product is listed more than once, and
+    products without a row are left out. Raises OSError / ValueError if the file
+    can't be read or decoded.
+    """
+    import re
+    import mmap
+
+    product_ids = {str(pid) for pid in product_ids}
+    loads = json_loads()
+    with open(group_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0 or not product_ids:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf.find(b'"results"') < 0:
+                return _group_prices_from(loads(buf[:]), product_ids)
+            wanted = b'|'.join(re.escape(pid.encode('utf-8')) for pid in sorted(product_ids, key=len, reverse=True))
+            pattern = re.compile(rb'"productId"\s*:\s*"?(' + wanted + rb')(?![\w.])')
+
+            prices = {}
+            for match in pattern.finditer(buf):
+                start = buf.rfind(b'{', 0, match.start())
+                end = buf.find(b'}', match.end())
+                try:
+                    row = loads(buf[start:end + 1]) if start >= 0 and end >= 0 else None
+                except ValueError:
+                    row = None
+                pid = match.group(1).decode('utf-8')
+                if not isinstance(row, dict) or str(row.get('productId')) != pid:
+                    # Not a flat row object; decode the file the slow way
+                    return _group_prices_from(loads(buf[:]), product_ids)
+                prices[pid] = row.get('marketPrice')
+            return prices
+
+def _fetch_day_prices(requests, day, wanted_today, coverage, output_folder, category_of=None):
+    """
+    Download and extract one day's archive and save prices for wanted_today
+    [(group_id, product_id), ...], whatever category each is in (category_of maps
+    products to category IDs). Returns 'ok', 'no_archive' (upstream has no archive
+    for the day) or 'failed' (download/extraction error, worth retrying).
+    """
+    import price_coverage
+    import market_movers
 
-        except Exception as e:
-            print(f" [Error: {e}]")
-            cleanup_files(archive_filename, extracted_folder)
+    category_of = category_of or {}
+    date_str = day.strftime('%Y-%m-%d')
+    archive_url = f"https://tcgcsv.com/archive/tcgplayer/prices-{date_str}.ppmd.7z"
+    archive_filename = f"prices-{date_str}.ppmd.7z"
 
-        current_date += timedelta(days=1)
+    extracted_folder = f"temp_extract_{date_str}" 
 
+    try:
+        print(f"Processing {date_str}...", end='', flush=True)
+        
+        # Download
+        resp = requests.get(archive_url, stream=True)
+        if resp.status_code != 200:
+            print(f" [Skipped - No Data]")
+            return 'no_archive' if resp.status_code == 404 else 'failed'
+
+        with open(archive_filename, 'wb') as f:
+            for chunk in resp.iter_content(chunk_size=8192):
+                f.write(chunk)
+
+        # Extract (one pass; the archive holds every category)
+        result = subprocess.run(['7z', 'x', archive_filename, f'-o{extracted_folder}', '-y'],
+                                capture_output=True, text=True)
+        
+        if result.returncode != 0:
+            print(f" [Extraction Failed]")
+            cleanup_files(archive_filename, extracted_folder)
+            return 'failed'
+        
+        found_count = 0
+        base_path = Path(extracted_folder)
+
+        # Group wanted products by (category, group) and index each needed category's groups once
+        wanted_by_group = {}
+        for g_id, p_id in wanted_today:
+            wanted_by_group.setdefault((category_of.get((g_id, p_id), DEFAULT_CATEGORY_ID), g_id), []).append(p_id)
+        wanted_categories = sorted({category_id for category_id, _ in wanted_by_group})
+        archive_index = _index_archive_categories(base_path, date_str, set(wanted_categories) | {market_movers.MARKET_CATEGORY_ID})
+
+        # A category the archive doesn't have only affects its own products: they are
+        # recorded as missing once the archive is final (else tried again next run),
+        # and the other categories are saved as usual. If none is found, the layout is
+        # more likely one the index doesn't know than every category gone, so the day
+        # fails and is retried rather than marking everything missing.
+        missing_categories = [c for c in wanted_categories if c not in archive_index]
+        if missing_categories and len(missing_categories) == len(wanted_categories):
+            print(f" [No category folder(s) {', '.join(missing_categories)} found in the archive]")
+            cleanup_files(archive_filename, extracted_folder)
+            return 'failed'
+        if missing_categories:
+            final = price_coverage.archive_is_final(day)
+            print(f" [No category folder(s) {', '.join(missing_categories)}{'' if final else '; retried next run'}]", end='')
+            for category_id, group_id in [k for k in wanted_by_group if k[0] in missing_categories]:
+                for pid in wanted_by_group.pop((category_id, group_id)):
+                    if final:
+                        price_coverage.mark_missing(coverage, group_id, pid, day)
+
+        # Market-wide scan for the movers report, while the archive is already extracted
+        if market_movers.MARKET_CATEGORY_ID in archive_index:
+            try:
+                market_movers.record_day(archive_index[market_movers.MARKET_CATEGORY_ID][0], day)
+            except Exception as e:
+                print(f" [Market scan failed: {e}]", end='')
 
+        for (category_id, group_id), target_product_ids in wanted_by_group.items():
+            # The file inside is usually named 'prices' (no extension) which contains JSON
+            group_file = archive_index[category_id][1].get(group_id)
+            
+            day_prices = {}
+            if group_file is not None and group_file.exists():
+                try:
+                    # Only the rows of the products we want are decoded
+                    day_prices = read_group_prices(group_file, target_product_ids)
+                except Exception as e:
+                    # Not evidence that upstream has no price: leave the day to be retried
+                    # rather than marking these products missing for good
+                    print(f" [Could not read prices of group {group_id}: {e}]")
+                    cleanup_files(archive_filename, extracted_folder)
+                    return 'failed'
+
+            # Save requested products
+            for pid in target_product_ids:
+                val = day_prices.get(pid)
+                if val is None:
+                    # The group's file was read (or the archive has no such group) and
+                    # holds no price for the product
+                    price_coverage.mark_missing(coverage, group_id, pid, day)
+                    continue
+
+                # Write file
+                out_dir = Path(output_folder) / group_id / pid
+                out_dir.mkdir(parents=True, exist_ok=True)
+                
+                out_file = out_dir / f"{date_str}.json"
+                with open(out_file, 'w') as of:
+                    json.dump({
+                        'date': date_str,
+                        'group_id': group_id,
+                        'product_id': pid,
+                        'marketPrice': float(val)
+                    }, of)
+                price_coverage.mark_present(coverage, group_id, pid, day)
+                found_count += 1
+        
+        print(f" [OK - Saved {found_count} prices]")
+        cleanup_files(archive_filename, extracted_folder)
+        return 'ok'
 
+    except Exception as e:
+        print(f" [Error: {e}]")
+        cleanup_files(archive_filename, extracted_folder)
+        return 'failed'
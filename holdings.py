@@ -0,0 +1,194 @@
+import os
+import csv
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime, date
+import numpy as np
+from functions import get_mappings_file, get_price_for_date, load_config, read_last_tracker_date
+from ledger import ADDS, REMOVES, CACHE_DIR, load_ledger
+from shared_files import write_json
+
+SNAPSHOT_FILE = os.path.join(CACHE_DIR, "holdings_snapshots.json")
+SNAPSHOT_INTERVAL_DAYS = 7
+SNAPSHOT_VERSION = 1
+
+TRACKER_FILE = "daily_tracker.csv"
+HOLDINGS_COLUMNS = ['Product Name', 'group_id', 'product_id', 'Quantity', 'Latest Price', 'Total Value']
+
+# Point-in-time holdings
+# ----------------------
+# Every SNAPSHOT_INTERVAL_DAYS days (counted from the configured start_date) the
+# inventory is saved together with the ledger position it was taken at. The ledger
+# is sorted by day, so the rows received between a snapshot and any later date are a
+# single slice found with searchsorted (the per-day transaction index). A query is
+# one snapshot load plus at most a week of deltas.
+#
+# Snapshots are derived from the ledger alone and tagged with its digest and the
+# start date, so they are rebuilt whenever either changes.
+
+def apply_quantity(inventory, key, tx_type, qty):
+    """Apply one transaction to {(gid, pid): qty} the same way run_analysis does."""
+    if tx_type in ADDS:
+        inventory[key] = inventory.get(key, 0) + qty
+    elif tx_type in REMOVES:
+        inventory[key] = inventory.get(key, 0) - qty
+        if inventory[key] < 0: inventory[key] = 0
+
+def _apply_rows(inventory, rows):
+    for g_id, p_id, tx_type, qty in zip(rows['group_id'].tolist(), rows['product_id'].tolist(),
+                                        rows['tx_type'].tolist(), rows['quantity'].tolist()):
+        apply_quantity(inventory, (str(g_id), str(p_id)), tx_type, qty)
+
+def _digest(ledger, start_day):
+    return hashlib.sha256(ledger.tobytes() + str(start_day).encode('ascii')).hexdigest()
+
+def build_snapshots(ledger, start_day):
+    """
+    Inventory as of the end of start_day + k * SNAPSHOT_INTERVAL_DAYS for every k up
+    to the last ledger day. Each snapshot records 'pos', the number of ledger rows
+    applied, and the inventory in insertion order (the order current_holdings.csv uses).
+    """
+    days = ledger['day']
+    first = int(np.searchsorted(days, start_day))
+    snapshots = []
+    if first == len(ledger):
+        return snapshots
+
+    inventory = {}
+    pos = first
+    for snap_day in range(start_day, int(days[-1]) + 1, SNAPSHOT_INTERVAL_DAYS):
+        hi = int(np.searchsorted(days, snap_day + 1))
+        _apply_rows(inventory, ledger[pos:hi])
+        pos = hi
+        snapshots.append({
+            'day': snap_day,
+            'pos': pos,
+            'inventory': [[g_id, p_id, qty] for (g_id, p_id), qty in inventory.items()],
+        })
+    return snapshots
+
+def save_snapshots(ledger, start_day, path=SNAPSHOT_FILE):
+    snapshots = build_snapshots(ledger, start_day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json(path, {
+        'version': SNAPSHOT_VERSION,
+        'digest': _digest(ledger, start_day),
+        'interval_days': SNAPSHOT_INTERVAL_DAYS,
+        'snapshots': snapshots,
+    })
+    return snapshots
+
+def load_snapshots(ledger, start_day, path=SNAPSHOT_FILE):
+    """Snapshots for this ledger and start day, rebuilding them if they are missing or stale."""
+    try:
+        with open(path, 'r') as f:
+            saved = json.load(f)
+        if saved.get('version') == SNAPSHOT_VERSION and saved.get('interval_days') == SNAPSHOT_INTERVAL_DAYS \
+                and saved.get('digest') == _digest(ledger, start_day):
+            return saved['snapshots']
+    except (OSError, ValueError):
+        pass
+    return save_snapshots(ledger, start_day, path)
+
+def inventory_at(day, ledger=None, start_day=None, snapshots=None):
+    """
+    {(gid, pid): qty} at the end of the given day ordinal (insertion order preserved).
+    snapshots: already loaded load_snapshots(ledger, start_day), for callers that keep them in memory.
+    """
+    if ledger is None:
+        ledger = load_ledger()
+    if start_day is None:
+        start_day = _config_start_day()
+
+    inventory = {}
+    if day < start_day:
+        return inventory
+
+    if snapshots is None:
+        snapshots = load_snapshots(ledger, start_day)
+    pos = int(np.searchsorted(ledger['day'], start_day))
+    # Latest snapshot on or before the day (they are evenly spaced from start_day)
+    k = min((day - start_day) // SNAPSHOT_INTERVAL_DAYS, len(snapshots) - 1)
+    if k >= 0:
+        snap = snapshots[k]
+        inventory = {(g_id, p_id): qty for g_id, p_id, qty in snap['inventory']}
+        pos = snap['pos']
+
+    hi = int(np.searchsorted(ledger['day'], day + 1))
+    _apply_rows(inventory, ledger[pos:hi])
+    return inventory
+
+def _config_start_day():
+    return datetime.strptime(load_config()["start_date"], '%Y-%m-%d').date().toordinal()
+
+def load_name_map():
+    name_map = {}
+    try:
+        with open(get_mappings_file(), 'r') as mf:
+            for item in json.load(mf):
+                name_map[(str(item.get('group_id', '')), str(item.get('product_id', '')))] = item.get('name', 'Unknown')
+    except Exception as e:
+        print(f"Warning: Could not load mappings: {e}")
+    return name_map
+
+def holdings_on(date_str, name_map=None, historical_folder='historical_prices'):
+    """
+    What was held at the end of date_str ('YYYY-MM-DD') and what it was worth that day,
+    as rows with the same columns as current_holdings.csv.
+    """
+    day = datetime.strptime(date_str, '%Y-%m-%d').date().toordinal()
+    if name_map is None:
+        name_map = load_name_map()
+
+    rows = []
+    for (g_id, p_id), qty in inventory_at(day).items():
+        if qty > 0:
+            price = get_price_for_date(g_id, p_id, date_str, historical_folder)
+            rows.append({
+                'Product Name': name_map.get((g_id, p_id), "Unknown"),
+                'group_id': g_id,
+                'product_id': p_id,
+                'Quantity': qty,
+                'Latest Price': price,
+                'Total Value': price * qty
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what was held on a given date and what it was worth.")
+    parser.add_argument('date', nargs='?', help="YYYY-MM-DD (default: the last day in daily_tracker.csv)")
+    parser.add_argument('--csv', metavar='FILE', help="Write the rows to FILE ('-' for stdout) with the columns of current_holdings.csv")
+    args = parser.parse_args()
+
+    if args.date is None:
+        last_date = read_last_tracker_date(TRACKER_FILE) if os.path.exists(TRACKER_FILE) else None
+        args.date = (last_date or date.today()).strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(args.date, '%Y-%m-%d')
+    except ValueError:
+        parser.error(f"invalid date '{args.date}', expected YYYY-MM-DD")
+
+    # A running tracker_daemon.py already has the ledger and prices in memory
+    from tracker_daemon import query
+    result = query('/holdings', date=args.date)
+    rows = result['holdings'] if result is not None and 'holdings' in result else holdings_on(args.date)
+
+    if args.csv:
+        out = sys.stdout if args.csv == '-' else open(args.csv, 'w', newline='')
+        writer = csv.DictWriter(out, fieldnames=HOLDINGS_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        if out is not sys.stdout:
+            out.close()
+            print(f"{len(rows)} holdings on {args.date} written to {args.csv}")
+        return
+
+    total = sum(r['Total Value'] for r in rows)
+    print(f"Holdings on {args.date}: {len(rows)} products, ${total:,.2f}")
+    for r in sorted(rows, key=lambda r: -r['Total Value']):
+        print(f"  {r['Quantity']:>6g} x {r['Product Name'][:50]:<50} ${r['Latest Price']:>9,.2f}  ${r['Total Value']:>10,.2f}")
+
+if __name__ == "__main__":
+    main()
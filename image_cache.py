@@ -0,0 +1,133 @@
+import os
+import json
+import time
+from io import BytesIO
+from functions import get_mappings_file
+from shared_files import atomic_write
+
+IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+# Oldest-used thumbnails are evicted once the cache grows past this
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+THUMBNAIL_SIZE = 96
+# After a failed download, don't ask upstream again for this long
+RETRY_AFTER_SECONDS = 3600
+FETCH_TIMEOUT_SECONDS = 5
+
+CDN_URL = "https://tcgplayer-cdn.tcgplayer.com/product/{product_id}_200w.jpg"
+
+# Shown when there is no cached image and upstream can't be reached
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="96" height="96" viewBox="0 0 96 96">'
+    '<rect width="96" height="96" rx="8" fill="#e9ecef"/>'
+    '<path d="M28 64l14-18 10 12 7-9 9 15z" fill="#adb5bd"/><circle cx="62" cy="36" r="6" fill="#adb5bd"/>'
+    '</svg>'
+)
+
+def _paths(product_id, size):
+    base = os.path.join(IMAGE_CACHE_DIR, f"{product_id}_{size}")
+    return base + ".img", base + ".miss"
+
+def image_url_for(product_id):
+    """Upstream image URL from mappings.json or the local catalog, or the CDN's usual URL for the product."""
+    try:
+        with open(get_mappings_file(), 'r') as f:
+            for m in json.load(f):
+                if str(m.get('product_id')) == str(product_id) and m.get('imageUrl'):
+                    return m['imageUrl']
+    except (OSError, ValueError):
+        pass
+    try:
+        import catalog
+        info = catalog.product_info(product_id)
+        if info and info['imageUrl']:
+            return info['imageUrl']
+    except Exception:
+        pass
+    return CDN_URL.format(product_id=product_id)
+
+def sniff_mimetype(data):
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'image/jpeg'
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """
+    Shrink an image to fit size x size as a JPEG. Needs Pillow; without it (or for
+    anything Pillow can't read) the original bytes are kept, which for the CDN's
+    200px images is still small.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.thumbnail((size, size))
+            out = BytesIO()
+            img.convert('RGB').save(out, format='JPEG', quality=85, optimize=True)
+            return out.getvalue()
+    except Exception:
+        return data
+
+def _evict(max_bytes=MAX_CACHE_BYTES):
+    """Delete least recently used files until the cache fits in max_bytes."""
+    entries = []
+    total = 0
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        if entry.is_file() and entry.name.endswith('.img'):
+            stat = entry.stat()
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            total += stat.st_size
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def get_thumbnail(product_id, size=THUMBNAIL_SIZE):
+    """
+    Path of the cached thumbnail for product_id, downloading and shrinking it on
+    first use. Returns None if it isn't cached and can't be fetched right now.
+    """
+    image_path, miss_path = _paths(product_id, size)
+    if os.path.exists(image_path):
+        # Mark as recently used for eviction. Only the access time changes, so the
+        # mtime-based ETag the browser revalidates against stays the same.
+        try:
+            os.utime(image_path, (time.time(), os.path.getmtime(image_path)))
+        except OSError:
+            pass
+        return image_path
+
+    if os.path.exists(miss_path) and time.time() - os.path.getmtime(miss_path) < RETRY_AFTER_SECONDS:
+        return None
+
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    try:
+        import requests
+        resp = requests.get(image_url_for(product_id), timeout=FETCH_TIMEOUT_SECONDS)
+        resp.raise_for_status()
+        data = make_thumbnail(resp.content, size)
+    except Exception as e:
+        print(f"  ⚠️  Warning: Could not fetch image for product {product_id}: {e}")
+        with open(miss_path, 'w'):
+            pass
+        return None
+
+    # Threads of one web worker fetch the same product at once (one <img> per
+    # transaction row); each writes its own temp file and the last rename wins
+    with atomic_write(image_path, 'wb') as f:
+        f.write(data)
+    try:
+        os.remove(miss_path)
+    except FileNotFoundError:
+        pass
+    _evict()
+    return image_path
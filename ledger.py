@@ -0,0 +1,175 @@
+import os
+import csv
+import hashlib
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from enum import IntEnum
+import numpy as np
+
+CACHE_DIR = ".cache"
+
+# Bump when the parsed layout or parsing rules change so stale caches are ignored
+LEDGER_FORMAT = 2
+
+class TxType(IntEnum):
+    UNKNOWN = 0
+    BUY = 1
+    PULL = 2   # A BUY at $0 cost (cards pulled from an opened product)
+    SELL = 3
+    OPEN = 4
+    TRADE = 5
+
+# Transaction types that add to / remove from the quantity held
+ADDS = (TxType.BUY, TxType.PULL)
+REMOVES = (TxType.SELL, TxType.OPEN, TxType.TRADE)
+
+LEDGER_DTYPE = np.dtype([
+    ('row', np.int32),            # Row number in transactions.csv (0 = first data row)
+    ('day', np.int32),            # date.toordinal() of 'Date Recieved'
+    ('group_id', np.int64),
+    ('product_id', np.int64),
+    ('tx_type', np.int8),         # TxType
+    ('quantity', np.float64),
+    ('price_cents', np.float64),  # Price Per Unit in cents
+    ('lot_row', np.int32),        # Optional 'Lot' column: row of the BUY/PULL a SELL/OPEN draws from, -1 = FIFO
+])
+
+# In-process cache so every stage of one run shares a single parse: {sha256: ledger}
+_loaded = {}
+
+def _parse_day(value):
+    value = str(value).strip()
+    for fmt in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).date().toordinal()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+def _parse_id(value):
+    # IDs sometimes come through as floats ("23651.0")
+    return int(float(value))
+
+def _parse_quantity(value):
+    value = str(value).strip() if value is not None else ''
+    # Missing Quantity defaults to 1.0 so "OPEN" rows without quantity still work
+    return float(value) if value else 1.0
+
+def _parse_cents(value):
+    clean = str(value).replace('$', '').replace(',', '').strip() if value is not None else ''
+    if not clean:
+        return 0.0
+    try:
+        # Decimal keeps "$28.58" exact (2858 cents) so cents / 100 round-trips to float("28.58")
+        return float(Decimal(clean) * 100)
+    except InvalidOperation:
+        raise ValueError(f"Unrecognised price '{value}'")
+
+def _parse_lot(value):
+    value = str(value).strip() if value is not None else ''
+    return int(float(value)) if value else -1
+
+def _parse_type(value):
+    try:
+        return TxType[str(value).strip().upper()]
+    except KeyError:
+        return TxType.UNKNOWN
+
+def parse_ledger(transactions_file):
+    """
+    Parse transactions.csv into a LEDGER_DTYPE array sorted by day (file order within a day).
+    Rows with an unusable date, ID, quantity or price are skipped with a warning.
+    """
+    records = []
+    skipped = 0
+    with open(transactions_file, 'r', newline='') as f:
+        for row_number, tx in enumerate(csv.DictReader(f)):
+            try:
+                records.append((
+                    row_number,
+                    _parse_day(tx['Date Recieved']),
+                    _parse_id(tx['group_id']),
+                    _parse_id(tx['product_id']),
+                    int(_parse_type(tx['Transaction Type'])),
+                    _parse_quantity(tx.get('Quantity')),
+                    _parse_cents(tx.get('Price Per Unit')),
+                    _parse_lot(tx.get('Lot')),
+                ))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+
+    if skipped:
+        print(f"  - Note: skipped {skipped} transaction(s) with an unreadable date, ID, quantity or price.")
+
+    ledger = np.array(records, dtype=LEDGER_DTYPE)
+    return ledger[np.argsort(ledger['day'], kind='stable')]
+
+def load_ledger(transactions_file=None):
+    """
+    Return the parsed ledger for transactions_file (defaults to the configured file).
+    Parsing happens at most once per file version: results are kept in memory for the
+    rest of the run and on disk under CACHE_DIR, keyed by the file's sha256.
+    """
+    if transactions_file is None:
+        from functions import get_transactions_file
+        transactions_file = get_transactions_file()
+
+    if not os.path.exists(transactions_file):
+        return np.zeros(0, dtype=LEDGER_DTYPE)
+
+    with open(transactions_file, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    if digest in _loaded:
+        return _loaded[digest]
+
+    cache_path = os.path.join(CACHE_DIR, f"ledger-v{LEDGER_FORMAT}-{digest}.npy")
+    ledger = None
+    if os.path.exists(cache_path):
+        try:
+            ledger = np.load(cache_path, allow_pickle=False)
+            if ledger.dtype != LEDGER_DTYPE:
+                ledger = None
+        except (ValueError, OSError):
+            ledger = None
+
+    if ledger is None:
+        ledger = parse_ledger(transactions_file)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Older versions of the ledger are dead weight once the file changes
+            for name in os.listdir(CACHE_DIR):
+                if name.startswith("ledger-"):
+                    os.remove(os.path.join(CACHE_DIR, name))
+            tmp_path = cache_path + ".tmp.npy"
+            np.save(tmp_path, ledger, allow_pickle=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"  ⚠️  Warning: Could not cache parsed ledger: {e}")
+
+    _loaded.clear()
+    _loaded[digest] = ledger
+    return ledger
+
+def price_per_unit(ledger):
+    """Price Per Unit in dollars, as a float array."""
+    return ledger['price_cents'] / 100
+
+def day_to_date(day):
+    return date.fromordinal(int(day))
+
+def day_slice(ledger, day):
+    """Rows received on the given day ordinal (the ledger is sorted by day)."""
+    lo, hi = np.searchsorted(ledger['day'], [day, day + 1])
+    return ledger[lo:hi]
+
+def product_keys(ledger):
+    """Unique (group_id, product_id) string pairs, in order of first transaction."""
+    keys = []
+    seen = set()
+    for g_id, p_id in zip(ledger['group_id'].tolist(), ledger['product_id'].tolist()):
+        key = (str(g_id), str(p_id))
+        if key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
@@ -0,0 +1,202 @@
+import os
+import json
+import hashlib
+from datetime import date
+from ledger import ADDS, REMOVES, TxType, _parse_lot
+from shared_files import write_json
+
+LOTS_STATE_FILE = "lots_state.json"
+DAILY_PNL_FILE = "daily_pnl.csv"
+PRODUCT_PNL_FILE = "product_pnl.csv"
+
+STATE_VERSION = 1
+
+# Quantities below this are treated as zero (float noise from fractional rows)
+EPSILON = 1e-9
+
+# Lot matching
+# ------------
+# Every BUY/PULL opens a lot [quantity, unit_cost, acquired_day, ledger_row] in its
+# product's queue (PULLs cost $0). SELL/OPEN/TRADE rows draw from the queue oldest
+# first (FIFO). A row that fills the optional 'Lot' column with the row number of
+# a BUY/PULL draws from that lot first (specific identification), then falls back
+# to FIFO for whatever is left. Deleting a row in the web app renumbers the Lot
+# references to the rows after it (renumber_lot_refs) and is refused while a row
+# still names it; edit transactions.csv by hand with the same care.
+#
+# SELL: realized P&L = proceeds - cost of the lots consumed.
+# OPEN/TRADE: the consumed cost is recorded as "opened cost" (the product became
+# cards, which come back as PULLs); it is not counted as a realized loss.
+
+def new_state():
+    return {
+        'version': STATE_VERSION,
+        'through_day': None,     # Ordinal of the last ledger day applied
+        'ledger_digest': None,   # Digest of the ledger rows up to through_day
+        'lots': {},              # "gid/pid" -> [[qty, unit_cost, day, row], ...] oldest first
+        'open_cost': {},         # "gid/pid" -> cost of the lots still held
+        'realized': {},          # "gid/pid" -> realized P&L from SELLs
+        'proceeds': {},          # "gid/pid" -> SELL proceeds
+        'opened_cost': {},       # "gid/pid" -> cost consumed by OPEN/TRADE
+        'disposals': [],         # [key, acquired_day, disposed_day, qty, cost, proceeds, tx_type]
+    }
+
+def _key(g_id, p_id):
+    return f"{g_id}/{p_id}"
+
+def _add(bucket, key, amount):
+    bucket[key] = bucket.get(key, 0.0) + amount
+
+def apply_transaction(state, tx):
+    """
+    Apply one ledger row (a LEDGER_DTYPE record) to the lot state in place.
+    Only the affected product's queue is touched.
+    """
+    key = _key(int(tx['group_id']), int(tx['product_id']))
+    tx_type = int(tx['tx_type'])
+    qty = float(tx['quantity'])
+    unit_price = float(tx['price_cents']) / 100
+    day = int(tx['day'])
+
+    if tx_type in ADDS:
+        unit_cost = 0.0 if tx_type == TxType.PULL else unit_price
+        state['lots'].setdefault(key, []).append([qty, unit_cost, day, int(tx['row'])])
+        _add(state['open_cost'], key, qty * unit_cost)
+        return
+
+    if tx_type not in REMOVES:
+        return
+
+    queue = state['lots'].setdefault(key, [])
+    remaining = qty
+    consumed_cost = 0.0
+
+    order = list(range(len(queue)))
+    lot_row = int(tx['lot_row'])
+    if lot_row >= 0:
+        # Specific identification: the named lot goes first
+        order.sort(key=lambda i: queue[i][3] != lot_row)
+
+    for i in order:
+        if remaining <= EPSILON:
+            break
+        lot = queue[i]
+        take = min(lot[0], remaining)
+        if take <= EPSILON:
+            continue
+        cost = take * lot[1]
+        proceeds = take * unit_price if tx_type == TxType.SELL else 0.0
+        state['disposals'].append([key, lot[2], day, take, cost, proceeds, TxType(tx_type).name])
+        lot[0] -= take
+        remaining -= take
+        consumed_cost += cost
+
+    state['lots'][key] = [lot for lot in queue if lot[0] > EPSILON]
+    _add(state['open_cost'], key, -consumed_cost)
+
+    if tx_type == TxType.SELL:
+        proceeds = qty * unit_price
+        _add(state['proceeds'], key, proceeds)
+        # Selling more than we hold: the excess has no basis, so it's all gain
+        _add(state['realized'], key, proceeds - consumed_cost)
+    else:
+        _add(state['opened_cost'], key, consumed_cost)
+
+def renumber_lot_refs(lot_values, deleted_row):
+    """
+    The 'Lot' column (one value per transactions.csv row) for when row deleted_row
+    is removed: references to later rows move down by one, since those rows shift up.
+    Returns (values without the deleted row's, rows whose Lot names deleted_row).
+    """
+    values, referencing = [], []
+    for row, value in enumerate(lot_values):
+        try:
+            lot_row = _parse_lot(value)
+        except (ValueError, TypeError):
+            lot_row = -1
+        if lot_row == deleted_row:
+            referencing.append(row)
+        if row == deleted_row:
+            continue
+        values.append(lot_row - 1 if lot_row > deleted_row else value)
+    return values, referencing
+
+def ledger_digest(ledger, through_day):
+    """Digest of every ledger row received on or before through_day."""
+    return hashlib.sha256(ledger[ledger['day'] <= through_day].tobytes()).hexdigest()
+
+def load_state(path=LOTS_STATE_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+        return state if state.get('version') == STATE_VERSION else None
+    except (ValueError, OSError):
+        return None
+
+def save_state(state, ledger, path=LOTS_STATE_FILE):
+    state['ledger_digest'] = ledger_digest(ledger, state['through_day']) if state['through_day'] is not None else None
+    write_json(path, state)
+
+def state_for_resume(ledger, resume_day, path=LOTS_STATE_FILE):
+    """
+    Returns a lot state that can be carried forward from resume_day.
+    The saved state is reused when it covers only days before resume_day and the
+    ledger rows up to its day are unchanged; the caller then only applies rows
+    after state['through_day']. Otherwise a fresh state is returned (replay everything).
+    """
+    state = load_state(path)
+    if state is None or state['through_day'] is None:
+        return new_state()
+    if state['through_day'] >= resume_day:
+        return new_state()
+    if state['ledger_digest'] != ledger_digest(ledger, state['through_day']):
+        return new_state()
+    return state
+
+def total_open_cost(state):
+    return sum(state['open_cost'].values())
+
+def total_realized(state):
+    return sum(state['realized'].values())
+
+def product_report(state, inventory, prices, name_map, as_of_day):
+    """
+    Per-product P&L rows (for product_pnl.csv) as of as_of_day.
+    inventory: {(gid, pid): qty}; prices: {(gid, pid): latest price}.
+    """
+    rows = []
+    keys = set(state['lots']) | set(state['realized']) | set(state['opened_cost'])
+    for key in sorted(keys):
+        g_id, p_id = key.split('/')
+        qty = inventory.get((g_id, p_id), 0)
+        price = prices.get((g_id, p_id), 0.0)
+        lots = state['lots'].get(key, [])
+        open_cost = state['open_cost'].get(key, 0.0)
+        market_value = price * qty if qty > 0 else 0.0
+
+        held = sum(lot[0] for lot in lots)
+        avg_days_held = (sum(lot[0] * (as_of_day - lot[2]) for lot in lots) / held) if held > EPSILON else None
+
+        sold = [d for d in state['disposals'] if d[0] == key and d[6] == TxType.SELL.name]
+        sold_qty = sum(d[3] for d in sold)
+        avg_days_to_sell = (sum(d[3] * (d[2] - d[1]) for d in sold) / sold_qty) if sold_qty > EPSILON else None
+
+        rows.append({
+            'Product Name': name_map.get((g_id, p_id), "Unknown"),
+            'group_id': g_id,
+            'product_id': p_id,
+            'Quantity': qty,
+            'Open Lots': len(lots),
+            'Open Cost': round(open_cost, 2),
+            'Market Value': round(market_value, 2),
+            'Unrealized P&L': round(market_value - open_cost, 2) if held > EPSILON else 0.0,
+            'Realized P&L': round(state['realized'].get(key, 0.0), 2),
+            'Proceeds': round(state['proceeds'].get(key, 0.0), 2),
+            'Opened Cost': round(state['opened_cost'].get(key, 0.0), 2),
+            'Avg Days Held': round(avg_days_held, 1) if avg_days_held is not None else None,
+            'Avg Days To Sell': round(avg_days_to_sell, 1) if avg_days_to_sell is not None else None,
+            'As Of': date.fromordinal(as_of_day).strftime('%Y-%m-%d'),
+        })
+    return rows
@@ -0,0 +1,257 @@
+import os
+import json
+import argparse
+from datetime import datetime
+import numpy as np
+from functions import json_loads
+from shared_files import write_json
+
+MARKET_FOLDER = "market_prices"
+# Category scanned for the movers report (Pokemon)
+MARKET_CATEGORY_ID = "3"
+REPORT_FILE = "movers_report.json"
+WATCHLIST_FILE = "watchlist.json"
+
+# Day-over-day plus this many days back
+LOOKBACK_DAYS = 7
+# Daily snapshots kept on disk; enough for the lookback plus archive gaps
+KEEP_DAYS = 31
+# Products cheaper than this on both days are left out of the rankings (penny-card noise)
+MIN_PRICE = 1.00
+TOP_N = 25
+# Default move (in %) that flags a watchlist product
+WATCH_THRESHOLD_PCT = 10.0
+
+def scan_category(category_path):
+    """
+    Read every group's prices file under an extracted category folder (e.g. temp_extract_X/3)
+    and return (group_ids, product_ids, prices) arrays sorted by product_id.
+    Products without a market price get NaN. When a product is listed more than once
+    (e.g. Normal and Holofoil) the last entry wins, matching the holdings ingest.
+    """
+    loads = json_loads()
+    group_parts, product_parts, price_parts = [], [], []
+    for group_entry in os.scandir(category_path):
+        prices_file = os.path.join(group_entry.path, "prices")
+        if not group_entry.is_dir() or not os.path.exists(prices_file):
+            continue
+        try:
+            group_id = int(group_entry.name)
+            with open(prices_file, 'rb') as f:
+                results = loads(f.read()).get('results', [])
+        except (ValueError, OSError, AttributeError):
+            continue
+        if not results:
+            continue
+        product_parts.append(np.fromiter((r.get('productId') or 0 for r in results), dtype=np.int64, count=len(results)))
+        price_parts.append(np.array([r.get('marketPrice') for r in results], dtype=np.float64))
+        group_parts.append(np.full(len(results), group_id, dtype=np.int64))
+
+    if not product_parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+
+    group_ids = np.concatenate(group_parts)
+    product_ids = np.concatenate(product_parts)
+    prices = np.concatenate(price_parts)
+
+    # Keep the last occurrence of each product: unique over the reversed arrays
+    _, last_idx = np.unique(product_ids[::-1], return_index=True)
+    keep = len(product_ids) - 1 - last_idx
+    return group_ids[keep], product_ids[keep], prices[keep]
+
+def record_day(category_path, day, folder=MARKET_FOLDER):
+    """
+    Save one day's category-wide market prices as a compact snapshot.
+    Called from the price ingest while the day's archive is still extracted,
+    so the scan never needs its own download.
+    """
+    group_ids, product_ids, prices = scan_category(category_path)
+    if not len(product_ids):
+        return 0
+
+    os.makedirs(folder, exist_ok=True)
+    date_str = day.strftime('%Y-%m-%d')
+    tmp_path = os.path.join(folder, f".{date_str}.tmp.npz")
+    np.savez_compressed(tmp_path, group_id=group_ids.astype(np.int32), product_id=product_ids, price=prices.astype(np.float32))
+    os.replace(tmp_path, os.path.join(folder, f"{date_str}.npz"))
+    prune_snapshots(folder)
+    return len(product_ids)
+
+def prune_snapshots(folder=MARKET_FOLDER, keep_days=KEEP_DAYS):
+    days = list_snapshot_days(folder)
+    for old in days[:-keep_days]:
+        os.remove(os.path.join(folder, f"{old}.npz"))
+
+def list_snapshot_days(folder=MARKET_FOLDER):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-4] for name in os.listdir(folder) if name.endswith('.npz') and not name.startswith('.'))
+
+def load_snapshot(date_str, folder=MARKET_FOLDER):
+    with np.load(os.path.join(folder, f"{date_str}.npz")) as data:
+        return data['group_id'], data['product_id'], data['price'].astype(np.float64)
+
+def price_changes(product_ids, prices, base_product_ids, base_prices):
+    """
+    Percent change from base to current for every product in the current snapshot
+    (both arrays sorted by product_id). NaN where the base has no price.
+    """
+    base_price = np.full(len(product_ids), np.nan)
+    if len(base_product_ids):
+        idx = np.searchsorted(base_product_ids, product_ids)
+        idx[idx == len(base_product_ids)] = 0
+        found = base_product_ids[idx] == product_ids
+        base_price[found] = base_prices[idx[found]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(base_price > 0, (prices - base_price) / base_price * 100, np.nan)
+    return base_price, change
+
+def _pick_base_day(days, latest, lookback):
+    """Latest snapshot at least `lookback` days before `latest` (archives have gaps)."""
+    latest_ordinal = datetime.strptime(latest, '%Y-%m-%d').date().toordinal()
+    candidates = [d for d in days if datetime.strptime(d, '%Y-%m-%d').date().toordinal() <= latest_ordinal - lookback]
+    return candidates[-1] if candidates else None
+
+def load_watchlist(path=WATCHLIST_FILE):
+    """
+    Watchlist entries: a product ID, or {"product_id": ..., "threshold_pct": ..., "name": ...}.
+    Returns {product_id (int): {'threshold_pct': float, 'name': str or None}}.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        raw = json.load(f)
+
+    watchlist = {}
+    for entry in raw:
+        if not isinstance(entry, dict):
+            entry = {'product_id': entry}
+        try:
+            pid = int(float(entry['product_id']))
+        except (KeyError, ValueError, TypeError):
+            continue
+        watchlist[pid] = {
+            'threshold_pct': float(entry.get('threshold_pct', WATCH_THRESHOLD_PCT)),
+            'name': entry.get('name'),
+        }
+    return watchlist
+
+def _load_names():
+    """(product_id -> name) for products we have mappings for."""
+    from functions import get_mappings_file
+    try:
+        with open(get_mappings_file(), 'r') as f:
+            return {int(m['product_id']): m.get('name') for m in json.load(f)}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def _ranked(order, limit, columns):
+    rows = []
+    for i in order[:limit]:
+        rows.append({name: _jsonable(values[i]) for name, values in columns.items()})
+    return rows
+
+def _jsonable(value):
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else round(float(value), 2)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def build_report(folder=MARKET_FOLDER, lookback=LOOKBACK_DAYS, top_n=TOP_N,
+                 watchlist_file=WATCHLIST_FILE, output=REPORT_FILE):
+    """
+    Rank day-over-day and `lookback`-day movers across the latest market snapshot
+    and flag watchlist products whose move exceeds their threshold. Writes `output`
+    and returns the report dict (None if there are no snapshots).
+    """
+    days = list_snapshot_days(folder)
+    if not days:
+        return None
+
+    latest = days[-1]
+    group_ids, product_ids, prices = load_snapshot(latest, folder)
+    names = _load_names()
+
+    report = {
+        'date': latest,
+        'products_scanned': int(np.count_nonzero(~np.isnan(prices))),
+        'compared_to': {},
+        'movers': {},
+        'watchlist': [],
+    }
+
+    changes = {}
+    for label, lookback_days in (('1d', 1), (f'{lookback}d', lookback)):
+        base_day = _pick_base_day(days, latest, lookback_days)
+        if base_day is None:
+            continue
+        _, base_products, base_prices = load_snapshot(base_day, folder)
+        base_price, change = price_changes(product_ids, prices, base_products, base_prices)
+        changes[label] = change
+        report['compared_to'][label] = base_day
+
+        # Rank only products with a real price on both days
+        rankable = ~np.isnan(change) & ((prices >= MIN_PRICE) | (base_price >= MIN_PRICE))
+        idx = np.flatnonzero(rankable)
+        by_change = idx[np.argsort(change[idx], kind='stable')]
+        columns = {
+            'product_id': product_ids,
+            'group_id': group_ids,
+            'price': prices,
+            'previous_price': base_price,
+            'change_pct': change,
+        }
+        gainers = _ranked(by_change[::-1], top_n, columns)
+        losers = _ranked(by_change, top_n, columns)
+        for row in gainers + losers:
+            row['name'] = names.get(row['product_id'])
+        report['movers'][label] = {'gainers': gainers, 'losers': losers}
+
+    watchlist = load_watchlist(watchlist_file)
+    for pid, entry in watchlist.items():
+        i = np.searchsorted(product_ids, pid)
+        row = {'product_id': pid, 'name': entry['name'] or names.get(pid), 'threshold_pct': entry['threshold_pct']}
+        if i < len(product_ids) and product_ids[i] == pid:
+            row['group_id'] = int(group_ids[i])
+            row['price'] = _jsonable(prices[i])
+            moves = {label: _jsonable(change[i]) for label, change in changes.items()}
+            row['change_pct'] = moves
+            row['flagged'] = any(m is not None and abs(m) >= entry['threshold_pct'] for m in moves.values())
+        else:
+            row['price'] = None
+            row['change_pct'] = {}
+            row['flagged'] = False
+        report['watchlist'].append(row)
+
+    write_json(output, report, indent=2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank market-wide price movers from stored daily snapshots.")
+    parser.add_argument('--lookback', type=int, default=LOOKBACK_DAYS, help="N for the N-day change (default: %(default)s)")
+    parser.add_argument('--top', type=int, default=TOP_N, help="Products per gainers/losers list")
+    parser.add_argument('--watchlist', default=WATCHLIST_FILE)
+    args = parser.parse_args()
+
+    report = build_report(lookback=args.lookback, top_n=args.top, watchlist_file=args.watchlist)
+    if report is None:
+        print(f"No market snapshots in {MARKET_FOLDER}/ yet. They are recorded during the daily price update.")
+        return
+
+    print(f"Market movers for {report['date']} ({report['products_scanned']} priced products)")
+    for label, movers in report['movers'].items():
+        print(f"\n  Top {label} gainers (vs {report['compared_to'][label]}):")
+        for row in movers['gainers'][:10]:
+            print(f"    {row['product_id']:>8}  ${row['price']:>9,.2f}  {row['change_pct']:+7.1f}%  {row['name'] or ''}")
+    flagged = [w for w in report['watchlist'] if w['flagged']]
+    if flagged:
+        print("\n  Watchlist alerts:")
+        for row in flagged:
+            print(f"    {row['product_id']:>8}  {row['name'] or ''}  {row['change_pct']}")
+    print(f"\nReport written to {REPORT_FILE}")
+
+if __name__ == "__main__":
+    main()
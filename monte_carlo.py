@@ -0,0 +1,219 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from functions import load_price_history
+from shared_files import write_json
+
+HOLDINGS_FILE = "current_holdings.csv"
+OUTPUT_FILE = "monte_carlo.json"
+
+PERCENTILES = [5, 25, 50, 75, 95]
+# Paths simulated per block; each block has its own seed, so results don't depend on the worker count
+BLOCK_PATHS = 5000
+# Days between reported percentile bands
+DEFAULT_STEP_DAYS = 7
+
+# How the projection works
+# ------------------------
+# Daily log returns come from each held product's price history, with the last price
+# carried forward over gaps (the same as risk_report.py), so a move across days
+# without a price lands on the day the price comes back instead of being dropped.
+# Days before a product's first price count as "no move", so one product with a
+# short history doesn't shrink everyone's sample.
+#
+# bootstrap: each simulated day replays a whole historical day, i.e. every product's
+#            return from the same date, which keeps sealed products moving together.
+# normal:    fits the mean vector and covariance of those returns and draws from the
+#            multivariate normal; a k-day block is then a single draw (k*mu, k*cov).
+#
+# Paths are simulated in blocks of BLOCK_PATHS with arrays of shape (paths, products),
+# so the only Python loop is over days (bootstrap) or checkpoints (normal).
+
+def load_holdings(path=HOLDINGS_FILE):
+    """Held products: list of (group_id, product_id), quantities, latest prices (0 if unknown), names."""
+    df = pd.read_csv(path, dtype={'group_id': str, 'product_id': str})
+    df = df[df['Quantity'] > 0]
+    products = list(zip(df['group_id'], df['product_id']))
+    return (products, df['Quantity'].to_numpy(dtype=float),
+            df['Latest Price'].to_numpy(dtype=float), df['Product Name'].tolist())
+
+def last_known_prices(prices):
+    """Most recent non-NaN price per product row (NaN if it has none)."""
+    has_price = ~np.isnan(prices)
+    last = prices.shape[1] - 1 - np.argmax(has_price[:, ::-1], axis=1)
+    return np.where(has_price.any(axis=1), prices[np.arange(len(prices)), last], np.nan)
+
+def forward_fill(prices):
+    """Carry each product's last price forward over NaN gaps (leading NaNs stay NaN)."""
+    if prices.size == 0:
+        return prices
+    idx = np.where(np.isnan(prices), 0, np.arange(prices.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return prices[np.arange(len(prices))[:, None], idx]
+
+def daily_log_returns(prices, lookback_days=None):
+    """
+    (days - 1, products) matrix of daily log returns from a (products, days) price
+    matrix, gaps forward-filled first; days before a product's first price are 0.
+    Only the last lookback_days are used (a price from before them still carries in).
+    """
+    filled = forward_fill(np.where(prices > 0, prices, np.nan))
+    if lookback_days:
+        filled = filled[:, -(lookback_days + 1):]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(filled)
+    returns = np.diff(logs, axis=1).T
+    observed = ~np.isnan(returns)
+    return np.where(observed, returns, 0.0), observed.sum(axis=0)
+
+def _checkpoints(horizon, step):
+    points = list(range(step, horizon, step)) + [horizon]
+    return np.array(points, dtype=np.int64)
+
+def _simulate_block(args):
+    """Portfolio value at each checkpoint for one block of paths: (n_paths, len(checkpoints))."""
+    returns, weights, checkpoints, n_paths, method, seed = args
+    rng = np.random.default_rng(seed)
+    n_products = returns.shape[1]
+    out = np.empty((n_paths, len(checkpoints)))
+    cum = np.zeros((n_paths, n_products))
+
+    if method == 'normal':
+        mu = returns.mean(axis=0)
+        cov = np.cov(returns, rowvar=False).reshape(n_products, n_products)
+        # eigh tolerates the singular covariances you get from products that never move
+        vals, vecs = np.linalg.eigh(cov)
+        scale = vecs * np.sqrt(np.clip(vals, 0, None))
+        prev = 0
+        for j, day in enumerate(checkpoints):
+            k = day - prev
+            z = rng.standard_normal((n_paths, n_products))
+            cum += k * mu + np.sqrt(k) * (z @ scale.T)
+            out[:, j] = np.exp(cum) @ weights
+            prev = day
+        return out
+
+    n_hist = len(returns)
+    j = 0
+    for day in range(1, checkpoints[-1] + 1):
+        cum += returns[rng.integers(0, n_hist, n_paths)]
+        if day == checkpoints[j]:
+            out[:, j] = np.exp(cum) @ weights
+            j += 1
+    return out
+
+def simulate(returns, weights, horizon, n_paths, method='bootstrap', step=DEFAULT_STEP_DAYS, seed=None, workers=1):
+    """
+    Simulate portfolio value `horizon` days ahead.
+    returns: (history_days, products) daily log returns; weights: current value per product.
+    Returns (checkpoints, values) where values has shape (n_paths, len(checkpoints)).
+    """
+    checkpoints = _checkpoints(horizon, step)
+    block_sizes = [BLOCK_PATHS] * (n_paths // BLOCK_PATHS)
+    if n_paths % BLOCK_PATHS:
+        block_sizes.append(n_paths % BLOCK_PATHS)
+    seeds = np.random.SeedSequence(seed).spawn(len(block_sizes))
+    tasks = [(returns, weights, checkpoints, size, method, s) for size, s in zip(block_sizes, seeds)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = list(pool.map(_simulate_block, tasks))
+    else:
+        blocks = [_simulate_block(t) for t in tasks]
+    return checkpoints, np.concatenate(blocks)
+
+def summarize(checkpoints, values, start_value, cost_basis=None):
+    bands = np.percentile(values, PERCENTILES, axis=0)
+    final = values[:, -1]
+    summary = {
+        'start_value': round(float(start_value), 2),
+        'paths': int(len(values)),
+        'horizon_days': int(checkpoints[-1]),
+        'bands': [
+            {'day': int(day), **{f'p{p}': round(float(bands[i, j]), 2) for i, p in enumerate(PERCENTILES)}}
+            for j, day in enumerate(checkpoints)
+        ],
+        'prob_below_start': round(float(np.mean(final < start_value)), 4),
+        'expected_value': round(float(final.mean()), 2),
+    }
+    if cost_basis is not None:
+        summary['cost_basis'] = round(float(cost_basis), 2)
+        summary['prob_below_cost'] = round(float(np.mean(final < cost_basis)), 4)
+    return summary
+
+def _latest_cost_basis(tracker_path="daily_tracker.csv"):
+    from functions import read_tracker_tail
+    if not os.path.exists(tracker_path):
+        return None
+    rows = read_tracker_tail(tracker_path, 1)
+    return float(rows[-1]['Cost Basis']) if rows else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Project current holdings forward with a Monte Carlo simulation of daily price returns.")
+    parser.add_argument('--days', type=int, default=365, help="Horizon in days (default: %(default)s)")
+    parser.add_argument('--paths', type=int, default=100000, help="Simulated paths (default: %(default)s)")
+    parser.add_argument('--method', choices=['bootstrap', 'normal'], default='bootstrap')
+    parser.add_argument('--lookback', type=int, default=None, help="Only use the last N days of price history")
+    parser.add_argument('--step', type=int, default=DEFAULT_STEP_DAYS, help="Days between reported bands")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    if not os.path.exists(HOLDINGS_FILE):
+        print(f"{HOLDINGS_FILE} not found. Run the analysis first.")
+        return
+
+    products, quantities, latest_prices, names = load_holdings()
+    if not products:
+        print("No priced holdings to simulate.")
+        return
+
+    _, prices = load_price_history(products)
+
+    # The snapshot price is 0 when the analysis date has no archive yet; use the last stored price
+    latest_prices = np.where(latest_prices > 0, latest_prices, last_known_prices(prices))
+    priced = latest_prices > 0
+    if not priced.all():
+        print(f"  - Note: {int((~priced).sum())} product(s) have no price at all and are left out.")
+    products = [p for p, keep in zip(products, priced) if keep]
+    names = [n for n, keep in zip(names, priced) if keep]
+    quantities, latest_prices, prices = quantities[priced], latest_prices[priced], prices[priced]
+    if not products:
+        print("No priced holdings to simulate.")
+        return
+
+    returns, observed = daily_log_returns(prices, args.lookback)
+    if len(returns) < 2:
+        print("Not enough price history to simulate.")
+        return
+
+    flat = [names[i] for i in np.flatnonzero(observed < 2)]
+    if flat:
+        print(f"  - Note: {len(flat)} product(s) have fewer than 2 daily returns and are held flat: {', '.join(flat[:5])}")
+
+    weights = quantities * latest_prices
+    start_value = weights.sum()
+
+    start = time.perf_counter()
+    checkpoints, values = simulate(returns, weights, args.days, args.paths, args.method, args.step, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(checkpoints, values, start_value, _latest_cost_basis())
+    summary.update({'method': args.method, 'history_days': int(len(returns)), 'products': len(products)})
+    write_json(args.output, summary, indent=2)
+
+    print(f"Simulated {args.paths:,} paths x {args.days} days over {len(products)} products ({args.method}, {len(returns)} days of history) in {elapsed:.1f}s")
+    print(f"  Start value: ${start_value:,.2f}")
+    for band in summary['bands'][-1:]:
+        print(f"  Day {band['day']}: " + "  ".join(f"p{p} ${band[f'p{p}']:,.0f}" for p in PERCENTILES))
+    print(f"  Chance of ending below today's value: {summary['prob_below_start']:.1%}")
+    if 'prob_below_cost' in summary:
+        print(f"  Chance of ending below cost basis: {summary['prob_below_cost']:.1%}")
+    print(f"Bands written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import json
+import math
+from datetime import datetime, timedelta
+from functions import read_tracker_tail, recover_tracker, write_tracker_rows
+from shared_files import write_json
+
+STATS_FILE = "portfolio_stats.csv"
+STATS_SUMMARY_FILE = "portfolio_stats.json"
+
+# Days of daily returns in the rolling volatility window
+ROLLING_WINDOW = 30
+# Prices are quoted every calendar day, so annualize over 365
+PERIODS_PER_YEAR = 365
+
+STATS_COLUMNS = [
+    'Date', 'Total Value', 'Cost Basis',
+    'Daily Return',         # Flow-adjusted: (value - net money added today) / yesterday's value - 1
+    'TWR Index',            # Time-weighted growth of $1 since the first row
+    'High Water Mark',      # Highest TWR Index so far
+    'Drawdown',             # TWR Index below its high water mark, in %
+    'Max Drawdown',         # Worst Drawdown so far, in %
+    'Value High',           # Highest Total Value so far
+    'Rolling Volatility',   # Std-dev of the last ROLLING_WINDOW daily returns, annualized, in %
+    'Return Count', 'Return Mean', 'Return M2',  # Welford accumulators for all-time volatility
+]
+
+# How statistics are kept
+# -----------------------
+# Every row of portfolio_stats.csv carries the running accumulators (high water
+# marks, worst drawdown, Welford count/mean/M2). To add days we only need the rows
+# just before the first new day: the last one restores the accumulators and the
+# last ROLLING_WINDOW rows refill the volatility window. So each run costs
+# O(new days) no matter how long the history is.
+
+def _initial_state():
+    return {
+        'last_value': None, 'last_cost': None,
+        'twr': 1.0, 'hwm': 1.0, 'max_dd': 0.0, 'value_high': 0.0,
+        'n': 0, 'mean': 0.0, 'm2': 0.0,
+        'window': [],
+    }
+
+def _state_from_rows(rows):
+    """Rebuild the running state from the existing stats rows before the first new day."""
+    state = _initial_state()
+    if not rows:
+        return state
+    last = rows[-1]
+    state.update({
+        'last_value': float(last['Total Value']),
+        'last_cost': float(last['Cost Basis']),
+        'twr': float(last['TWR Index']),
+        'hwm': float(last['High Water Mark']),
+        'max_dd': float(last['Max Drawdown']),
+        'value_high': float(last['Value High']),
+        'n': int(last['Return Count']),
+        'mean': float(last['Return Mean']),
+        'm2': float(last['Return M2']),
+        'window': [float(r['Daily Return']) for r in rows[-ROLLING_WINDOW:] if r['Daily Return'] != ''],
+    })
+    return state
+
+def _step(state, date_str, value, cost):
+    """Advance the state by one tracker row and return the stats row for it."""
+    daily_return = None
+    if state['last_value'] is not None and state['last_value'] > 0:
+        flow = cost - state['last_cost']
+        daily_return = (value - flow) / state['last_value'] - 1
+
+    if daily_return is not None:
+        state['twr'] *= 1 + daily_return
+        # Welford's online mean / variance
+        state['n'] += 1
+        delta = daily_return - state['mean']
+        state['mean'] += delta / state['n']
+        state['m2'] += delta * (daily_return - state['mean'])
+        state['window'] = (state['window'] + [daily_return])[-ROLLING_WINDOW:]
+
+    state['hwm'] = max(state['hwm'], state['twr'])
+    drawdown = (state['twr'] / state['hwm'] - 1) * 100
+    state['max_dd'] = min(state['max_dd'], drawdown)
+    state['value_high'] = max(state['value_high'], value)
+    state['last_value'], state['last_cost'] = value, cost
+
+    rolling_vol = None
+    window = state['window']
+    if len(window) >= 2:
+        w_mean = sum(window) / len(window)
+        w_var = sum((r - w_mean) ** 2 for r in window) / (len(window) - 1)
+        rolling_vol = math.sqrt(w_var * PERIODS_PER_YEAR) * 100
+
+    return {
+        'Date': date_str,
+        'Total Value': round(value, 2),
+        'Cost Basis': round(cost, 2),
+        'Daily Return': '' if daily_return is None else round(daily_return, 10),
+        'TWR Index': repr(state['twr']),
+        'High Water Mark': repr(state['hwm']),
+        'Drawdown': round(drawdown, 4),
+        'Max Drawdown': round(state['max_dd'], 4),
+        'Value High': round(state['value_high'], 2),
+        'Rolling Volatility': '' if rolling_vol is None else round(rolling_vol, 4),
+        'Return Count': state['n'],
+        'Return Mean': repr(state['mean']),
+        'Return M2': repr(state['m2']),
+    }
+
+def _rows_before(path, first_new_date):
+    """The last ROLLING_WINDOW stats rows dated before first_new_date; only the end of the file is read."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+
+    n = ROLLING_WINDOW + 1
+    while True:
+        tail = read_tracker_tail(path, n)
+        kept = [r for r in tail if r['Date'] < first_new_date]
+        # Enough context once we have a full window of earlier rows, or the whole file
+        if len(kept) >= ROLLING_WINDOW or len(tail) < n:
+            return kept[-ROLLING_WINDOW:]
+        n *= 4
+
+def update_stats(new_rows, path=STATS_FILE, summary_path=STATS_SUMMARY_FILE):
+    """
+    Bring portfolio_stats.csv up to date with tracker rows from the first
+    re-valued day onwards. new_rows: iterable of (date 'YYYY-MM-DD', total_value, cost_basis),
+    in date order. Rows already in the stats file on/after the first new date are
+    replaced; everything before it is left untouched.
+    """
+    new_rows = list(new_rows)
+    if not new_rows:
+        return load_stats_summary(summary_path)
+
+    first_new_date = new_rows[0][0]
+    recover_tracker(path)
+    state = _state_from_rows(_rows_before(path, first_new_date))
+
+    out_rows = [_step(state, d, float(v), float(c)) for d, v, c in new_rows]
+    write_tracker_rows(path, STATS_COLUMNS, [[row[c] for c in STATS_COLUMNS] for row in out_rows], first_new_date)
+
+    summary = _summarize(path, out_rows[-1], state)
+    write_json(summary_path, summary, indent=2)
+    return summary
+
+def _summarize(path, last_row, state):
+    """Headline metrics for the app; period returns use the TWR index of the last year's rows."""
+    last_date = datetime.strptime(last_row['Date'], '%Y-%m-%d')
+    history = read_tracker_tail(path, PERIODS_PER_YEAR + 31)
+
+    def twr_return(days):
+        target = (last_date - timedelta(days=days)).strftime('%Y-%m-%d')
+        base = [r for r in history if r['Date'] <= target]
+        if not base:
+            return None
+        return round((state['twr'] / float(base[-1]['TWR Index']) - 1) * 100, 2)
+
+    volatility = None
+    if state['n'] >= 2:
+        volatility = round(math.sqrt(state['m2'] / (state['n'] - 1) * PERIODS_PER_YEAR) * 100, 2)
+
+    return {
+        'date': last_row['Date'],
+        'time_weighted_return': round((state['twr'] - 1) * 100, 2),
+        'period_returns': {label: twr_return(days) for label, days in (('1d', 1), ('7d', 7), ('30d', 30), ('90d', 90), ('1y', 365))},
+        'drawdown': last_row['Drawdown'],
+        'max_drawdown': last_row['Max Drawdown'],
+        'high_water_mark': round(state['hwm'], 6),
+        'value_high': last_row['Value High'],
+        'rolling_volatility': last_row['Rolling Volatility'] if last_row['Rolling Volatility'] != '' else None,
+        'rolling_window_days': ROLLING_WINDOW,
+        'volatility': volatility,
+        'mean_daily_return': round(state['mean'] * 100, 4),
+        'return_days': state['n'],
+    }
+
+def load_stats_summary(summary_path=STATS_SUMMARY_FILE):
+    if not os.path.exists(summary_path):
+        return None
+    try:
+        with open(summary_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
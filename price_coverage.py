@@ -0,0 +1,357 @@
+import os
+import json
+import base64
+import argparse
+from datetime import datetime, date, timedelta
+import numpy as np
+from shared_files import atomic_write, write_json
+
+COVERAGE_FILE = "coverage.json"
+# Measured download + extract time per archive, for plan estimates
+FETCH_STATS_FILE = "fetch_stats.json"
+# Estimate used until a few archives have been timed
+DEFAULT_SECONDS_PER_ARCHIVE = 15.0
+# Prices already read from the per-day files, so bulk loads only open days added since
+PRICE_CACHE_FILE = "price_cache.npz"
+
+# An archive that 404s this recently may just not be published yet, so it is
+# retried instead of being recorded as missing upstream.
+ARCHIVE_GRACE_DAYS = 3
+
+def _day(value):
+    """Day ordinal for a 'YYYY-MM-DD' string, date or datetime."""
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d')
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+def _key(group_id, product_id):
+    return f"{str(group_id).strip()}/{str(product_id).strip()}"
+
+def _pack(bits):
+    return base64.b64encode(np.packbits(bits).tobytes()).decode('ascii')
+
+def _unpack(text, n_days):
+    raw = np.frombuffer(base64.b64decode(text), dtype=np.uint8)
+    return np.unpackbits(raw)[:n_days].astype(bool)
+
+def _new_entry(first_day, n_days):
+    return {
+        'start': first_day,
+        'present': np.zeros(n_days, dtype=bool),
+        'missing': np.zeros(n_days, dtype=bool),
+    }
+
+def _ensure_span(entry, first_day, last_day):
+    """Grow an entry's bitmaps (with zeros) so they cover first_day..last_day."""
+    start = entry['start']
+    end = start + len(entry['present']) - 1
+    new_start = min(start, first_day)
+    new_end = max(end, last_day)
+    if new_start == start and new_end == end:
+        return
+    for plane in ('present', 'missing'):
+        grown = np.zeros(new_end - new_start + 1, dtype=bool)
+        grown[start - new_start:start - new_start + len(entry[plane])] = entry[plane]
+        entry[plane] = grown
+    entry['start'] = new_start
+
+def _product_dirs(folder):
+    """(key, os.DirEntry) of every product directory under folder."""
+    if not os.path.isdir(folder):
+        return
+    for group_entry in os.scandir(folder):
+        if not group_entry.is_dir():
+            continue
+        for product_entry in os.scandir(group_entry.path):
+            if product_entry.is_dir():
+                yield _key(group_entry.name, product_entry.name), product_entry
+
+def scan_product(product_dir):
+    """Coverage entry from the files of one product directory (plus its archive), None if it has none."""
+    from functions import PRICE_ARCHIVE_FILE, load_price_archive
+
+    days = []
+    for f in os.scandir(product_dir):
+        name = f.name
+        if name.endswith('.json') and len(name) == 15:
+            try:
+                days.append(_day(name[:10]))
+            except ValueError:
+                continue
+        elif name == PRICE_ARCHIVE_FILE:
+            # Days compacted by price_retention.py are still priced
+            days.extend(_day(d) for d in load_price_archive(product_dir))
+    if not days:
+        return None
+    days = np.array(days)
+    entry = _new_entry(int(days.min()), int(days.max() - days.min()) + 1)
+    entry['present'][days - entry['start']] = True
+    return entry
+
+def scan_coverage(folder='historical_prices'):
+    """
+    Build coverage from what is on disk: one directory listing per product
+    rather than one stat per product per day.
+    """
+    coverage = {}
+    for key, product_entry in _product_dirs(folder):
+        entry = scan_product(product_entry.path)
+        if entry is not None:
+            coverage[key] = entry
+    return coverage
+
+def refresh_changed(coverage, folder, since_ns):
+    """
+    Rescan the product directories modified after since_ns (the manifest's mtime), in
+    place: price files that arrived without the fetcher, e.g. from a git pull of the
+    committed historical_prices. Their 'missing' marks are kept for days still without
+    a file, and their price cache entries are dropped so the files are read again.
+    Returns the keys rescanned. Costs one stat per product directory.
+    """
+    changed = []
+    for key, product_entry in _product_dirs(folder):
+        if product_entry.stat().st_mtime_ns <= since_ns:
+            continue
+        entry = scan_product(product_entry.path)
+        old = coverage.get(key)
+        if entry is None:
+            if old is not None:
+                old['present'][:] = False
+            changed.append(key)
+            continue
+        if old is not None:
+            _ensure_span(entry, old['start'], old['start'] + len(old['missing']) - 1)
+            offset = old['start'] - entry['start']
+            entry['missing'][offset:offset + len(old['missing'])] = old['missing']
+            entry['missing'] &= ~entry['present']
+        coverage[key] = entry
+        changed.append(key)
+
+    if changed:
+        cache = load_price_cache(folder)
+        if any(key in cache for key in changed):
+            for key in changed:
+                cache.pop(key, None)
+            try:
+                save_price_cache(cache, folder)
+            except OSError as e:
+                print(f"  ⚠️  Warning: Could not save the price cache ({e}).")
+    return changed
+
+def load_coverage(folder='historical_prices', rescan=False):
+    """
+    Load the per-product coverage bitmaps for folder. Falls back to (and then
+    persists) a directory scan when the manifest is missing, unreadable or rescan=True.
+    Product directories changed after the manifest was written are rescanned (see
+    refresh_changed), so files put there by hand or by git still count.
+    Returns {"gid/pid": {'start': day ordinal, 'present': bool array, 'missing': bool array}}.
+    """
+    path = os.path.join(folder, COVERAGE_FILE)
+    if not rescan and os.path.exists(path):
+        try:
+            manifest_mtime = os.stat(path).st_mtime_ns
+            with open(path, 'r') as f:
+                raw = json.load(f)
+            coverage = {}
+            for key, item in raw.get('products', {}).items():
+                n_days = item['days']
+                coverage[key] = {
+                    'start': _day(item['start']),
+                    'present': _unpack(item['present'], n_days),
+                    'missing': _unpack(item['missing'], n_days),
+                }
+            changed = refresh_changed(coverage, folder, manifest_mtime)
+            if changed:
+                print(f"  Rescanned {len(changed)} product(s) whose price files changed outside the fetcher.")
+                save_coverage(coverage, folder)
+            return coverage
+        except (ValueError, KeyError, OSError) as e:
+            print(f"  ⚠️  Warning: Could not read {path} ({e}). Rescanning price files.")
+
+    coverage = scan_coverage(folder)
+    if os.path.isdir(folder):
+        save_coverage(coverage, folder)
+    return coverage
+
+def save_coverage(coverage, folder='historical_prices'):
+    os.makedirs(folder, exist_ok=True)
+    products = {}
+    for key, entry in sorted(coverage.items()):
+        products[key] = {
+            'start': date.fromordinal(entry['start']).strftime('%Y-%m-%d'),
+            'days': len(entry['present']),
+            'present': _pack(entry['present']),
+            'missing': _pack(entry['missing']),
+        }
+    write_json(os.path.join(folder, COVERAGE_FILE), {'version': 1, 'products': products})
+
+def mark_present(coverage, group_id, product_id, day):
+    """Record that a price file was written for this product and day."""
+    _mark(coverage, group_id, product_id, day, 'present', 'missing')
+
+def mark_missing(coverage, group_id, product_id, day):
+    """Record that upstream has no price for this product and day, so it isn't fetched again."""
+    _mark(coverage, group_id, product_id, day, 'missing', 'present')
+
+def _mark(coverage, group_id, product_id, day, set_plane, clear_plane):
+    d = _day(day)
+    key = _key(group_id, product_id)
+    entry = coverage.get(key)
+    if entry is None:
+        entry = coverage[key] = _new_entry(d, 1)
+    _ensure_span(entry, d, d)
+    entry[set_plane][d - entry['start']] = True
+    entry[clear_plane][d - entry['start']] = False
+
+def known_mask(coverage, group_id, product_id, first_day, last_day):
+    """
+    Bool array over first_day..last_day: True where the product is either priced
+    or known to be missing upstream (i.e. nothing to fetch).
+    """
+    lo, hi = _day(first_day), _day(last_day)
+    out = np.zeros(hi - lo + 1, dtype=bool)
+    entry = coverage.get(_key(group_id, product_id))
+    if entry is None:
+        return out
+    start = entry['start']
+    known = entry['present'] | entry['missing']
+    a, b = max(lo, start), min(hi, start + len(known) - 1)
+    if a <= b:
+        out[a - lo:b - lo + 1] = known[a - start:b - start + 1]
+    return out
+
+def active_mask(ranges, first_day, last_day):
+    """
+    Bool array over first_day..last_day marking days covered by ownership
+    ranges [(start_date, end_date_or_None), ...] from get_product_active_ranges().
+    """
+    lo, hi = _day(first_day), _day(last_day)
+    out = np.zeros(hi - lo + 1, dtype=bool)
+    for start, end in ranges:
+        a = max(lo, _day(start))
+        b = hi if end is None else min(hi, _day(end))
+        if a <= b:
+            out[a - lo:b - lo + 1] = True
+    return out
+
+def days_to_fetch(coverage, active_ranges, products, first_day, last_day):
+    """
+    Work out which archive days are needed and for which products.
+    products: list of (group_id, product_id) string tuples.
+    Returns a list of (date, [(group_id, product_id), ...]) for every day where at
+    least one product was owned and is neither priced nor known missing.
+    """
+    lo, hi = _day(first_day), _day(last_day)
+    if hi < lo or not products:
+        return []
+
+    # needed[i, d]: product i was owned on day d and we know nothing about its price
+    needed = np.zeros((len(products), hi - lo + 1), dtype=bool)
+    for i, (g_id, p_id) in enumerate(products):
+        ranges = active_ranges.get((g_id, p_id), [])
+        if ranges:
+            needed[i] = active_mask(ranges, first_day, last_day) & ~known_mask(coverage, g_id, p_id, first_day, last_day)
+
+    plan = []
+    for d in np.flatnonzero(needed.any(axis=0)):
+        wanted = [products[i] for i in np.flatnonzero(needed[:, d])]
+        plan.append((date.fromordinal(lo + int(d)), wanted))
+    return plan
+
+def load_fetch_stats(folder='historical_prices'):
+    try:
+        with open(os.path.join(folder, FETCH_STATS_FILE), 'r') as f:
+            stats = json.load(f)
+        return {'archives': int(stats['archives']), 'avg_seconds': float(stats['avg_seconds'])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {'archives': 0, 'avg_seconds': DEFAULT_SECONDS_PER_ARCHIVE}
+
+def record_fetch_time(stats, seconds):
+    """Fold one archive's wall time into the running average (recent runs weigh more)."""
+    n = min(stats['archives'], 49) + 1
+    stats['avg_seconds'] += (seconds - stats['avg_seconds']) / n
+    stats['archives'] += 1
+
+def save_fetch_stats(stats, folder='historical_prices'):
+    os.makedirs(folder, exist_ok=True)
+    write_json(os.path.join(folder, FETCH_STATS_FILE), stats)
+
+def describe_plan(plan, seconds_per_archive):
+    """One-paragraph summary of a days_to_fetch plan and what it should cost."""
+    if not plan:
+        return "Nothing to download."
+    product_days = sum(len(wanted) for _, wanted in plan)
+    days = [d for d, _ in plan]
+    minutes = len(plan) * seconds_per_archive / 60
+    return (f"{len(plan)} archive(s) to download, {min(days)} to {max(days)}, covering {product_days} product-day(s). "
+            f"Estimated {minutes:.1f} min at {seconds_per_archive:.1f}s per archive.")
+
+def load_price_cache(folder='historical_prices'):
+    """
+    Prices read by earlier bulk loads: {"gid/pid": (start day, read bool array, prices float array)}.
+    'read' marks the days whose file has been read (prices is NaN where the file had no price).
+    """
+    try:
+        with np.load(os.path.join(folder, PRICE_CACHE_FILE), allow_pickle=False) as data:
+            keys, starts, lengths = data['keys'].tolist(), data['starts'].tolist(), data['lengths']
+            ends = np.cumsum(lengths).tolist()
+            read, prices = data['read'], data['prices']
+    except Exception:
+        # Missing, torn (BadZipFile) or from another layout: it is only a cache, so start empty
+        return {}
+    cache = {}
+    begin = 0
+    for key, start, end in zip(keys, starts, ends):
+        cache[key] = (start, read[begin:end], prices[begin:end])
+        begin = end
+    return cache
+
+def save_price_cache(cache, folder='historical_prices'):
+    keys = sorted(cache)
+    with atomic_write(os.path.join(folder, PRICE_CACHE_FILE), 'wb') as f:
+        np.savez(f,
+                 keys=np.array(keys, dtype=str),
+                 starts=np.array([cache[k][0] for k in keys], dtype=np.int64),
+                 lengths=np.array([len(cache[k][1]) for k in keys], dtype=np.int64),
+                 read=np.concatenate([cache[k][1] for k in keys]) if keys else np.zeros(0, dtype=bool),
+                 prices=np.concatenate([cache[k][2] for k in keys]) if keys else np.zeros(0))
+
+def merge_price_cache(cache, updates):
+    """
+    Fold the entries load_price_history(cache=...) workers changed ([{key: entry}, ...],
+    one dict per worker) into cache. The workers started from the same entries and
+    read disjoint days, so each day is taken from the worker that read it.
+    """
+    merged = {}
+    for update in updates:
+        for key, (start, read, prices) in update.items():
+            current = merged.get(key)
+            if current is None or current[0] != start or len(current[1]) != len(read):
+                merged[key] = (start, read, prices)
+            else:
+                merged[key] = (start, current[1] | read, np.where(read & ~current[1], prices, current[2]))
+    cache.update(merged)
+    return bool(merged)
+
+def archive_is_final(day):
+    """True if a missing archive for this day should be treated as permanently missing."""
+    return _day(day) <= (datetime.now().date() - timedelta(days=ARCHIVE_GRACE_DAYS)).toordinal()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or rebuild the price coverage manifest.")
+    parser.add_argument('--folder', default='historical_prices')
+    parser.add_argument('--rescan', action='store_true', help="Rebuild the manifest from the price files on disk (clears 'missing' marks).")
+    args = parser.parse_args()
+
+    if args.rescan and os.path.exists(os.path.join(args.folder, PRICE_CACHE_FILE)):
+        # Files may have been edited by hand; read them all again on the next bulk load
+        os.remove(os.path.join(args.folder, PRICE_CACHE_FILE))
+    coverage = load_coverage(args.folder, rescan=args.rescan)
+    present = sum(int(e['present'].sum()) for e in coverage.values())
+    missing = sum(int(e['missing'].sum()) for e in coverage.values())
+    print(f"{len(coverage)} products, {present} priced days, {missing} days known missing upstream.")
+
+if __name__ == "__main__":
+    main()
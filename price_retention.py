@@ -0,0 +1,276 @@
+import os
+import json
+import argparse
+from datetime import date
+import numpy as np
+import holdings
+import price_coverage
+from functions import PRICE_ARCHIVE_FILE, get_product_active_ranges, get_transactions_file, load_config
+from ledger import load_ledger
+from shared_files import atomic_write
+
+# Days before the as-of date every product keeps as individual daily files
+DEFAULT_DAILY_DAYS = 90
+# Older than that and up to this many days back: weekly closes; older still: monthly
+DEFAULT_WEEKLY_DAYS = 365
+ARCHIVE_VERSION = 1
+# Allocation unit used to estimate the on-disk size of files not written yet
+BLOCK_SIZE = 4096
+
+# Retention tiers
+# ---------------
+# historical_prices/<gid>/<pid>/<date>.json is one small file per product per day.
+# `python price_retention.py --compact` shrinks the history of products that are no
+# longer held (products still held are never touched):
+#
+#   last daily_days days          daily files, as fetched
+#   older, valued days            exact price, moved into <pid>/archive.json
+#   older, other days             downsampled: one close per week (up to weekly_days
+#                                 back) or per month, with low / high / mean / days
+#
+# "Valued days" are the days run_analysis puts a value on the product (held at the
+# end of the day) plus the ownership ranges prices are fetched for, so rebuilding
+# the tracker after a compaction gives the same numbers. Readers (get_price_for_date,
+# load_price_history, the coverage scan) look in archive.json when a day's file is
+# gone; coverage keeps exact days and period closes as priced and drops the rest.
+# The tiers come from data.json:
+#
+#   "price_retention": {"daily_days": 90, "weekly_days": 365}
+#
+# Running it again folds newly aged days (and aged weekly closes into monthly ones)
+# into the same archive.
+
+def retention_policy():
+    """(daily_days, weekly_days) from data.json, with the defaults above."""
+    policy = load_config().get("price_retention", {})
+    return int(policy.get("daily_days", DEFAULT_DAILY_DAYS)), int(policy.get("weekly_days", DEFAULT_WEEKLY_DAYS))
+
+def valued_ranges(ledger):
+    """
+    {(gid, pid): [(first date, last date or None), ...]} of the days run_analysis values
+    each product, i.e. with a quantity above zero after that day's transactions.
+    """
+    inventory, since, ranges = {}, {}, {}
+
+    def settle(day, keys):
+        for key in keys:
+            held = inventory.get(key, 0) > 0
+            if held and key not in since:
+                since[key] = day
+            elif not held and key in since:
+                ranges.setdefault(key, []).append((date.fromordinal(since.pop(key)), date.fromordinal(day - 1)))
+
+    current, touched = None, set()
+    for day, g_id, p_id, tx_type, qty in zip(ledger['day'].tolist(), ledger['group_id'].tolist(), ledger['product_id'].tolist(),
+                                             ledger['tx_type'].tolist(), ledger['quantity'].tolist()):
+        if day != current:
+            settle(current, touched)
+            current, touched = day, set()
+        key = (str(g_id), str(p_id))
+        holdings.apply_quantity(inventory, key, tx_type, qty)
+        touched.add(key)
+    settle(current, touched)
+
+    for key, first in since.items():
+        ranges.setdefault(key, []).append((date.fromordinal(first), None))
+    return ranges
+
+def _read_archive(product_dir):
+    path = os.path.join(product_dir, PRICE_ARCHIVE_FILE)
+    if not os.path.exists(path):
+        return {'daily': {}, 'periods': []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _disk_size(path):
+    """Bytes allocated on disk for a file (0 if it doesn't exist)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0
+    return getattr(stat, 'st_blocks', 0) * 512 or stat.st_size
+
+def _period(day, as_of_day, weekly_days):
+    """('weekly', Monday) or ('monthly', first of month) for a day ordinal being downsampled."""
+    d = date.fromordinal(day)
+    if day >= as_of_day - weekly_days:
+        return ('weekly', day - d.weekday())
+    return ('monthly', d.replace(day=1).toordinal())
+
+def _summarize(points, resolution):
+    """
+    One period record from (day, price, low, high, mean, days) points, where a daily
+    price is a point of one day and an earlier period record carries its own figures.
+    """
+    priced = [p for p in points if p[1] is not None]
+    close = priced[-1] if priced else points[-1]
+    n = sum(p[5] for p in priced)
+    return {
+        'date': date.fromordinal(close[0]).strftime('%Y-%m-%d'),
+        'resolution': resolution,
+        'price': close[1],
+        'low': min(p[2] for p in priced) if priced else None,
+        'high': max(p[3] for p in priced) if priced else None,
+        'mean': round(sum(p[4] * p[5] for p in priced) / n, 4) if n else None,
+        'days': n,
+    }
+
+def compact_product(folder, key, entry, keep, cutoff_day, as_of_day, weekly_days, dry_run=False):
+    """
+    Move one product's days before cutoff_day into its archive: exact prices where
+    keep(day) is True, one record per week / month otherwise. Updates the coverage
+    entry in place. Returns counts and sizes, or None if there was nothing to compact.
+    """
+    g_id, p_id = key.split('/')
+    product_dir = os.path.join(folder, g_id, p_id)
+    archive = _read_archive(product_dir)
+    periods_by_date = {p['date']: p for p in archive['periods']}
+
+    start, present = entry['start'], entry['present']
+    old_days = {start + int(off) for off in np.flatnonzero(present) if start + off < cutoff_day}
+    old_days.update(price_coverage._day(d) for d in list(archive['daily']) + list(periods_by_date))
+    old_days = sorted(d for d in old_days if d < cutoff_day)
+    if not old_days:
+        return None
+
+    # (day, price, low, high, mean, days priced, from an earlier period record)
+    files, points = [], []
+    for day in old_days:
+        date_str = date.fromordinal(day).strftime('%Y-%m-%d')
+        file_path = os.path.join(product_dir, f"{date_str}.json")
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                price = json.load(f).get('marketPrice')
+            files.append(file_path)
+            points.append((day, price, price, price, price, 1, False))
+        elif date_str in archive['daily']:
+            price = archive['daily'][date_str]
+            points.append((day, price, price, price, price, 1, False))
+        elif date_str in periods_by_date:
+            p = periods_by_date[date_str]
+            points.append((day, p['price'], p['low'], p['high'], p['mean'], p['days'], True))
+
+    exact, groups = {}, {}
+    for point in points:
+        if keep(point[0]) and not point[6]:
+            exact[point[0]] = point[1]
+        else:
+            groups.setdefault(_period(point[0], as_of_day, weekly_days), []).append(point)
+
+    daily = {d: v for d, v in archive['daily'].items() if price_coverage._day(d) >= cutoff_day}
+    daily.update({date.fromordinal(day).strftime('%Y-%m-%d'): price for day, price in exact.items()})
+    periods = [p for p in archive['periods'] if price_coverage._day(p['date']) >= cutoff_day]
+    periods += [_summarize(members, resolution) for (resolution, _), members in groups.items()]
+    new_archive = {
+        'version': ARCHIVE_VERSION,
+        'group_id': g_id,
+        'product_id': p_id,
+        'daily': dict(sorted(daily.items())),
+        'periods': sorted(periods, key=lambda p: p['date']),
+    }
+    if not files and new_archive['daily'] == archive['daily'] and new_archive['periods'] == archive['periods']:
+        return None
+
+    # Coverage: exact days and period closes stay priced, the other downsampled days go
+    closes = {price_coverage._day(p['date']) for p in new_archive['periods']}
+    for day, *_ in points:
+        if day in exact or day in closes:
+            price_coverage._ensure_span(entry, day, day)
+            entry['present'][day - entry['start']] = True
+        elif day - entry['start'] in range(len(entry['present'])):
+            entry['present'][day - entry['start']] = False
+
+    archive_path = os.path.join(product_dir, PRICE_ARCHIVE_FILE)
+    text = json.dumps(new_archive)
+    file_days = [price_coverage._day(os.path.basename(f)[:10]) for f in files]
+    result = {
+        'files_removed': len(files),
+        'days_exact': sum(1 for day in file_days if day in exact),
+        'days_downsampled': sum(1 for day in file_days if day not in exact),
+        'periods': len(groups),
+        'bytes_before': sum(os.path.getsize(f) for f in files) + (os.path.getsize(archive_path) if os.path.exists(archive_path) else 0),
+        'disk_before': sum(_disk_size(f) for f in files) + _disk_size(archive_path),
+        'bytes_after': len(text),
+        'disk_after': -(-len(text) // BLOCK_SIZE) * BLOCK_SIZE,
+    }
+    if dry_run:
+        return result
+
+    # Archive first: until the daily files are removed both hold the same prices
+    with atomic_write(archive_path) as f:
+        f.write(text)
+    result['disk_after'] = _disk_size(archive_path)
+    for file_path in files:
+        os.remove(file_path)
+    return result
+
+def compact(folder='historical_prices', as_of=None, daily_days=None, weekly_days=None, dry_run=False):
+    """
+    Apply the retention tiers to every product not currently held. as_of
+    ('YYYY-MM-DD', default today) anchors the tiers. Returns a report of what was
+    (or with dry_run, would be) archived and the space it frees.
+    """
+    policy_daily, policy_weekly = retention_policy()
+    daily_days = policy_daily if daily_days is None else daily_days
+    weekly_days = policy_weekly if weekly_days is None else weekly_days
+    as_of_day = price_coverage._day(as_of) if as_of else date.today().toordinal()
+    cutoff_day = as_of_day - daily_days
+
+    valued = valued_ranges(load_ledger(get_transactions_file()))
+    active = get_product_active_ranges()
+    coverage = price_coverage.load_coverage(folder)
+
+    report = {'as_of': date.fromordinal(as_of_day).strftime('%Y-%m-%d'), 'held': 0, 'products': 0,
+              'files_removed': 0, 'days_exact': 0, 'days_downsampled': 0, 'periods': 0,
+              'bytes_before': 0, 'bytes_after': 0, 'disk_before': 0, 'disk_after': 0}
+    for key in sorted(coverage):
+        product = tuple(key.split('/'))
+        ranges = valued.get(product, [])
+        if ranges and ranges[-1][1] is None:
+            report['held'] += 1
+            continue
+
+        entry = coverage[key]
+        first, last = date.fromordinal(entry['start']), date.fromordinal(max(entry['start'] + len(entry['present']), cutoff_day))
+        mask = price_coverage.active_mask(ranges + active.get(product, []), first, last)
+        keep = lambda day: 0 <= day - entry['start'] < len(mask) and bool(mask[day - entry['start']])
+
+        result = compact_product(folder, key, entry, keep, cutoff_day, as_of_day, weekly_days, dry_run)
+        if result is None:
+            continue
+        report['products'] += 1
+        for field, value in result.items():
+            report[field] += value
+
+    if report['products'] and not dry_run:
+        price_coverage.save_coverage(coverage, folder)
+    return report
+
+def _size(n):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def main():
+    parser = argparse.ArgumentParser(description="Downsample the stored price history of products no longer held.")
+    parser.add_argument('--compact', action='store_true', help="Apply the retention tiers (without it, only report what would change)")
+    parser.add_argument('--as-of', help="Date the tiers are counted back from, YYYY-MM-DD (default: today)")
+    parser.add_argument('--daily-days', type=int, help=f"Keep daily files this many days back (default: data.json or {DEFAULT_DAILY_DAYS})")
+    parser.add_argument('--weekly-days', type=int, help=f"Weekly closes up to this many days back, monthly before (default: data.json or {DEFAULT_WEEKLY_DAYS})")
+    parser.add_argument('--folder', default='historical_prices')
+    args = parser.parse_args()
+
+    r = compact(args.folder, args.as_of, args.daily_days, args.weekly_days, dry_run=not args.compact)
+    verb = "Compacted" if args.compact else "Would compact"
+    print(f"{verb} {r['products']} product(s) as of {r['as_of']} ({r['held']} held product(s) left at daily resolution).")
+    print(f"  {r['files_removed']} daily file(s) removed: {r['days_exact']} valued day(s) kept exact, "
+          f"{r['days_downsampled']} other day(s) folded into {r['periods']} weekly / monthly close(s).")
+    print(f"  Size: {_size(r['bytes_before'])} -> {_size(r['bytes_after'])}; "
+          f"on disk {_size(r['disk_before'])} -> {_size(r['disk_after'])} ({_size(r['disk_before'] - r['disk_after'])} reclaimed).")
+    if not args.compact and r['products']:
+        print("Run with --compact to apply.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+from functions import load_price_history
+from monte_carlo import HOLDINGS_FILE, forward_fill, load_holdings, last_known_prices
+from shared_files import write_json
+
+OUTPUT_FILE = "risk_report.json"
+DEFAULT_WINDOW_DAYS = 730
+CONFIDENCE_LEVELS = [0.95, 0.99]
+PERIODS_PER_YEAR = 365
+TOP_PAIRS = 5
+
+# How the report is built
+# -----------------------
+# Prices for every held product over the window come from one bulk load into a
+# (products, days) matrix. Gaps are carried forward from the last known price, so a
+# move is counted on the day the next price shows up rather than lost; days before a
+# product's first price count as "no move". From the (days, products) matrix of
+# simple daily returns:
+#
+#   covariance / correlation    np.cov over the products
+#   variance contribution       w_i * (cov @ w)_i / (w' cov w), sums to 1
+#   diversification ratio       weighted average volatility / portfolio volatility
+#   historical VaR / ES         percentiles of the daily P&L today's holdings would
+#                               have had on each day of the window
+#
+# Everything is whole-array NumPy, so the cost is the price load plus a few
+# matrix products.
+
+def daily_returns(prices):
+    """(days - 1, products) simple daily returns of a (products, days) price matrix; 0 where unknown."""
+    filled = forward_fill(np.where(prices > 0, prices, np.nan))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = (filled[:, 1:] / filled[:, :-1] - 1.0).T
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+def correlation_from_covariance(cov):
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std)
+    # Products that never moved have no defined correlation; report 0
+    return np.nan_to_num(corr, nan=0.0), std
+
+def tail_risk(pnl, level):
+    """Historical value-at-risk and expected shortfall (positive = loss) at a confidence level."""
+    cutoff = np.percentile(pnl, 100 * (1 - level))
+    tail = pnl[pnl <= cutoff]
+    return -float(cutoff), -float(tail.mean()) if len(tail) else 0.0
+
+def risk_metrics(returns, values):
+    """
+    Portfolio risk from a (days, products) matrix of daily returns and the current
+    value held in each product. Returns a dict of arrays and scalars (see build_report).
+    """
+    total = values.sum()
+    weights = values / total if total > 0 else np.zeros_like(values)
+    cov = np.cov(returns, rowvar=False).reshape(len(values), len(values))
+    corr, std = correlation_from_covariance(cov)
+
+    marginal = cov @ weights
+    port_var = float(weights @ marginal)
+    port_std = np.sqrt(max(port_var, 0.0))
+    contribution = weights * marginal / port_var if port_var > 0 else np.zeros_like(weights)
+
+    pnl = returns @ values
+    tails = {level: tail_risk(pnl, level) for level in CONFIDENCE_LEVELS}
+
+    moving = std > 0
+    off_diagonal = corr[np.ix_(moving, moving)][~np.eye(int(moving.sum()), dtype=bool)]
+    return {
+        'weights': weights,
+        'volatility': std,
+        'correlation': corr,
+        'contribution': contribution,
+        'portfolio_volatility': port_std,
+        'diversification_ratio': float(weights @ std / port_std) if port_std > 0 else None,
+        'average_correlation': float(off_diagonal.mean()) if len(off_diagonal) else None,
+        'tails': tails,
+    }
+
+def top_pairs(corr, names, n=TOP_PAIRS):
+    """The n most positively correlated pairs of distinct products."""
+    i, j = np.triu_indices(len(corr), k=1)
+    order = np.argsort(-corr[i, j], kind='stable')[:n]
+    return [{'a': names[i[k]], 'b': names[j[k]], 'correlation': round(float(corr[i[k], j[k]]), 4)} for k in order]
+
+def build_report(products, names, values, returns, first_date, last_date):
+    m = risk_metrics(returns, values)
+    total = float(values.sum())
+    annualize = np.sqrt(PERIODS_PER_YEAR)
+    report = {
+        'window': {'from': first_date, 'to': last_date, 'days': int(len(returns))},
+        'portfolio_value': round(total, 2),
+        'products': len(products),
+        'volatility_daily': round(float(m['portfolio_volatility']), 6),
+        'volatility_annual': round(float(m['portfolio_volatility'] * annualize), 6),
+        'diversification_ratio': None if m['diversification_ratio'] is None else round(m['diversification_ratio'], 4),
+        'average_correlation': None if m['average_correlation'] is None else round(m['average_correlation'], 4),
+        'value_at_risk': {},
+        'expected_shortfall': {},
+        'holdings': [],
+        'top_correlated_pairs': top_pairs(m['correlation'], names),
+        'correlation': {
+            'product_ids': [p_id for _, p_id in products],
+            'matrix': np.round(m['correlation'], 4).tolist(),
+        },
+    }
+    for level, (var, es) in m['tails'].items():
+        label = f"{int(level * 100)}%"
+        report['value_at_risk'][label] = {'amount': round(var, 2), 'pct': round(var / total, 6) if total else 0.0}
+        report['expected_shortfall'][label] = {'amount': round(es, 2), 'pct': round(es / total, 6) if total else 0.0}
+
+    for k in np.argsort(-m['contribution'], kind='stable'):
+        report['holdings'].append({
+            'Product Name': names[k],
+            'group_id': products[k][0],
+            'product_id': products[k][1],
+            'value': round(float(values[k]), 2),
+            'weight': round(float(m['weights'][k]), 6),
+            'volatility_annual': round(float(m['volatility'][k] * annualize), 6),
+            'variance_contribution': round(float(m['contribution'][k]), 6),
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Covariance, variance contribution and historical VaR / expected shortfall of current holdings.")
+    parser.add_argument('--days', type=int, default=DEFAULT_WINDOW_DAYS, help="Window of price history in days (default: %(default)s)")
+    parser.add_argument('--to', help="Last day of the window, YYYY-MM-DD (default: last stored price)")
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    if not os.path.exists(HOLDINGS_FILE):
+        print(f"{HOLDINGS_FILE} not found. Run the analysis first.")
+        return
+
+    products, quantities, latest_prices, names = load_holdings()
+    if not products:
+        print("No holdings to analyze.")
+        return
+
+    start = time.perf_counter()
+    days, prices = load_price_history(products, last_date=args.to)
+    if len(days) < 3:
+        print("Not enough price history for a risk report.")
+        return
+    days, prices = days[-(args.days + 1):], prices[:, -(args.days + 1):]
+
+    # Value today's holdings at the snapshot price, or the last stored price when it is 0
+    latest_prices = np.where(latest_prices > 0, latest_prices, last_known_prices(prices))
+    values = np.nan_to_num(quantities * latest_prices)
+
+    returns = daily_returns(prices)
+    first_date = datetime.fromordinal(int(days[0])).strftime('%Y-%m-%d')
+    last_date = datetime.fromordinal(int(days[-1])).strftime('%Y-%m-%d')
+    report = build_report(products, names, values, returns, first_date, last_date)
+    elapsed = time.perf_counter() - start
+
+    write_json(args.output, report, indent=2)
+
+    print(f"Risk report for {len(products)} products over {len(returns)} days ({first_date} to {last_date}) in {elapsed:.2f}s")
+    print(f"  Portfolio value: ${report['portfolio_value']:,.2f}, annual volatility {report['volatility_annual']:.1%}")
+    for label, var in report['value_at_risk'].items():
+        es = report['expected_shortfall'][label]
+        print(f"  1-day VaR {label}: ${var['amount']:,.2f} ({var['pct']:.2%}), expected shortfall ${es['amount']:,.2f} ({es['pct']:.2%})")
+    if report['diversification_ratio'] is not None:
+        print(f"  Diversification ratio: {report['diversification_ratio']:.2f}, average correlation {report['average_correlation']:.2f}")
+    print("  Largest variance contributors:")
+    for h in report['holdings'][:5]:
+        print(f"    {h['Product Name'][:50]:<50} {h['weight']:>6.1%} of value, {h['variance_contribution']:>6.1%} of variance")
+    print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
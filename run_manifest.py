@@ -0,0 +1,81 @@
+import os
+import json
+import csv
+import hashlib
+from datetime import datetime
+from shared_files import write_json
+
+RUN_MANIFEST_FILE = "run_manifest.json"
+
+def file_sha256(path):
+    """
+    Hex sha256 of a file's bytes, or None if it doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def ledger_day_digests(transactions_file):
+    """
+    Returns {YYYY-MM-DD: digest} where digest covers every ledger row received on that day.
+    Comparing two of these tells us the earliest day whose transactions were added,
+    removed or edited. Rows with an unreadable date are keyed under "" (forces a full rebuild).
+    """
+    if not os.path.exists(transactions_file):
+        return {}
+
+    rows_by_day = {}
+    with open(transactions_file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return {}
+        try:
+            date_idx = header.index('Date Recieved')
+        except ValueError:
+            return {"": hashlib.sha256(repr(list(reader)).encode()).hexdigest()}
+
+        for row in reader:
+            try:
+                day = datetime.strptime(row[date_idx].strip(), '%m/%d/%Y').strftime('%Y-%m-%d')
+            except (ValueError, IndexError):
+                day = ""
+            rows_by_day.setdefault(day, []).append(row)
+
+    return {
+        day: hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+        for day, rows in rows_by_day.items()
+    }
+
+def earliest_ledger_change(old_digests, new_digests):
+    """
+    Returns the earliest day (YYYY-MM-DD) whose transactions differ between two digest maps,
+    "" if an undated row changed (caller should rebuild everything), or None if nothing changed.
+    """
+    changed = [
+        day for day in set(old_digests) | set(new_digests)
+        if old_digests.get(day) != new_digests.get(day)
+    ]
+    if not changed:
+        return None
+    return min(changed)
+
+def load_run_manifest(path=RUN_MANIFEST_FILE):
+    """
+    Load the manifest written at the end of the previous successful run.
+    Returns {} when there is none (or it can't be read), which means "assume nothing".
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+def save_run_manifest(manifest, path=RUN_MANIFEST_FILE):
+    write_json(path, manifest, indent=2, sort_keys=True)
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+import holdings
+import price_coverage
+from attribution import portfolio_values
+from functions import load_price_history
+from ledger import ADDS, TxType
+
+# Fewest days given a worker process of its own; shorter windows (every incremental
+# run) are valued in-process, where the pool's start-up would cost more than it saves
+MIN_SHARD_DAYS = 180
+
+# Date-sharded valuation
+# ----------------------
+# run_analysis values the days from its window start to the target date. The ledger
+# is walked once up front, transactions only (not days), to get the end-of-day
+# inventory and cost basis just before each shard's first day. Each shard, a
+# contiguous range of days, then starts from its boundary state and on its own:
+#
+#   walks its days, applying that shard's transactions
+#   records each day's quantities row, items owned and cost basis
+#   loads its days of the price matrix and sums the day values
+#
+# Shards run in a process pool and come back in date order, so run_analysis writes
+# the same rows it would from one shard. Every figure comes out of the same sequence
+# of float operations as a single pass (the cost basis is one running sum in ledger
+# order, a day's value sums the products in inventory order), so the tracker is
+# byte-identical for any number of workers.
+#
+# Price files not read before are opened by the shard whose days they are; workers
+# return the cache entries they filled and the price cache is saved once.
+
+def shard_bounds(first_day, last_day, workers, min_days=MIN_SHARD_DAYS):
+    """
+    Contiguous [(first day, last day), ...] ordinals splitting first_day..last_day
+    into at most `workers` shards of at least min_days each (one if the range is short).
+    """
+    n_days = last_day - first_day + 1
+    if n_days <= 0:
+        return []
+    n = max(1, min(workers, n_days // min_days))
+    edges = [first_day + n_days * i // n for i in range(n + 1)]
+    return [(edges[i], edges[i + 1] - 1) for i in range(n)]
+
+def apply_rows(rows, values, inventory, cost_basis):
+    """
+    Apply ledger rows to {(gid, pid): qty} in place and return the new cost basis:
+    BUY / PULL add their value, SELL takes its revenue off, OPEN / TRADE leave it.
+    """
+    for g_id, p_id, tx_type, qty, total_cost in zip(rows['group_id'].tolist(), rows['product_id'].tolist(),
+                                                   rows['tx_type'].tolist(), rows['quantity'].tolist(), values.tolist()):
+        holdings.apply_quantity(inventory, (str(g_id), str(p_id)), tx_type, qty)
+        if tx_type in ADDS:
+            # PULL is effectively a BUY at $0 cost
+            cost_basis += total_cost
+        elif tx_type == TxType.SELL:
+            # Basis decreases by REVENUE (Net Investment Logic)
+            cost_basis -= total_cost
+    return cost_basis
+
+def boundary_states(ledger, tx_values, start_day, days):
+    """
+    [(inventory, cost basis), ...] at the start of each day in days (ascending day
+    ordinals), i.e. after every transaction from start_day up to the day before.
+    """
+    states = []
+    inventory, cost_basis = {}, 0.0
+    pos = int(np.searchsorted(ledger['day'], start_day))
+    for day in days:
+        hi = max(pos, int(np.searchsorted(ledger['day'], day)))
+        cost_basis = apply_rows(ledger[pos:hi], tx_values[pos:hi], inventory, cost_basis)
+        pos = hi
+        states.append((dict(inventory), cost_basis))
+    return states
+
+def value_shard(task):
+    """
+    Value one shard's days from its boundary state. Returns the (days, products)
+    quantities and prices, each day's value, items owned and cost basis, and the
+    price cache entries it filled (task['cache'] set) or None.
+    """
+    first_day, last_day, products = task['first_day'], task['last_day'], task['products']
+    rows, values = task['rows'], task['values']
+    inventory, cost_basis = task['inventory'], task['cost_basis']
+    column = {key: i for i, key in enumerate(products)}
+
+    n_days = last_day - first_day + 1
+    quantities = np.zeros((n_days, len(products)))
+    row = np.zeros(len(products))
+    for key, qty in inventory.items():
+        row[column[key]] = qty
+    items_owned, costs = [], []
+    bounds = np.searchsorted(rows['day'], np.arange(first_day, last_day + 2)).tolist()
+    items = sum(inventory.values())
+    for d in range(n_days):
+        lo, hi = bounds[d], bounds[d + 1]
+        if hi > lo:
+            cost_basis = apply_rows(rows[lo:hi], values[lo:hi], inventory, cost_basis)
+            for g_id, p_id in zip(rows['group_id'][lo:hi].tolist(), rows['product_id'][lo:hi].tolist()):
+                key = (str(g_id), str(p_id))
+                # Rows of an unknown type never reach the inventory (or the columns)
+                if key in column:
+                    row[column[key]] = inventory.get(key, 0)
+            items = sum(inventory.values())
+        quantities[d] = row
+        items_owned.append(items)
+        costs.append(cost_basis)
+
+    prices = np.zeros(quantities.shape)
+    cache = task.get('cache')
+    if products:
+        before = dict(cache) if cache is not None else None
+        _, prices = load_price_history(products, first_date=_date_str(first_day), last_date=_date_str(last_day),
+                                       historical_folder=task['folder'], cache=cache)
+        prices = prices.T
+        if cache is not None:
+            cache = {key: entry for key, entry in cache.items() if before.get(key) is not entry}
+    return {
+        'quantities': quantities,
+        'prices': prices,
+        'values': portfolio_values(quantities, prices),
+        'items_owned': items_owned,
+        'cost_basis': costs,
+        'cache': cache,
+    }
+
+def _date_str(day):
+    return date.fromordinal(day).strftime('%Y-%m-%d')
+
+def value_days(ledger, tx_values, start_day, first_day, last_day, workers=1, folder='historical_prices'):
+    """
+    Value every day first_day..last_day (ordinals), splitting them into date shards
+    over up to `workers` processes. Returns (products, final inventory, merged shard
+    results): products is the column order of the matrices (inventory order), and the
+    results hold the per-day arrays of value_shard() for the whole range.
+    """
+    bounds = shard_bounds(first_day, last_day, workers)
+    states = boundary_states(ledger, tx_values, start_day, [first for first, _ in bounds] + [last_day + 1])
+    inventory = states.pop()[0]
+    products = list(inventory)
+
+    cache, held = None, None
+    if len(bounds) > 1:
+        # Workers read price files into copies of the cache entries of these products;
+        # what they read is merged back and the cache saved once, below
+        price_coverage.load_coverage(folder)
+        cache = price_coverage.load_price_cache(folder)
+        keys = [price_coverage._key(g_id, p_id) for g_id, p_id in products]
+        held = {key: cache[key] for key in keys if key in cache}
+    tasks = []
+    for (first, last), (state, cost_basis) in zip(bounds, states):
+        lo, hi = np.searchsorted(ledger['day'], [first, last + 1])
+        tasks.append({
+            'first_day': first, 'last_day': last, 'products': products, 'folder': folder,
+            'inventory': state, 'cost_basis': cost_basis,
+            'rows': ledger[lo:hi], 'values': tx_values[lo:hi],
+            'cache': dict(held) if held is not None else None,
+        })
+
+    if len(tasks) > 1:
+        print(f"Valuing {last_day - first_day + 1} day(s) in {len(tasks)} shard(s) on {min(workers, len(tasks))} worker(s)...")
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(value_shard, tasks))
+    else:
+        parts = [value_shard(task) for task in tasks]
+
+    if cache is not None:
+        if price_coverage.merge_price_cache(cache, [part['cache'] for part in parts]):
+            try:
+                price_coverage.save_price_cache(cache, folder)
+            except OSError as e:
+                print(f"  ⚠️  Warning: Could not save the price cache ({e}).")
+
+    width = len(products)
+    return products, inventory, {
+        'quantities': np.concatenate([p['quantities'] for p in parts]) if parts else np.zeros((0, width)),
+        'prices': np.concatenate([p['prices'] for p in parts]) if parts else np.zeros((0, width)),
+        'values': np.concatenate([p['values'] for p in parts]) if parts else np.zeros(0),
+        'items_owned': [n for p in parts for n in p['items_owned']],
+        'cost_basis': [c for p in parts for c in p['cost_basis']],
+    }
@@ -0,0 +1,108 @@
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform (Windows); writes are still atomic
+    fcntl = None
+
+# Lock files live next to what they protect, under .cache/locks/
+LOCK_DIR = os.path.join(".cache", "locks")
+# Held while run_analysis rewrites its outputs, so two rebuilds never interleave
+ANALYSIS_LOCK = "analysis"
+
+# Shared files
+# ------------
+# The web app and the daily job read and write the same files. Two rules keep them
+# consistent:
+#
+#   atomic writes    every writer goes through atomic_write() / write_json() /
+#                    write_csv(): the new content is written to a temporary file in
+#                    the same directory, fsynced and renamed over the old one, so a
+#                    reader opening the file sees either the old or the new version,
+#                    never a torn one. Readers of these files need no lock.
+#   advisory locks   read-modify-write cycles (saving a transaction, adding a
+#                    mapping) hold locked(path) around the read and the write, so
+#                    concurrent saves can't lose each other's edits. Tracker CSVs,
+#                    which are rewritten in place from the resume date on, are read
+#                    under a shared lock and written under an exclusive one.
+#
+# A rebuild holds locked(ANALYSIS_LOCK) for its whole run; readers never take it, so
+# pages and APIs keep serving the last complete outputs while it runs.
+#
+# Locks are flock()s on .cache/locks/<name>.lock beside the file. A thread may take
+# a lock it already holds again (the inner call is a no-op), but must not ask for an
+# exclusive lock while holding only a shared one.
+
+_held = threading.local()
+
+def lock_path(path):
+    """Lock file for a data file (or a lock name such as ANALYSIS_LOCK)."""
+    path = os.path.abspath(path)
+    return os.path.join(os.path.dirname(path), LOCK_DIR, os.path.basename(path) + ".lock")
+
+@contextmanager
+def locked(path, shared=False):
+    """Hold an advisory lock on path: shared for readers, exclusive (default) for writers."""
+    if fcntl is None:
+        yield
+        return
+
+    target = lock_path(path)
+    held = getattr(_held, 'locks', None)
+    if held is None:
+        held = _held.locks = {}
+    if target in held:
+        held[target] += 1
+        try:
+            yield
+        finally:
+            held[target] -= 1
+        return
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        held[target] = 1
+        try:
+            yield
+        finally:
+            del held[target]
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def atomic_write(path, mode='w', newline=None):
+    """
+    Open a temporary file beside path for writing; on a clean exit it is fsynced and
+    renamed over path, on an exception it is removed and path is left as it was.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_json(path, data, **dump_args):
+    with atomic_write(path) as f:
+        json.dump(data, f, **dump_args)
+
+def write_csv(frame, path, **to_csv_args):
+    """DataFrame.to_csv through atomic_write (index=False unless given)."""
+    to_csv_args.setdefault('index', False)
+    with atomic_write(path, newline='') as f:
+        frame.to_csv(f, **to_csv_args)
@@ -0,0 +1,445 @@
+import os
+import json
+import time
+import bisect
+import argparse
+import threading
+from datetime import datetime, date
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlparse, parse_qs
+from urllib.request import Request, urlopen
+from functions import load_config
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 5002
+# How often the watcher checks the input files for changes
+POLL_SECONDS = 2.0
+# Clients give up this quickly and fall back to reading the files themselves
+CLIENT_TIMEOUT_SECONDS = 0.5
+# After a failed connect, clients assume no daemon for this long instead of retrying per request
+NO_DAEMON_SECONDS = 5.0
+# A recompute runs the whole analysis, so its client waits this long for the answer
+RECOMPUTE_TIMEOUT_SECONDS = 900
+
+TRACKER_FILE = "daily_tracker.csv"
+SUMMARY_FILE = "summary.json"
+HOLDINGS_FILE = "current_holdings.csv"
+
+# Resident engine
+# ---------------
+# `python tracker_daemon.py` loads the ledger, the weekly inventory snapshots (see
+# holdings.py), the price matrix of every product in the ledger and daily_tracker.csv
+# once, then answers queries from memory over HTTP on 127.0.0.1:
+#
+#   /status                        what is loaded and when
+#   /holdings?date=YYYY-MM-DD      same rows as holdings.holdings_on (default: last tracker day)
+#   /value?date=YYYY-MM-DD         market value and items held at the end of that day
+#   /history?from=...&to=...       daily_tracker.csv rows in the range
+#   /dashboard                     everything the web app's index page shows
+#   /summary                       summary.json
+#   /stats                         portfolio_stats.json
+#   /attribution?date=YYYY-MM-DD   same as attribution.day_breakdown (default: last day)
+#   POST /recompute?resume_date=   run_analysis in this process, then reload its outputs
+#
+# The analysis outputs (summary.json, current_holdings.csv, the stats and XIRR
+# summaries, daily_attribution.csv) are held in memory like the inputs. A watcher
+# thread polls all of these files and reloads only what depends on the file that
+# changed. The new state is built off to the side and swapped in whole, so a query
+# never sees a half-reloaded engine. A recompute reuses the modules and ledger parse
+# already loaded here, and the web app's next read sees its results without waiting
+# for the next poll.
+#
+# Nothing here is required: query() returns None when no daemon is running and the
+# web app and CLIs then read the files themselves, exactly as before. A failed connect
+# is remembered for NO_DAEMON_SECONDS, so without a daemon a request costs one
+# refused connection at most every few seconds. Heavy imports (numpy, pandas and the
+# modules using them) happen in the engine functions, so the client side costs a web
+# worker nothing at startup.
+
+_state = {}
+_state_lock = threading.Lock()
+_recompute_lock = threading.Lock()
+# time.monotonic() until which clients skip the daemon (see query)
+_no_daemon_until = 0.0
+
+def daemon_url(path, **params):
+    port = load_config().get("daemon_port", DAEMON_PORT)
+    query = f"?{urlencode(params)}" if params else ""
+    return f"http://{DAEMON_HOST}:{port}{path}{query}"
+
+def _daemon_down():
+    return time.monotonic() < _no_daemon_until
+
+def _mark_daemon_down():
+    global _no_daemon_until
+    _no_daemon_until = time.monotonic() + NO_DAEMON_SECONDS
+
+def query(path, **params):
+    """GET a daemon endpoint and return its JSON, or None if the daemon isn't running or failed."""
+    if _daemon_down():
+        return None
+    try:
+        with urlopen(daemon_url(path, **{k: v for k, v in params.items() if v is not None}),
+                     timeout=CLIENT_TIMEOUT_SECONDS) as resp:
+            return json.loads(resp.read())
+    except HTTPError:
+        # The daemon answered, it just has no answer for this (404 before the first run, ...)
+        return None
+    except (URLError, OSError):
+        _mark_daemon_down()
+        return None
+    except ValueError:
+        return None
+
+def request_recompute(resume_date=None):
+    """
+    Have a running daemon run the analysis. Returns True when it did, False when no
+    daemon is running (the caller runs it itself); raises RuntimeError when the daemon
+    ran it and failed, or didn't answer in time (the run may still be going).
+    """
+    if _daemon_down():
+        return False
+    params = {'resume_date': resume_date} if resume_date else {}
+    try:
+        with urlopen(Request(daemon_url('/recompute', **params), data=b'', method='POST'),
+                     timeout=RECOMPUTE_TIMEOUT_SECONDS) as resp:
+            resp.read()
+        return True
+    except HTTPError as e:
+        try:
+            error = json.loads(e.read()).get('error', str(e))
+        except ValueError:
+            error = str(e)
+        raise RuntimeError(error)
+    except URLError:
+        # Couldn't connect, so nothing ran
+        _mark_daemon_down()
+        return False
+    except OSError as e:
+        raise RuntimeError(f"No answer from the tracker daemon ({e}); the analysis may still be running there")
+
+# --- Engine -----------------------------------------------------------------
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+def _watched_files(historical_folder='historical_prices'):
+    import attribution
+    import portfolio_stats
+    import price_coverage
+    import xirr
+    from functions import get_mappings_file, get_transactions_file
+    return {
+        'ledger': get_transactions_file(),
+        'names': get_mappings_file(),
+        'prices': os.path.join(historical_folder, price_coverage.COVERAGE_FILE),
+        'tracker': TRACKER_FILE,
+        'summary': SUMMARY_FILE,
+        'current': HOLDINGS_FILE,
+        'stats': portfolio_stats.STATS_SUMMARY_FILE,
+        'xirr': xirr.XIRR_SUMMARY_FILE,
+        'attribution': attribution.ATTRIBUTION_FILE,
+    }
+
+def _load_ledger_part(state):
+    import holdings
+    from ledger import load_ledger, product_keys
+
+    state['ledger'] = load_ledger(state['files']['ledger'])
+    state['start_day'] = datetime.strptime(load_config(reload=True)["start_date"], '%Y-%m-%d').date().toordinal()
+    state['snapshots'] = holdings.load_snapshots(state['ledger'], state['start_day'])
+    state['products'] = product_keys(state['ledger'])
+
+def _load_prices_part(state, historical_folder='historical_prices'):
+    from functions import load_price_history
+    days, prices = load_price_history(state['products'], historical_folder=historical_folder)
+    state['days'] = days
+    state['prices'] = prices
+    state['row_of'] = {key: i for i, key in enumerate(state['products'])}
+
+def _load_names_part(state):
+    import holdings
+    state['names'] = holdings.load_name_map()
+
+def _load_tracker_part(state):
+    from functions import read_tracker_since
+    rows = read_tracker_since(TRACKER_FILE, '0000-00-00') if os.path.exists(TRACKER_FILE) else []
+    state['tracker'] = rows
+    state['tracker_dates'] = [r['Date'][:10] for r in rows]
+
+def _load_summary_part(state):
+    try:
+        with open(SUMMARY_FILE, 'r') as f:
+            state['summary'] = json.load(f)
+    except (OSError, ValueError):
+        state['summary'] = None
+
+def _load_current_part(state):
+    import pandas as pd
+    if os.path.exists(HOLDINGS_FILE):
+        df = pd.read_csv(HOLDINGS_FILE)
+        state['current'] = df.to_dict('records')
+        state['current_value'] = float(df['Total Value'].sum()) if not df.empty and 'Total Value' in df.columns else 0
+    else:
+        state['current'], state['current_value'] = [], 0
+
+def _load_stats_part(state):
+    from portfolio_stats import load_stats_summary
+    state['stats'] = load_stats_summary(state['files']['stats'])
+
+def _load_xirr_part(state):
+    from xirr import load_xirr_summary
+    state['xirr'] = load_xirr_summary(state['files']['xirr'])
+
+def _load_attribution_part(state):
+    """daily_attribution.csv as {date: [rows]} in file (date) order, None before the first run."""
+    import csv
+    from shared_files import locked
+    path = state['files']['attribution']
+    if not os.path.exists(path):
+        state['attribution'] = None
+        return
+    by_date = {}
+    with locked(path, shared=True), open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            by_date.setdefault(row['Date'], []).append(row)
+    state['attribution'] = by_date
+
+PART_LOADERS = {
+    'names': _load_names_part,
+    'tracker': _load_tracker_part,
+    'summary': _load_summary_part,
+    'current': _load_current_part,
+    'stats': _load_stats_part,
+    'xirr': _load_xirr_part,
+    'attribution': _load_attribution_part,
+}
+
+def load_state(previous=None, changed=None):
+    """
+    Build the engine state. With a previous state and the set of changed parts (the
+    keys of _watched_files), only those parts are reloaded; a ledger change also
+    reloads prices, since the set of products may have changed.
+    """
+    state = dict(previous) if previous else {}
+    state['files'] = _watched_files()
+    changed = set(changed or state['files'])
+    if 'ledger' in changed:
+        changed.add('prices')
+
+    started = time.perf_counter()
+    if 'ledger' in changed:
+        _load_ledger_part(state)
+    if 'prices' in changed:
+        _load_prices_part(state)
+    for part, loader in PART_LOADERS.items():
+        if part in changed:
+            loader(state)
+
+    state['signatures'] = {part: _signature(path) for part, path in state['files'].items()}
+    state['loaded_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"Loaded {', '.join(sorted(changed))} in {time.perf_counter() - started:.2f}s "
+          f"({len(state['ledger'])} transactions, {len(state['products'])} products, "
+          f"{len(state['days'])} price days, {len(state['tracker'])} tracker rows)")
+    return state
+
+def _price_on(state, key, day):
+    """Stored market price of a product on a day ordinal, 0.0 if there is none (like get_price_for_date)."""
+    import numpy as np
+    row = state['row_of'].get(key)
+    days = state['days']
+    if row is None or not len(days) or day < days[0] or day > days[-1]:
+        return 0.0
+    price = state['prices'][row, day - days[0]]
+    return 0.0 if np.isnan(price) else float(price)
+
+def _inventory_at(state, day):
+    import holdings
+    return holdings.inventory_at(day, state['ledger'], state['start_day'], state['snapshots'])
+
+def holdings_rows(state, date_str):
+    day = datetime.strptime(date_str, '%Y-%m-%d').date().toordinal()
+    rows = []
+    for key, qty in _inventory_at(state, day).items():
+        if qty > 0:
+            price = _price_on(state, key, day)
+            rows.append({
+                'Product Name': state['names'].get(key, "Unknown"),
+                'group_id': key[0],
+                'product_id': key[1],
+                'Quantity': qty,
+                'Latest Price': price,
+                'Total Value': price * qty
+            })
+    return rows
+
+def default_date(state):
+    return state['tracker_dates'][-1] if state['tracker_dates'] else date.today().strftime('%Y-%m-%d')
+
+def day_breakdown(state, date_str=None):
+    """attribution.day_breakdown from memory, None before the first analysis run."""
+    from attribution import breakdown
+    by_date = state['attribution']
+    if by_date is None:
+        return None
+    if date_str is None:
+        date_str = next(reversed(by_date), None)
+    return breakdown(date_str, by_date.get(date_str, []), state['names'])
+
+def handle(state, path, params):
+    """Answer one request from the given state: (status, payload)."""
+    date_str = params.get('date') or default_date(state)
+    if path in ('/holdings', '/value'):
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+        except ValueError:
+            return 400, {"error": f"Invalid date '{date_str}', expected YYYY-MM-DD"}
+        rows = holdings_rows(state, date_str)
+        total_value = round(sum(r['Total Value'] for r in rows), 2)
+        if path == '/value':
+            return 200, {"date": date_str, "total_value": total_value,
+                         "items_owned": sum(r['Quantity'] for r in rows)}
+        return 200, {"date": date_str, "total_value": total_value, "holdings": rows}
+
+    if path == '/history':
+        dates = state['tracker_dates']
+        lo = bisect.bisect_left(dates, params['from']) if params.get('from') else 0
+        hi = bisect.bisect_right(dates, params['to']) if params.get('to') else len(dates)
+        return 200, {"rows": state['tracker'][lo:hi]}
+
+    if path == '/dashboard':
+        from attribution import TOP_MOVERS, breakdown
+        movers = day_breakdown(state) or breakdown(None, [])
+        movers['products'] = movers['products'][:TOP_MOVERS]
+        return 200, {"holdings": state['current'], "total_value": state['current_value'],
+                     "stats": state['stats'], "money_weighted": state['xirr'], "movers": movers}
+
+    if path == '/summary':
+        if state['summary'] is None:
+            return 404, {"error": "No summary.json yet"}
+        return 200, state['summary']
+
+    if path == '/stats':
+        if state['stats'] is None:
+            return 404, {"error": "No statistics yet. Run the analysis first."}
+        return 200, state['stats']
+
+    if path == '/attribution':
+        if params.get('date'):
+            try:
+                datetime.strptime(params['date'], '%Y-%m-%d')
+            except ValueError:
+                return 400, {"error": f"Invalid date '{params['date']}', expected YYYY-MM-DD"}
+        result = day_breakdown(state, params.get('date'))
+        if result is None:
+            return 404, {"error": "No attribution yet. Run the analysis first."}
+        return 200, result
+
+    if path == '/status':
+        return 200, {
+            "loaded_at": state['loaded_at'],
+            "transactions": int(len(state['ledger'])),
+            "products": len(state['products']),
+            "price_days": int(len(state['days'])),
+            "tracker_rows": len(state['tracker']),
+            "last_tracker_date": state['tracker_dates'][-1] if state['tracker_dates'] else None,
+        }
+    return 404, {"error": f"Unknown endpoint {path}"}
+
+def reload_changed():
+    """Reload the parts whose files changed on disk since they were loaded."""
+    global _state
+    with _state_lock:
+        state = _state
+        changed = {part for part, path in state['files'].items()
+                   if _signature(path) != state['signatures'].get(part)}
+        if not changed:
+            return
+        try:
+            _state = load_state(state, changed)
+        except Exception as e:
+            # Often a file caught mid-write; the next poll tries again
+            print(f"  ⚠️  Warning: Reload of {', '.join(sorted(changed))} failed: {e}")
+
+def watch(poll_seconds=POLL_SECONDS):
+    """Reload whatever changed on disk, forever (run in a daemon thread)."""
+    while True:
+        time.sleep(poll_seconds)
+        reload_changed()
+
+def recompute(resume_date=None):
+    """
+    Run the analysis here, where the modules and the parsed ledger are already loaded,
+    then reload what it rewrote. Runs one at a time; queries keep being answered.
+    """
+    from analyze_portfolio import run_analysis
+    with _recompute_lock:
+        started = time.perf_counter()
+        # In-process only: forking a worker pool from this threaded server risks deadlocks
+        run_analysis(resume_date=resume_date, workers=1)
+        reload_changed()
+    return {"seconds": round(time.perf_counter() - started, 2), "loaded_at": _state['loaded_at']}
+
+def serve(port=None, poll_seconds=POLL_SECONDS):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    global _state
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, payload = handle(_state, url.path, params)
+            except Exception as e:
+                status, payload = 500, {"error": str(e)}
+            self._reply(status, payload)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path != '/recompute':
+                return self._reply(404, {"error": f"Unknown endpoint {url.path}"})
+            try:
+                status, payload = 200, recompute(params.get('resume_date'))
+            except Exception as e:
+                print(f"  ⚠️  Warning: Recompute failed: {e}")
+                status, payload = 500, {"error": str(e)}
+            self._reply(status, payload)
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _state = load_state()
+    threading.Thread(target=watch, args=(poll_seconds,), daemon=True).start()
+
+    port = port or load_config().get("daemon_port", DAEMON_PORT)
+    server = ThreadingHTTPServer((DAEMON_HOST, port), Handler)
+    print(f"Tracker daemon listening on http://{DAEMON_HOST}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the ledger, prices, inventory and analysis outputs in memory and answer queries over local HTTP.")
+    parser.add_argument('--port', type=int, help=f"Port on {DAEMON_HOST} (default: data.json 'daemon_port' or {DAEMON_PORT})")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help="Seconds between file change checks (default: %(default)s)")
+    args = parser.parse_args()
+    serve(args.port, args.poll)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,15 @@
 import argparse
 import os
-import pandas as pd
-from datetime import datetime
-import update_prices
-import analyze_portfolio
+from functions import read_last_tracker_date
 
 def main():
     parser = argparse.ArgumentParser(description="Update portfolio prices and analyze value.")
     parser.add_argument('--incremental', action='store_true', help="Resume analysis from last tracked date.")
     args = parser.parse_args()
 
+    import update_prices
+    import analyze_portfolio
+
     print("--- Starting Portfolio Update ---")
 
     # 1. Sync Prices
@@ -27,10 +27,10 @@ def main():
     
     if args.incremental and os.path.exists("daily_tracker.csv"):
         try:
-            df = pd.read_csv("daily_tracker.csv")
-            if not df.empty:
+            last_date = read_last_tracker_date("daily_tracker.csv")
+            if last_date is not None:
                 # Get the last date recorded
-                last_record_date = pd.to_datetime(df.iloc[-1]['Date']).strftime('%Y-%m-%d')
+                last_record_date = last_date.strftime('%Y-%m-%d')
                 print(f"Found existing data. Resuming analysis from {last_record_date}...")
                 resume_date = last_record_date
         except Exception as e:
@@ -1,21 +1,29 @@
-import pandas as pd
-import json
 import os
-from functions import batch_update_historical_prices
+import argparse
+from functions import CONFIG_FILE, DEFAULT_CATEGORY_ID, batch_update_historical_prices, get_category_map, load_config
+from ledger import load_ledger, product_keys
 
-def main():
+def main(start_date=None, max_archives=None, time_budget=None, plan_only=False):
+    """
+    Fetch prices for every product in the ledger from start_date (defaults to the
+    config's start_date) to latest_date. Returns the last fully priced day, or None
+    if nothing could be fetched.
+
+    max_archives / time_budget (seconds) cap the downloads of one run; archives are
+    fetched newest first and the rest wait for the next run. plan_only just prints
+    the download plan.
+    """
     print("--- Starting Price Update (Batch Mode) ---")
     
     # 1. Load Configuration
-    if not os.path.exists("data.json"):
-        print("Error: data.json not found.")
+    if not os.path.exists(CONFIG_FILE):
+        print(f"Error: {CONFIG_FILE} not found.")
         return
         
-    with open("data.json") as f:
-        config = json.load(f)
+    config = load_config(reload=True)
         
     transactions_file = config.get("transactions_file", "transactions.csv")
-    start_date = config.get("start_date")
+    start_date = start_date or config.get("start_date")
     # Default to today if latest_date is far in future or not set
     latest_date = config.get("latest_date") 
     
@@ -23,38 +31,41 @@ def main():
     
     # 2. Extract Unique Products
     try:
-        df = pd.read_csv(transactions_file)
-        # Filter for valid IDs
-        df_clean = df[['group_id', 'product_id', 'Item']].dropna(subset=['group_id', 'product_id']).drop_duplicates()
+        ledger = load_ledger(transactions_file)
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return
 
-    product_list = []
-    print(f"Found {len(df_clean)} unique products to track.")
-
-    for index, row in df_clean.iterrows():
-        try:
-            g_id = int(float(row['group_id']))
-            p_id = int(float(row['product_id']))
-            product_list.append({
-                'group_id': g_id,
-                'product_id': p_id,
-                'name': row['Item']
-            })
-        except ValueError:
-            continue
+    # Each product is read from its own category in the daily archive
+    category_map = get_category_map()
+    product_list = [
+        {'group_id': int(g_id), 'product_id': int(p_id), 'category_id': category_map.get(g_id, DEFAULT_CATEGORY_ID)}
+        for g_id, p_id in product_keys(ledger)
+    ]
+    categories = sorted({p['category_id'] for p in product_list}, key=int)
+    print(f"Found {len(product_list)} unique products to track in {len(categories)} categor{'y' if len(categories) == 1 else 'ies'} ({', '.join(categories)}).")
     
     # 3. Fetch Data in Batch
+    last_priced = None
     if product_list:
         try:
-            batch_update_historical_prices(start_date, latest_date, product_list)
+            last_priced = batch_update_historical_prices(start_date, latest_date, product_list,
+                                                         max_archives=max_archives, time_budget=time_budget,
+                                                         plan_only=plan_only)
         except KeyboardInterrupt:
             print("\nStopped by user.")
         except Exception as e:
             print(f"Batch update failed: {e}")
 
     print("\n--- Update Complete ---")
+    return last_priced
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Download daily price archives for every product in the ledger.")
+    parser.add_argument("--from-date", help="First day to check (default: the config's start_date)")
+    parser.add_argument("--max-archives", type=int, help="Download at most this many archives (newest first)")
+    parser.add_argument("--time-budget", type=float, metavar="MINUTES", help="Stop starting new downloads after this many minutes")
+    parser.add_argument("--plan", action="store_true", help="Only print which archives would be downloaded and the estimated cost")
+    args = parser.parse_args()
+    main(start_date=args.from_date, max_archives=args.max_archives,
+         time_budget=args.time_budget * 60 if args.time_budget else None, plan_only=args.plan)
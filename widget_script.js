@@ -20,6 +20,10 @@ const GITHUB_REPO_URL = `https://github.com/${GITHUB_USER}/${GITHUB_REPO}`;
 
 const API_URL = MODE === "LOCAL" ? LOCAL_URL : GITHUB_URL;
 
+// Graph timeframe: "7d" (daily), "90d" (weekly) or "all" (monthly).
+// These come precomputed in summary.json, so any of them is a single small fetch.
+const TIMEFRAME = "90d";
+
 let widget = await createWidget();
 
 // Handle interaction: Open the dashboard/repo when tapped
@@ -85,12 +89,21 @@ async function createWidget() {
     let profitText = pStack.addText((data.profit >= 0 ? "+" : "") + formatMoney(data.profit));
     profitText.font = Font.boldSystemFont(18);
     profitText.textColor = profitColor;
+
+    // Return over the chosen timeframe (summary.json version 2+)
+    let periodReturn = data.returns ? data.returns[TIMEFRAME] : null;
+    if (periodReturn !== null && periodReturn !== undefined) {
+      let rText = pStack.addText(`${TIMEFRAME}: ${periodReturn >= 0 ? "+" : ""}${periodReturn.toFixed(2)}%`);
+      rText.font = Font.mediumSystemFont(11);
+      rText.textColor = periodReturn >= 0 ? new Color("#32d74b") : new Color("#ff453a");
+    }
     
     // Graph: Check if history exists
-    if (data.history && data.history.length > 1) {
+    let values = chartValues(data);
+    if (values.length > 1) {
       w.addSpacer(8);
       // Draw graph (width: 400, height: 100)
-      let chartImg = drawChart(data.history, 400, 100, profitColor);
+      let chartImg = drawChart(values, 400, 100, profitColor);
       let chartStack = w.addStack();
       chartStack.addSpacer(); // Center it
       let img = chartStack.addImage(chartImg);
@@ -127,13 +140,19 @@ function formatMoney(num) {
   return "$" + num.toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2});
 }
 
-function drawChart(history, width, height, lineColor) {
+function chartValues(data) {
+  // Prefer the precomputed rollup for TIMEFRAME; fall back to the 14-day history
+  if (data.rollups && data.rollups[TIMEFRAME]) {
+    return data.rollups[TIMEFRAME].points.map(p => parseFloat(p[1]))
+  }
+  return (data.history || []).map(h => parseFloat(h["Total Value"]))
+}
+
+function drawChart(values, width, height, lineColor) {
   let ctx = new DrawContext()
   ctx.size = new Size(width, height)
   ctx.opaque = false
   
-  // Extract values and ensure they are numbers
-  let values = history.map(h => parseFloat(h["Total Value"]))
   let min = Math.min(...values)
   let max = Math.max(...values)
   let delta = max - min
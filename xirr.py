@@ -0,0 +1,254 @@
+import os
+import json
+from datetime import datetime, timedelta
+import numpy as np
+from functions import read_last_tracker_date, read_tracker_since, read_tracker_tail, recover_tracker, write_tracker_rows
+from ledger import ADDS, TxType, price_per_unit
+from shared_files import write_json
+
+XIRR_FILE = "xirr.csv"
+XIRR_SUMMARY_FILE = "xirr.json"
+TRACKER_FILE = "daily_tracker.csv"
+
+# Trailing windows (days) of the rolling money-weighted return
+ROLLING_WINDOWS = [90, 365]
+DAYS_PER_YEAR = 365.0
+XIRR_COLUMNS = ['Date'] + [f'XIRR {w}d' for w in ROLLING_WINDOWS] + ['XIRR All']
+
+MAX_ITERATIONS = 100
+# Converged once log(1 + rate) moves less than this
+TOLERANCE = 1e-13
+# Search range for log(1 + rate): from about -100% to e^30 a year
+LOG_RATE_LIMIT = 30.0
+
+# Money-weighted returns
+# ----------------------
+# Cash flows are what the tracker's Cost Basis counts: every BUY / PULL is money in
+# (negative, at price x quantity) and every SELL is money out (positive). A series is
+# those flows on a grid of days plus the value held at its end (and, for a trailing
+# window, minus the value held at its start). XIRR is the annual rate r with
+#
+#     sum_k  flow_k * (1 + r) ** -(day_k / 365)  =  0
+#
+# solve_xirr() solves many series at once: Newton steps on log(1 + r) for every row
+# of a (series, days) matrix, falling back to bisection inside each row's bracket
+# whenever a step would leave it, and only iterating rows that haven't converged.
+#
+# xirr.csv has one row per tracker day with the trailing-window and since-start
+# XIRRs; each depends only on the ledger and tracker rows up to that day, so runs
+# only compute the re-valued days. xirr.json has the same since-start figure for
+# the portfolio and for every product as of the last tracker day.
+
+def solve_xirr(flows, years):
+    """
+    Annual rates (S,) for S cash-flow series: flows (S, K), years (K,) or (S, K) in
+    years from any common origin. NaN where the flows never change sign (no root).
+    """
+    flows = np.atleast_2d(np.asarray(flows, dtype=float))
+    years = np.broadcast_to(np.asarray(years, dtype=float), flows.shape)
+    n = len(flows)
+
+    # Keep exp(-x * t) finite for the longest series
+    span = np.maximum(years.max(axis=1) - years.min(axis=1), 1.0)
+    lo = -np.minimum(LOG_RATE_LIMIT, 600.0 / span)
+    hi = np.full(n, LOG_RATE_LIMIT)
+
+    def npv(rows, x):
+        t = years[rows] - years[rows].min(axis=1, keepdims=True)
+        with np.errstate(over='ignore', invalid='ignore'):
+            disc = np.exp(-x[:, None] * t)
+            value = flows[rows] * disc
+            return value.sum(axis=1), -(value * t).sum(axis=1)
+
+    all_rows = np.arange(n)
+    f_lo, _ = npv(all_rows, lo)
+    f_hi, _ = npv(all_rows, hi)
+    scale = np.abs(flows).sum(axis=1)
+    solvable = (np.sign(f_lo) * np.sign(f_hi) < 0) & (scale > 0)
+
+    x = np.where(solvable, 0.0, np.nan)
+    sign_lo = np.sign(f_lo)
+    active = np.flatnonzero(solvable)
+    for _ in range(MAX_ITERATIONS):
+        if not len(active):
+            break
+        xa = x[active]
+        f, df = npv(active, xa)
+        exact = np.abs(f) <= 1e-15 * scale[active]
+
+        # Keep the root bracketed: move the end whose sign matches f
+        same = np.sign(f) == sign_lo[active]
+        lo[active] = np.where(same, xa, lo[active])
+        hi[active] = np.where(same, hi[active], xa)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = xa - f / df
+        outside = ~np.isfinite(newton) | (newton <= lo[active]) | (newton >= hi[active])
+        x_new = np.where(outside, 0.5 * (lo[active] + hi[active]), newton)
+        x_new = np.where(exact, xa, x_new)
+
+        done = exact | (np.abs(x_new - xa) < TOLERANCE)
+        x[active] = x_new
+        active = active[~done]
+    return np.expm1(x)
+
+def daily_cash_flows(ledger, start_day, last_day):
+    """Investor cash flow per day for start_day..last_day: minus the cost of BUY / PULL, plus SELL proceeds."""
+    rows = ledger[(ledger['day'] >= start_day) & (ledger['day'] <= last_day)]
+    amounts = price_per_unit(rows) * rows['quantity']
+    sign = np.where(np.isin(rows['tx_type'], ADDS), -1.0, np.where(rows['tx_type'] == TxType.SELL, 1.0, 0.0))
+    flows = np.zeros(max(last_day - start_day + 1, 0))
+    np.add.at(flows, rows['day'] - start_day, sign * amounts)
+    return flows
+
+def _value_on_or_before(tracker_days, tracker_values, days):
+    """Tracker value of the last row on or before each day (0 before the first row)."""
+    idx = np.searchsorted(tracker_days, days, side='right') - 1
+    return np.where(idx >= 0, tracker_values[np.maximum(idx, 0)], 0.0)
+
+def rolling_xirr(end_days, window, flows, start_day, tracker_days, tracker_values):
+    """
+    XIRR over the `window` days ending at each end day (None = since start_day): the
+    value held at the window start goes in, the flows after it, and the value at the end
+    comes out. end_days must be tracker days.
+    """
+    end_days = np.asarray(end_days, dtype=np.int64)
+    if window is None:
+        begin = np.full(len(end_days), start_day - 1)
+        width = int(end_days.max() - start_day + 2) if len(end_days) else 1
+    else:
+        begin = end_days - window
+        width = window + 1
+
+    # Day offsets 1..width-1 after each window start; flows before start_day are zero
+    pad = width
+    padded = np.concatenate([np.zeros(pad), flows])
+    offsets = np.arange(width)
+    idx = (begin - start_day + pad)[:, None] + offsets
+    matrix = padded[np.clip(idx, 0, len(padded) - 1)]
+    matrix[idx >= len(padded)] = 0.0
+    # Past the end of each window (only differs per row since start)
+    matrix[offsets[None, :] > (end_days - begin)[:, None]] = 0.0
+
+    # The value at the start already reflects that day's flows
+    matrix[:, 0] = -_value_on_or_before(tracker_days, tracker_values, begin)
+    matrix[np.arange(len(end_days)), end_days - begin] += _value_on_or_before(tracker_days, tracker_values, end_days)
+    return solve_xirr(matrix, offsets / DAYS_PER_YEAR)
+
+def _percent(rate):
+    return '' if not np.isfinite(rate) else round(float(rate) * 100, 4)
+
+def _day(date_str):
+    return datetime.strptime(date_str[:10], '%Y-%m-%d').date().toordinal()
+
+def update_rolling(resume_date, ledger, start_day, tracker_path=TRACKER_FILE, path=XIRR_FILE):
+    """Recompute xirr.csv rows from resume_date ('YYYY-MM-DD') on, or from where the file ends if earlier."""
+    recover_tracker(path)
+    first_new = resume_date
+    last_done = read_last_tracker_date(path) if os.path.exists(path) else None
+    if last_done is None:
+        first_new = '0000-00-00'
+    else:
+        first_new = min(first_new, (last_done + timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    # Tracker rows from a full window before the first new day (and the row before that)
+    context_start = '0000-00-00'
+    if first_new != '0000-00-00':
+        context_start = datetime.fromordinal(_day(first_new) - max(ROLLING_WINDOWS)).strftime('%Y-%m-%d')
+    tracker = read_tracker_since(tracker_path, context_start, include_previous=True)
+    tracker_days = np.array([_day(r['Date']) for r in tracker], dtype=np.int64)
+    tracker_values = np.array([float(r['Total Value']) for r in tracker])
+    targets = tracker_days[np.array([r['Date'][:10] >= first_new for r in tracker], dtype=bool)]
+    if not len(targets):
+        return 0
+
+    flows = daily_cash_flows(ledger, start_day, int(targets.max()))
+    columns = [rolling_xirr(targets, w, flows, start_day, tracker_days, tracker_values) for w in ROLLING_WINDOWS]
+    columns.append(rolling_xirr(targets, None, flows, start_day, tracker_days, tracker_values))
+
+    rows = [[datetime.fromordinal(int(day)).strftime('%Y-%m-%d')] + [_percent(c[i]) for c in columns]
+            for i, day in enumerate(targets)]
+    write_tracker_rows(path, XIRR_COLUMNS, rows, first_new if first_new != '0000-00-00' else None)
+    return len(rows)
+
+def product_xirr(ledger, start_day, value_day, products, values):
+    """
+    Since-start XIRR of each product: its own flows plus its value on value_day.
+    products: list of (gid, pid); values: value held on value_day per product.
+    Returns (rates, invested, returned) arrays aligned with products.
+    """
+    rows = ledger[(ledger['day'] >= start_day) & (ledger['day'] <= value_day)]
+    row_of = {key: i for i, key in enumerate(products)}
+    series = np.array([row_of.get((str(g), str(p)), -1) for g, p in zip(rows['group_id'].tolist(), rows['product_id'].tolist())], dtype=np.int64)
+    keep = series >= 0
+    rows, series = rows[keep], series[keep]
+
+    amounts = price_per_unit(rows) * rows['quantity']
+    adds = np.isin(rows['tx_type'], ADDS)
+    sells = rows['tx_type'] == TxType.SELL
+    invested = np.bincount(series[adds], weights=amounts[adds], minlength=len(products))
+    returned = np.bincount(series[sells], weights=amounts[sells], minlength=len(products))
+
+    days, column = np.unique(np.append(rows['day'], value_day), return_inverse=True)
+    matrix = np.zeros((len(products), len(days)))
+    np.add.at(matrix, (series, column[:-1]), np.where(adds, -amounts, np.where(sells, amounts, 0.0)))
+    matrix[:, -1] += values
+    rates = solve_xirr(matrix, (days - days[0]) / DAYS_PER_YEAR)
+    return rates, invested, returned
+
+def update_summary(ledger, start_day, name_map, tracker_path=TRACKER_FILE, path=XIRR_SUMMARY_FILE, rolling_path=XIRR_FILE):
+    """Write xirr.json: since-start XIRR of the portfolio and of every product as of the last tracker day."""
+    import holdings
+    from functions import load_price_history
+    from ledger import product_keys
+    from monte_carlo import last_known_prices
+
+    last_date = read_last_tracker_date(tracker_path) if os.path.exists(tracker_path) else None
+    if last_date is None:
+        return None
+    value_day = last_date.toordinal()
+    date_str = last_date.strftime('%Y-%m-%d')
+
+    products = product_keys(ledger[(ledger['day'] >= start_day) & (ledger['day'] <= value_day)])
+    inventory = holdings.inventory_at(value_day, ledger, start_day)
+    quantities = np.array([max(inventory.get(key, 0), 0) for key in products], dtype=float)
+    _, prices = load_price_history(products, last_date=date_str)
+    prices = np.nan_to_num(last_known_prices(prices)) if prices.shape[1] else np.zeros(len(products))
+    values = quantities * prices
+
+    rates, invested, returned = product_xirr(ledger, start_day, value_day, products, values)
+
+    # Portfolio figures are the last xirr.csv row (written for the same day just before)
+    last = read_tracker_tail(rolling_path, 1) if os.path.exists(rolling_path) else []
+    last = last[0] if last and last[0]['Date'] == date_str else {}
+    def as_float(v):
+        return None if v in ('', None) else float(v)
+
+    summary = {
+        'date': date_str,
+        'portfolio_xirr': as_float(last.get('XIRR All')),
+        'rolling': {f'{w}d': as_float(last.get(f'XIRR {w}d')) for w in ROLLING_WINDOWS},
+        'products': [],
+    }
+    for k in np.argsort(-values, kind='stable'):
+        summary['products'].append({
+            'Product Name': name_map.get(products[k], "Unknown"),
+            'group_id': products[k][0],
+            'product_id': products[k][1],
+            'invested': round(float(invested[k]), 2),
+            'returned': round(float(returned[k]), 2),
+            'value': round(float(values[k]), 2),
+            'xirr': None if not np.isfinite(rates[k]) else round(float(rates[k]) * 100, 4),
+        })
+
+    write_json(path, summary, indent=2)
+    return summary
+
+def load_xirr_summary(path=XIRR_SUMMARY_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None